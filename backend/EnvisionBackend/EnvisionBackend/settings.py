@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so request timings include the rest of the middleware
+    'RetrivalAPI.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -50,6 +52,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Innermost: wraps only the view, after authentication has run
+    'RetrivalAPI.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'EnvisionBackend.urls'
@@ -94,6 +98,15 @@ else:
         }
     }
 
+# The migration history can't be replayed on an empty database (0001 and 0007
+# both create WorkflowCheckpoint), so the test database is built from the models
+DATABASES['default']['TEST'] = {'MIGRATE': False}
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # A file rather than the shared-cache in-memory database: LangGraph saves checkpoints
+    # from its own threads, and in-memory connections fail with "table is locked"
+    # instead of waiting for each other
+    DATABASES['default']['TEST']['NAME'] = BASE_DIR / 'test_db.sqlite3'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -151,4 +164,46 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=365),
-}
\ No newline at end of file
+}
+# Metrics
+# /api/metrics/ (Prometheus text format) is only served when METRICS_TOKEN is set,
+# and then only to requests sending "Authorization: Bearer <METRICS_TOKEN>".
+# With several worker processes, point METRICS_DIR at a directory they share so
+# the endpoint reports their sum; snapshots of workers that have exited are pruned.
+
+# Logging
+# LOG_LEVEL sets the app's level, LOG_LEVELS overrides it per module, e.g.
+# LOG_LEVELS="RetrivalAPI.views=DEBUG,RetrivalAPI.services.comfyUIservices=WARNING".
+# LOG_FORMAT=json writes one JSON object per line.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            '()': 'RetrivalAPI.services.logs.RedactingFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+        },
+        'json': {
+            '()': 'RetrivalAPI.services.logs.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'text',
+        },
+    },
+    'loggers': {
+        'RetrivalAPI': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+for _entry in filter(None, os.getenv('LOG_LEVELS', '').split(',')):
+    _name, _, _level = _entry.partition('=')
+    LOGGING['loggers'].setdefault(_name.strip(), {})['level'] = _level.strip().upper()
@@ -1,13 +1,43 @@
+from django import forms
 from django.contrib import admin
 from .models import User, Project, Scene, Character
+from .services.character_images import check_character_image
 from django.utils.html import format_html
+
+class CharacterAdminForm(forms.ModelForm):
+    class Meta:
+        model = Character
+        fields = ['name', 'trigger_word', 'image_file']
+
+    def clean_image_file(self):
+        image_file = self.cleaned_data.get('image_file')
+        if image_file:
+            try:
+                check_character_image(image_file.read())
+            except ValueError:
+                raise forms.ValidationError("Upload an image that can be opened (PNG, JPEG or WebP).")
+            finally:
+                image_file.seek(0)
+        return image_file
+
 # Register your models here.
 @admin.register(Character)
 class CharacterAdmin(admin.ModelAdmin):
-    list_display = ['name', 'trigger_word', 'image_preview', 'created_at']
+    form = CharacterAdminForm
+    list_display = ['name', 'trigger_word', 'thumbnail_preview', 'created_at']
     fields = ['name', 'trigger_word', 'image_file', 'image_preview']
     readonly_fields = ['image_preview']
 
+    def get_queryset(self, request):
+        # The list only shows thumbnails; the full image loads on demand in the edit form
+        return super().get_queryset(request).defer('image')
+
+    def thumbnail_preview(self, obj):
+        if obj.thumbnail:
+            return format_html('<img src="{}" style="max-width: 64px; max-height: 64px;" />', obj.thumbnail)
+        return "No image"
+    thumbnail_preview.short_description = "Image"
+
     def image_preview(self, obj):
         if obj.image:
             return format_html('<img src="{}" style="max-width: 25vw; max-height: 25vh;" />', obj.image)
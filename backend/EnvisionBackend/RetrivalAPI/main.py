@@ -1,17 +1,30 @@
 from typing import Dict, Any, List, Optional
 import os
+import re
+import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 from .services.checkpoints import checkpointer
 from .services.script_generation import generate_script
 from .services.image_prompt_generation import ImagePromptGenerator
+from .services.metrics import span, timed
+from .services.logs import Abbreviated
 from .models import WorkflowCheckpoint
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 State = Dict[str, Any]
 
+# Windowed all-scenes rewrite settings
+REWRITE_WINDOW_SIZE = 4         # scenes rewritten per LLM call
+REWRITE_WINDOW_OVERLAP = 1      # read-only neighbour scenes shown on each side
+REWRITE_WINDOW_MIN_SCENES = 8   # projects this long use windowed mode unless told otherwise
+REWRITE_MAX_WORKERS = 4
+
 # ---------- Helpers ----------
 def _read_multiline_input(prompt: str) -> str:
     """Read multi-line user input; stop on empty line."""
@@ -60,9 +73,13 @@ def node_generate_script(state: State) -> State:
     creativity = state["creativity"]
     trigger_word = state.get("trigger_word")
 
-    print("🎬 Generating script...")
+    logger.info("Generating script: %s scenes, %s creativity", num_scenes, creativity)
     try:
-        res = generate_script(concept, num_scenes, creativity, trigger_word=trigger_word)
+        res = generate_script(
+            concept, num_scenes, creativity,
+            trigger_word=trigger_word,
+            use_cache=state.get("use_llm_cache", False)
+        )
         
         state["script"] = res["script"]
         state["scenes"] = res["scene_details"]
@@ -70,21 +87,15 @@ def node_generate_script(state: State) -> State:
         state['temperature'] = res.get('temperature', 0.7)
         state["project_type"] = res.get("project_type")
 
-        print("\n✅ Script generated successfully!")
-        print(f"\n📋 Project Type: {state['project_type']}")
-        
-        print(f"\n🎭 Scenes ({len(state['scenes'])}):")
-        for s in state["scenes"]:
-            print(f"  • Scene {s['scene_number']}: {s['title']}")
-            print(f"    Story: {s['story']}")
-        
-        if state["project_type"] == "commercial":
-            print("\n🛍️ Product Details:")
-            for k, v in state["product"].items():
-                print(f"  • {k}: {v}")
-                
+        logger.info("Script generated: %s project, %d scenes", state["project_type"], len(state["scenes"]))
+        if logger.isEnabledFor(logging.DEBUG):
+            for s in state["scenes"]:
+                logger.debug("Scene %s: %s - %s", s["scene_number"], s["title"], Abbreviated(s["story"]))
+            if state["project_type"] == "commercial":
+                logger.debug("Product details: %s", Abbreviated(state["product"]))
+
     except Exception as e:
-        print(f"❌ Error generating script: {e}")
+        logger.error("Error generating script: %s", e)
         state["error"] = str(e)
         
     return state
@@ -149,7 +160,7 @@ def node_rewrite_scene(state: "State") -> "State":
     import os
     import requests
 
-    print("node_rewrite_scene called with state:", state)
+    logger.debug("node_rewrite_scene called with state: %s", Abbreviated(state))
     try:
         # Check if we're editing all scenes
         edit_all_scenes = state.get("edit_all_scenes", False)
@@ -174,7 +185,7 @@ def rewrite_single_scene(state: "State") -> "State":
     import os
     import requests
 
-    print("node_rewrite_scene called with state:", state)
+    logger.debug("rewrite_single_scene called with state: %s", Abbreviated(state))
     try:
         try:
             target = state.get("scene_to_edit")
@@ -263,7 +274,8 @@ Return ONLY the edited scene in this exact format:
                 "max_tokens": 1000,
             }
     
-            resp = requests.post(f"{api_base}/chat/completions", headers=headers, json=payload)
+            with span("llm.chat_completion"):
+                resp = requests.post(f"{api_base}/chat/completions", headers=headers, json=payload)
             resp.raise_for_status()
             content = resp.json()["choices"][0]["message"]["content"]
     
@@ -285,13 +297,19 @@ Return ONLY the edited scene in this exact format:
             scene_map[target]["story_context"] = new_content
     
             # 2. Regenerate all subsequent scenes for cohesion, using accumulated context
+            # In batch mode the whole tail is requested in one completion first;
+            # the per-scene loop below then only fills in scenes it did not return.
+            regenerated = set()
+            if state.get("batch_tail_regeneration"):
+                regenerated = _regenerate_tail_in_one_shot(state, scene_map, target, trigger_word)
+
             accumulated_context = []
             last_context = ""
             for sn in sorted(scene_map.keys()):
                 current_scene = scene_map[sn]
                 context_line = f"**Scene {current_scene['scene_number']}: \"{current_scene['title']}\"**\n{current_scene['story']}"
     
-                if sn == target:
+                if sn == target or sn in regenerated:
                     accumulated_context.append(context_line)
                 elif sn > target:
                     # Only regenerate scenes after the edited one
@@ -331,23 +349,66 @@ Return ONLY the edited scene in this exact format:
             )
             state["scene_to_edit"] = None
             state["needs_rewrite"] = False
-            print("node_rewrite_scene returning state:", state)
+            logger.debug("rewrite_single_scene returning state: %s", Abbreviated(state))
             return state
     
         except Exception as e:
             state["error"] = f"An unexpected error occurred during rewrite: {e}"
             state["scene_to_edit"] = None
             state["needs_rewrite"] = False
-            print("node_rewrite_scene returning error state:", state)
+            logger.warning("rewrite_single_scene failed: %s", state["error"])
             return state
     except Exception as e:
         state["error"] = f"An unexpected error occurred during rewrite: {e}"
         state["scene_to_edit"] = None
         state["needs_rewrite"] = False
         cleanup_checkpoints(state)  
-        print("node_rewrite_scene returning error state:", state)
+        logger.warning("rewrite_single_scene failed: %s", state["error"])
         return state
 
+def _regenerate_tail_in_one_shot(state: "State", scene_map: Dict[int, Dict[str, Any]], target: int, trigger_word: str) -> set:
+    """
+    Regenerate every scene after `target` with a single generate_script call.
+    Updates scene_map in place and returns the scene numbers that were regenerated;
+    scenes the LLM skipped are left for the per-scene fallback.
+    """
+    later = [sn for sn in sorted(scene_map.keys()) if sn > target]
+    if not later:
+        return set()
+
+    previous_context = "\n\n".join(
+        f"**Scene {scene_map[sn]['scene_number']}: \"{scene_map[sn]['title']}\"**\n{scene_map[sn]['story']}"
+        for sn in sorted(scene_map.keys()) if sn <= target
+    )
+    regen_result = generate_script(
+        state["concept"],
+        len(later),
+        state.get("creativity", "balanced"),
+        previous_context=previous_context,
+        trigger_word=trigger_word,
+        first_scene=later[0],
+        # Skipped scenes fall back to per-scene regeneration below, so don't spend a repair call on them
+        repair_missing=False
+    )
+    regen_scenes = (regen_result or {}).get("scene_details") or []
+
+    # The model occasionally renumbers the scenes (usually from 1); map them by position
+    # when it returned the right number of scenes under the wrong numbers
+    by_number = {s["scene_number"]: s for s in regen_scenes if s["scene_number"] in later}
+    if len(by_number) < len(later) and len(regen_scenes) == len(later):
+        by_number = dict(zip(later, sorted(regen_scenes, key=lambda s: s["scene_number"])))
+
+    for sn, regen_scene in by_number.items():
+        current_scene = scene_map[sn]
+        current_scene["title"] = regen_scene["title"]
+        current_scene["story"] = regen_scene["story"]
+        current_scene["script"] = regen_scene["script"]
+        current_scene["story_context"] = regen_scene["story"]
+
+    missing = [sn for sn in later if sn not in by_number]
+    logger.info("Batch tail regeneration: %d/%d scenes returned, falling back for %s", len(by_number), len(later), missing)
+    return set(by_number.keys())
+
 def rewrite_all_scenes(state: "State") -> "State":
     """New function to rewrite all scenes coherently"""
     import re
@@ -375,8 +436,10 @@ def rewrite_all_scenes(state: "State") -> "State":
             return state
         
         trigger_word = state.get("trigger_word", "")
+        # Only the windowed rewrite fills this in; never report a previous edit's list
+        state["unchanged_scenes"] = []
         
-        print(f"Rewriting all {len(scenes)} scenes with instructions: {user_notes}")
+        logger.info("Rewriting all %d scenes with instructions: %s", len(scenes), Abbreviated(user_notes))
         
         # Prepare context of all current scenes
         current_story_context = []
@@ -387,18 +450,18 @@ def rewrite_all_scenes(state: "State") -> "State":
         context = "\n\n".join(current_story_context)
 
         # System prompt for rewriting all scenes
-        system_prompt = f"""
-You are a master storyteller and expert script editor. Your job is to rewrite ALL scenes in the story to incorporate the user's edit request while maintaining narrative coherence.
-
-IMPORTANT RULES:
-1. You MUST apply the edit request to ALL scenes, not just one
-2. Always use the character name "{trigger_word}" (exactly as written) instead of placeholders
-3. Maintain story flow and coherence between scenes
-4. Make the changes OBVIOUS and VISIBLE in all scenes
-5. Each scene should clearly reflect the edit request while building upon the previous scene
-
-The edit request should transform the ENTIRE story, not just individual scenes.
-"""
+        system_prompt = _all_scenes_system_prompt(trigger_word)
+
+        # Large projects are rewritten in overlapping windows so no single
+        # completion has to hold every scene
+        use_windows = state.get("windowed_rewrite")
+        if use_windows is None:
+            use_windows = len(scenes) >= REWRITE_WINDOW_MIN_SCENES
+        if use_windows:
+            return _apply_rewritten_scenes(
+                state, scenes,
+                _rewrite_scenes_windowed(state, scenes, system_prompt, user_notes, trigger_word, api_key, api_base)
+            )
 
         # User prompt for all scenes rewrite
         user_prompt = f"""
@@ -445,23 +508,34 @@ Return all scenes in this exact format:
             "max_tokens": 3000,  # Increased for multiple scenes
         }
 
-        resp = requests.post(f"{api_base}/chat/completions", headers=headers, json=payload)
+        with span("llm.chat_completion"):
+            resp = requests.post(f"{api_base}/chat/completions", headers=headers, json=payload)
         resp.raise_for_status()
         content = resp.json()["choices"][0]["message"]["content"]
 
-        print("LLM Response for all scenes rewrite:")
-        print(content[:500] + "..." if len(content) > 500 else content)
+        logger.debug("LLM response for all scenes rewrite: %s", Abbreviated(content, 500))
 
         # Parse all scenes from the response
         scene_pattern = r'\*\*Scene\s+(\d+):\s*"?([^"\n]+?)"?\*\*\s*(.*?)(?=\*\*Scene|\Z)'
         matches = re.findall(scene_pattern, content, re.DOTALL | re.IGNORECASE)
 
+        return _apply_rewritten_scenes(state, scenes, matches)
+
+    except Exception as e:
+        state["error"] = f"Error in all scenes rewrite: {e}"
+        state["needs_rewrite"] = False
+        state["edit_all_scenes"] = False
+        return state
+
+def _apply_rewritten_scenes(state: "State", scenes: List[Dict[str, Any]], matches: List[tuple]) -> "State":
+    """Merge parsed (scene_number, title, content) tuples back into the state by scene number."""
+    try:
         if not matches:
             state["error"] = "Could not parse any rewritten scenes from LLM response."
             state["needs_rewrite"] = False
             return state
 
-        print(f"Found {len(matches)} scenes in LLM response")
+        logger.debug("Found %d scenes in LLM response", len(matches))
 
         # Update all scenes with new content
         scene_map = {s["scene_number"]: s for s in scenes}
@@ -477,9 +551,9 @@ Return all scenes in this exact format:
                 scene_map[scene_num]["story"] = new_content
                 scene_map[scene_num]["script"] = new_content
                 scene_map[scene_num]["story_context"] = new_content
-                print(f"Updated scene {scene_num}: {new_title}")
+                logger.debug("Updated scene %s: %s", scene_num, new_title)
             else:
-                print(f"Warning: Scene {scene_num} not found in original scenes")
+                logger.warning("Scene %s not found in original scenes", scene_num)
 
         # Rebuild scenes list in order
         state["scenes"] = [scene_map[sn] for sn in sorted(scene_map.keys())]
@@ -495,7 +569,7 @@ Return all scenes in this exact format:
         state["needs_rewrite"] = False
         state.pop("scene_to_edit", None)
         
-        print(f"Successfully rewrote all {len(state['scenes'])} scenes")
+        logger.info("Rewrote all %d scenes", len(state["scenes"]))
         return state
 
     except Exception as e:
@@ -504,6 +578,147 @@ Return all scenes in this exact format:
         state["edit_all_scenes"] = False
         return state
 
+def _all_scenes_system_prompt(trigger_word: str) -> str:
+    """System prompt shared by the single-call and windowed all-scenes rewrites."""
+    return f"""
+You are a master storyteller and expert script editor. Your job is to rewrite ALL scenes in the story to incorporate the user's edit request while maintaining narrative coherence.
+
+IMPORTANT RULES:
+1. You MUST apply the edit request to ALL scenes, not just one
+2. Always use the character name "{trigger_word}" (exactly as written) instead of placeholders
+3. Maintain story flow and coherence between scenes
+4. Make the changes OBVIOUS and VISIBLE in all scenes
+5. Each scene should clearly reflect the edit request while building upon the previous scene
+
+The edit request should transform the ENTIRE story, not just individual scenes.
+"""
+
+def _rewrite_window(state: "State", window: Dict[str, List[Dict[str, Any]]], total_scenes: int, system_prompt: str,
+                    user_notes: str, trigger_word: str, api_key: str, api_base: str) -> Dict[int, tuple]:
+    """
+    Rewrite one window of scenes. Neighbouring scenes are included as read-only
+    context; only the window's own target scenes are returned.
+    """
+    targets = window["targets"]
+    target_numbers = [s["scene_number"] for s in targets]
+    first, last = target_numbers[0], target_numbers[-1]
+
+    def _fmt(scenes_list):
+        return "\n\n".join(
+            f"**Scene {scene['scene_number']}: \"{scene['title']}\"**\n{scene['story']}"
+            for scene in scenes_list
+        )
+
+    before = _fmt(window["before"]) or "(start of story)"
+    after = _fmt(window["after"]) or "(end of story)"
+
+    user_prompt = f"""
+🚨 CRITICAL: Rewrite EVERY scene listed under SCENES TO REWRITE to incorporate the edit request. Do not leave any of them unchanged.
+
+STORY CONCEPT: "{state['concept']}"
+EDIT REQUEST FOR ALL SCENES: "{user_notes}"
+CHARACTER NAME: "{trigger_word}" (use this exact name, not placeholders)
+
+The story has {total_scenes} scenes. Other parts of the story are being rewritten with the same edit request in parallel.
+You are rewriting Scenes {first} to {last} only.
+
+PRECEDING SCENES (context only, do NOT return them):
+{before}
+
+SCENES TO REWRITE:
+{_fmt(targets)}
+
+FOLLOWING SCENES (context only, do NOT return them):
+{after}
+
+IMPORTANT REQUIREMENTS:
+- Use the character name "{trigger_word}" throughout all scenes
+- DO NOT use {{{{character}}}} or any placeholders
+- Keep the original scene numbers
+- Return ALL {len(targets)} scenes to rewrite, and nothing else
+
+Return the rewritten scenes in this exact format:
+**Scene {first}: "Title"**
+[Scene {first} content using character name "{trigger_word}"]
+"""
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {
+        "model": "meta-llama/Meta-Llama-3.1-8B-Instruct",
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": state.get('temperature', 1),
+        "max_tokens": min(3000, 400 * len(targets) + 200),
+    }
+
+    with span("llm.chat_completion"):
+        resp = requests.post(f"{api_base}/chat/completions", headers=headers, json=payload)
+    resp.raise_for_status()
+    content = resp.json()["choices"][0]["message"]["content"]
+
+    scene_pattern = r'\*\*Scene\s+(\d+):\s*"?([^"\n]+?)"?\*\*\s*(.*?)(?=\*\*Scene|\Z)'
+    rewritten = {}
+    for match in re.findall(scene_pattern, content, re.DOTALL | re.IGNORECASE):
+        scene_num = int(match[0])
+        if scene_num in target_numbers:
+            rewritten[scene_num] = (match[0], match[1], match[2])
+    return rewritten
+
+def _rewrite_scenes_windowed(state: "State", scenes: List[Dict[str, Any]], system_prompt: str, user_notes: str,
+                             trigger_word: str, api_key: str, api_base: str) -> List[tuple]:
+    """
+    Rewrite all scenes as overlapping windows in parallel and stitch the results
+    back together by scene number. Windows that come back incomplete are retried
+    once for just their missing scenes; anything still missing is recorded in
+    state["unchanged_scenes"] instead of being dropped silently.
+    """
+    ordered = sorted(scenes, key=lambda s: s["scene_number"])
+
+    def _windows_for(numbers):
+        windows = []
+        wanted = [i for i, s in enumerate(ordered) if s["scene_number"] in numbers]
+        for start in range(0, len(wanted), REWRITE_WINDOW_SIZE):
+            chunk = wanted[start:start + REWRITE_WINDOW_SIZE]
+            lo, hi = chunk[0], chunk[-1]
+            windows.append({
+                "before": ordered[max(0, lo - REWRITE_WINDOW_OVERLAP):lo],
+                "targets": [ordered[i] for i in chunk],
+                "after": ordered[hi + 1:hi + 1 + REWRITE_WINDOW_OVERLAP],
+            })
+        return windows
+
+    def _run(windows):
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(len(windows), REWRITE_MAX_WORKERS)) as pool:
+            futures = [
+                pool.submit(_rewrite_window, state, w, len(ordered), system_prompt, user_notes, trigger_word, api_key, api_base)
+                for w in windows
+            ]
+            for future in futures:
+                try:
+                    results.update(future.result())
+                except Exception as e:
+                    logger.warning("Window rewrite failed: %s", e)
+        return results
+
+    all_numbers = {s["scene_number"] for s in ordered}
+    windows = _windows_for(all_numbers)
+    logger.info("Rewriting %d scenes in %d windows", len(ordered), len(windows))
+    rewritten = _run(windows)
+
+    missing = all_numbers - set(rewritten)
+    if missing:
+        logger.info("Retrying scenes missing from windowed rewrite: %s", sorted(missing))
+        rewritten.update(_run(_windows_for(missing)))
+        missing = all_numbers - set(rewritten)
+
+    state["unchanged_scenes"] = sorted(missing)
+    if missing:
+        logger.warning("Scenes %s could not be rewritten", sorted(missing))
+
+    return [rewritten[sn] for sn in sorted(rewritten)]
+
 def node_generate_image_prompts(state: State) -> State:
     """Generate image prompts from the finalized scenes."""
     try:
@@ -512,7 +727,7 @@ def node_generate_image_prompts(state: State) -> State:
             state["error"] = "No scenes available for image prompt generation"
             return state
         
-        print("🎨 Generating image prompts...")
+        logger.info("Generating image prompts for %d scenes", len(scenes))
         
         # Prepare scenes data in the format expected by ImagePromptGenerator
         scenes_data = []
@@ -542,7 +757,7 @@ def node_generate_image_prompts(state: State) -> State:
         generator = ImagePromptGenerator()
         result = generator.generate_image_prompt(formatted_data)
         
-        print("DEBUG: ImagePromptGenerator result:", result)  # Add this debug log
+        logger.debug("ImagePromptGenerator result: %s", Abbreviated(result))
         
         if result.get("success", False):
             image_prompts_data = result.get("data", {})
@@ -553,46 +768,39 @@ def node_generate_image_prompts(state: State) -> State:
                 "project_title": image_prompts_data.get("project_title"),
                 "scenes": scenes_with_prompts
             }
-            print("✅ Image prompts generated successfully!")
-            
-            print(f"\n🖼️ Generated Image Prompts ({len(scenes_with_prompts)} scenes):")
-            for scene_prompt in scenes_with_prompts:
-                scene_num = scene_prompt.get("scene_number", "Unknown")
-                scene_title = scene_prompt.get("scene_title", "Untitled")
-                image_prompt = scene_prompt.get("image_prompt", "No prompt generated")
-                
-                print(f"  • Scene {scene_num}: {scene_title}")
-                print(f"    Image Prompt: {image_prompt[:100]}{'...' if len(image_prompt) > 100 else ''}")
-                
+            logger.info("Generated image prompts for %d scenes", len(scenes_with_prompts))
+            if logger.isEnabledFor(logging.DEBUG):
+                for scene_prompt in scenes_with_prompts:
+                    logger.debug(
+                        "Scene %s: %s - %s",
+                        scene_prompt.get("scene_number", "Unknown"),
+                        scene_prompt.get("scene_title", "Untitled"),
+                        Abbreviated(scene_prompt.get("image_prompt", "No prompt generated"), 100),
+                    )
+
         else:
             error_msg = result.get("error", "Unknown error in image prompt generation")
             state["error"] = f"Image prompt generation failed: {error_msg}"
-            print(f"❌ Image prompt generation failed: {error_msg}")
+            logger.error("Image prompt generation failed: %s", error_msg)
             
     except Exception as e:
         error_msg = f"Error in image prompt generation: {str(e)}"
         state["error"] = error_msg
-        print(f"❌ {error_msg}")
+        logger.error(error_msg)
         
     return state
 
 
 def node_finalize_output(state: State) -> State:
     """Finalize and present the complete output."""
-    print("\n" + "="*60)
-    print("🎉 PROJECT COMPLETED!")
-    print("="*60)
-    
-    print(f"\n📊 PROJECT SUMMARY:")
-    print(f"  • Concept: {state['concept']}")
-    print(f"  • Project Type: {state.get('project_type', 'Unknown')}")
-    print(f"  • Total Scenes: {len(state.get('scenes', []))}")
-    
     if state.get("error"):
-        print(f"\n⚠️ Errors encountered: {state['error']}")
+        logger.warning("Project finished with errors: %s", state["error"])
     else:
-        print("🎉 Script generation completed successfully!")
-    
+        logger.info(
+            "Project completed: %s project, %d scenes, concept: %s",
+            state.get("project_type", "Unknown"), len(state.get("scenes", [])), Abbreviated(state["concept"], 100),
+        )
+
     return state
 
 # ---------- Routing Functions ----------
@@ -611,12 +819,18 @@ def route_after_rewrite(state: dict) -> str:
 # ---------- Workflow Builder ----------
 def build_workflow(entry_point="generate_script"):
     g = StateGraph(State)
-    if entry_point == "generate_script":
-        g.add_node("generate_script", node_generate_script)
-    g.add_node("decide_rewrite", node_decide_rewrite)
-    g.add_node("rewrite_scene", node_rewrite_scene)
-    g.add_node("generate_image_prompts", node_generate_image_prompts)
-    g.add_node("finalize_output", node_finalize_output)
+    # Each node run is timed as a "graph.<node>" stage
+    nodes = {
+        "generate_script": node_generate_script,
+        "decide_rewrite": node_decide_rewrite,
+        "rewrite_scene": node_rewrite_scene,
+        "generate_image_prompts": node_generate_image_prompts,
+        "finalize_output": node_finalize_output,
+    }
+    if entry_point != "generate_script":
+        del nodes["generate_script"]
+    for name, node in nodes.items():
+        g.add_node(name, timed(f"graph.{name}")(node))
 
     g.set_entry_point(entry_point)
     if entry_point == "generate_script":
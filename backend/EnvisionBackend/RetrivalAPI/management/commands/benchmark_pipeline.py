@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from RetrivalAPI import views
+from RetrivalAPI.services import comfyUIservices, image_prompt_generation, reference_images, script_generation, video_generator
+from RetrivalAPI.services.fake_providers import (
+    FAKE_PROVIDER_SEED, FAKE_PROVIDERS, ProviderBehaviour, provider_environment, start_fake_providers, stop_fake_providers,
+)
+from RetrivalAPI.services.llm_cache import LRUCache, get_llm_cache, set_llm_cache
+from RetrivalAPI.services.video_encoding import ENCODING_PROFILES
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS isn't reported
+    resource = None
+
+# The endpoints one simulated user goes through, in order
+PIPELINE = ["generate_scenes", "generate_images", "generate_video"]
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """Peak resident memory of this process and of its largest finished child (ffmpeg, encoders) in MB."""
+    if resource is None:
+        return {"process": None, "children": None}
+    # ru_maxrss is in KB on Linux
+    return {
+        "process": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def provider_settings(environment: Dict[str, str]):
+    """
+    Point the already imported services at other provider endpoints
+    (the names provider_environment returns), restoring them afterwards.
+    """
+    targets = [
+        (comfyUIservices, "server_address", "COMFYUI_SERVER_ADDRESS"),
+        (script_generation, "NEBIUS_API_BASE", "NEBIUS_API_BASE"),
+        (image_prompt_generation, "NEBIUS_API_BASE", "NEBIUS_API_BASE"),
+        (video_generator, "REPLICATE_BASE_URL", "REPLICATE_BASE_URL"),
+        (views, "RUNPOD_API_BASE", "RUNPOD_API_BASE"),
+    ]
+    saved = [(module, name, getattr(module, name)) for module, name, _ in targets]
+    saved_environ = {name: os.environ.get(name) for name in environment}
+    try:
+        for module, name, variable in targets:
+            if variable in environment:
+                setattr(module, name, environment[variable])
+        # main.py reads the Nebius settings from the environment on every call
+        os.environ.update(environment)
+        yield
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+        for name, value in saved_environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def run_user(user: User, iterations: int, num_scenes: int, profile: str, samples: List[dict], lock) -> int:
+    """
+    Push one simulated user through the pipeline `iterations` times.
+
+    Returns:
+        int: Number of pipelines that completed every step
+    """
+    client = APIClient()
+    client.force_authenticate(user)
+    completed = 0
+    try:
+        for iteration in range(iterations):
+            payloads = {
+                "generate_scenes": {
+                    "prompt": f"benchmark story {user.username} run {iteration}",
+                    "num_scenes": num_scenes,
+                    "trigger_word": "benchmark",
+                    "regenerate": True,
+                },
+            }
+            for endpoint in PIPELINE:
+                body = payloads.get(endpoint) or {"project_id": project_id, "profile": profile}
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.post(reverse(endpoint), body, format="json")
+                    seconds = time.perf_counter() - started
+                ok = response.status_code == 200
+                with lock:
+                    samples.append({
+                        "endpoint": endpoint,
+                        "seconds": seconds,
+                        "queries": len(queries),
+                        "status": response.status_code,
+                        "ok": ok,
+                    })
+                if not ok:
+                    break
+                if endpoint == "generate_scenes":
+                    project_id = response.data["data"]["project_id"]
+            else:
+                completed += 1
+    finally:
+        # Worker threads hold their own connections; close them before the database goes away
+        connection.close()
+    return completed
+
+
+def run_benchmark(users: int = 4, iterations: int = 1, num_scenes: int = 3, profile: str = "draft") -> dict:
+    """
+    Run `users` concurrent simulated users against the current database and
+    provider settings and summarise latency, throughput, memory and queries.
+    """
+    accounts = [
+        User.objects.get_or_create(username=f"benchmark-user-{i}")[0] for i in range(users)
+    ]
+    samples = []
+    lock = threading.Lock()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        futures = [
+            pool.submit(run_user, account, iterations, num_scenes, profile, samples, lock) for account in accounts
+        ]
+        completed = sum(future.result() for future in futures)
+    duration = time.perf_counter() - started
+
+    endpoints = {}
+    for endpoint in PIPELINE:
+        rows = [s for s in samples if s["endpoint"] == endpoint]
+        latencies = [s["seconds"] for s in rows if s["ok"]]
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "errors": sum(1 for s in rows if not s["ok"]),
+            **{f"p{p}_seconds": percentile(latencies, p) for p in PERCENTILES},
+            "mean_seconds": sum(latencies) / len(latencies) if latencies else None,
+            "max_seconds": max(latencies) if latencies else None,
+            "queries_total": sum(s["queries"] for s in rows),
+            "queries_per_request": sum(s["queries"] for s in rows) / len(rows) if rows else None,
+        }
+
+    return {
+        "users": users,
+        "iterations": iterations,
+        "num_scenes": num_scenes,
+        "profile": profile,
+        "duration_seconds": duration,
+        "pipelines_started": users * iterations,
+        "pipelines_completed": completed,
+        "throughput": {
+            "pipelines_per_minute": completed * 60 / duration if duration else None,
+            "requests_per_second": len(samples) / duration if duration else None,
+        },
+        "endpoints": endpoints,
+        "queries_total": sum(s["queries"] for s in samples),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Push N concurrent simulated users through generate-scenes -> generate-images -> generate-video "
+        "against the fake providers and a throwaway database, and write the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=4, help="Concurrent simulated users")
+        parser.add_argument("--iterations", type=int, default=1, help="Pipelines each user runs back to back")
+        parser.add_argument("--scenes", type=int, default=3, help="Scenes per project (1-7)")
+        parser.add_argument("--profile", default="draft", choices=list(ENCODING_PROFILES))
+        parser.add_argument("--output", help="Results file (default: benchmark-<timestamp>.json)")
+        parser.add_argument("--seed", default=FAKE_PROVIDER_SEED, help="Seed for the fake providers")
+        parser.add_argument("--external-providers", action="store_true",
+                            help="Use the providers the environment points at instead of starting fake ones")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["iterations"] < 1:
+            raise CommandError("--users and --iterations must be at least 1")
+        if not 1 <= options["scenes"] <= 7:
+            raise CommandError("--scenes must be between 1 and 7")
+
+        work_dir = tempfile.mkdtemp(prefix="envision-benchmark-")
+        servers = {}
+        previous_llm_cache = get_llm_cache()
+        old_name = connection.settings_dict["NAME"]
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite":
+            # A file rather than the shared in-memory database, so concurrent writers wait instead of failing
+            test_settings["NAME"] = os.path.join(work_dir, "benchmark.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            environment = {}
+            if not options["external_providers"]:
+                servers = start_fake_providers(port=0, behaviours={
+                    provider: ProviderBehaviour.from_env(provider, seed=options["seed"]) for provider in FAKE_PROVIDERS
+                })
+                environment = provider_environment(servers)
+            # Fresh in-memory caches: cached LLM replies and reference images would skip the work being measured
+            set_llm_cache(LRUCache())
+            reference_images.set_reference_cache(LRUCache())
+
+            with override_settings(MEDIA_ROOT=os.path.join(work_dir, "media")), provider_settings(environment):
+                results = run_benchmark(options["users"], options["iterations"], options["scenes"], options["profile"])
+        finally:
+            set_llm_cache(previous_llm_cache)
+            reference_images.set_reference_cache(None)
+            stop_fake_providers(servers)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        results["commit"] = git_revision()
+        results["finished_at"] = datetime.now(timezone.utc).isoformat()
+        results["providers"] = "external" if options["external_providers"] else {
+            provider: {"latency": server.behaviour.latency, "failure_rate": server.behaviour.failure_rate,
+                       "payload": server.behaviour.payload}
+            for provider, server in servers.items()
+        }
+
+        output = options["output"] or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write(self.format_summary(results))
+        self.stdout.write(f"Results written to {output}")
+
+    def format_summary(self, results: dict) -> str:
+        def ms(value):
+            return f"{value * 1000:8.0f}" if value is not None else "       -"
+
+        lines = [
+            f"{results['users']} users x {results['iterations']} pipelines, {results['num_scenes']} scenes, "
+            f"{results['duration_seconds']:.1f}s",
+            f"{'endpoint':<16}{'reqs':>6}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}",
+        ]
+        for endpoint, stats in results["endpoints"].items():
+            lines.append(
+                f"{endpoint:<16}{stats['requests']:>6}{stats['errors']:>8}{ms(stats['p50_seconds'])} "
+                f"{ms(stats['p95_seconds'])} {ms(stats['p99_seconds'])}{stats['queries_total']:>9}"
+            )
+        throughput = results["throughput"]
+        rss = results["peak_rss_mb"]
+        lines.append(
+            f"completed {results['pipelines_completed']}/{results['pipelines_started']} pipelines, "
+            f"{throughput['pipelines_per_minute'] or 0:.2f}/min, {throughput['requests_per_second'] or 0:.2f} req/s"
+        )
+        lines.append(f"peak RSS {rss['process']} MB (largest child {rss['children']} MB), "
+                     f"{results['queries_total']} queries")
+        return "\n".join(lines)
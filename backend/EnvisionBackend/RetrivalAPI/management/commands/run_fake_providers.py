@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from RetrivalAPI.services.fake_providers import (
+    FAKE_PROVIDER_HOST, FAKE_PROVIDER_PORT, FAKE_PROVIDER_SEED, FAKE_PROVIDERS,
+    ProviderBehaviour, parse_range, provider_environment, start_fake_providers, stop_fake_providers,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve fake Nebius, ComfyUI, Replicate and RunPod APIs for offline load testing. "
+        "Latency, failure rate and payload size come from FAKE_<PROVIDER>_LATENCY / _FAILURE_RATE / "
+        "_PAYLOAD, or the options below (which apply to every provider)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default=FAKE_PROVIDER_HOST)
+        parser.add_argument("--port", type=int, default=FAKE_PROVIDER_PORT,
+                            help=f"First port; providers use consecutive ports in the order {', '.join(FAKE_PROVIDERS)}")
+        parser.add_argument("--latency", help='Seconds per job for every provider, "x" or "min-max"')
+        parser.add_argument("--failure-rate", type=float, help="Fraction of jobs that fail, 0..1")
+        parser.add_argument("--seed", default=FAKE_PROVIDER_SEED, help="Seed for reproducible latencies and failures")
+
+    def handle(self, *args, **options):
+        try:
+            behaviours = {}
+            for provider in FAKE_PROVIDERS:
+                behaviour = ProviderBehaviour.from_env(provider, seed=options["seed"])
+                if options["latency"]:
+                    behaviour.latency = parse_range(options["latency"])
+                if options["failure_rate"] is not None:
+                    if not 0 <= options["failure_rate"] <= 1:
+                        raise ValueError("--failure-rate must be between 0 and 1")
+                    behaviour.failure_rate = options["failure_rate"]
+                behaviours[provider] = behaviour
+            servers = start_fake_providers(options["host"], options["port"], behaviours,
+                                           verbose=options["verbosity"] > 1)
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+
+        for provider, server in servers.items():
+            behaviour = server.behaviour
+            self.stdout.write(
+                f"{provider:<10} {server.url}  latency={behaviour.latency[0]:g}-{behaviour.latency[1]:g}s "
+                f"failure_rate={behaviour.failure_rate:g} payload={behaviour.payload[0]:g}-{behaviour.payload[1]:g}"
+            )
+        self.stdout.write("\nPoint the backend at them with:")
+        for name, value in provider_environment(servers).items():
+            self.stdout.write(f"export {name}={value}")
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping fake providers")
+        finally:
+            stop_fake_providers(servers)
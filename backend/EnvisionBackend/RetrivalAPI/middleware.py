@@ -0,0 +1,140 @@
+import hmac
+import time
+import logging
+
+from django.db import connection
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .services import profiling
+from .services.metrics import (
+    DB_QUERY_SECONDS, REQUEST_SECONDS, finish_request_spans, server_timing, start_request_spans,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Times every request and its SQL statements, and sends the request's
+    stage timings back in a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request_spans()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self.time_query):
+                response = self.get_response(request)
+        finally:
+            spans = finish_request_spans(token)
+
+        match = request.resolver_match
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            view=match.url_name if match and match.url_name else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+        if spans:
+            response["Server-Timing"] = server_timing(spans)
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            operation = sql.split(None, 1)[0].lower() if sql else "unknown"
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests on demand and stores the result under
+    PROFILING_DIR keyed by request id (returned in X-Profile-Id).
+
+    A request is profiled when its view is in PROFILING_VIEWS (or that is
+    empty) and either it sends X-Profile: <PROFILING_TOKEN> or it is
+    authenticated as one of PROFILING_USER_IDS. X-Profile-Mode picks
+    cprofile, sample or both for that request. Other requests only pay
+    for the checks.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.jwt = JWTAuthentication()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not (profiling.PROFILING_TOKEN or profiling.PROFILING_USER_IDS):
+            return None
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if profiling.PROFILING_VIEWS and url_name not in profiling.PROFILING_VIEWS:
+            return None
+        user_id = self.user_id(request)
+        if not (self.has_token(request) or (user_id and user_id in profiling.PROFILING_USER_IDS)):
+            return None
+
+        mode = request.headers.get("X-Profile-Mode", profiling.PROFILING_MODE).lower()
+        if mode not in profiling.PROFILING_MODES:
+            mode = profiling.PROFILING_MODE
+        if not profiling.try_acquire():
+            logger.info("Skipping profile of %s: another request is being profiled", request.path)
+            return None
+
+        request_id = profiling.request_id_for(request.headers.get("X-Request-ID"))
+        profiler = profiling.RequestProfiler(request_id, mode)
+        try:
+            profiler.start()
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+                # DRF responses render lazily; include that in the profile
+                if hasattr(response, "render") and callable(response.render):
+                    response = response.render()
+            finally:
+                profiler.stop()
+        finally:
+            profiling.release()
+
+        try:
+            paths = profiler.save({
+                "view": url_name,
+                "method": request.method,
+                "path": request.path,
+                "user_id": user_id,
+                "status": response.status_code,
+            })
+        except OSError as e:
+            logger.warning("Could not save profile %s: %s", request_id, e)
+            return response
+        logger.info("Profiled %s %s in %.2fs: %s", request.method, request.path, profiler.elapsed, paths)
+        response["X-Profile-Id"] = request_id
+        return response
+
+    @staticmethod
+    def has_token(request) -> bool:
+        token = request.headers.get("X-Profile")
+        return bool(profiling.PROFILING_TOKEN and token and hmac.compare_digest(token, profiling.PROFILING_TOKEN))
+
+    def user_id(self, request):
+        """Id of the requesting user from the session or the JWT, without a database query for the latter."""
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return str(user.pk)
+        header = self.jwt.get_header(request)
+        try:
+            raw_token = self.jwt.get_raw_token(header) if header else None
+            if raw_token is None:
+                return None
+            return str(self.jwt.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM])
+        except (AuthenticationFailed, InvalidToken, TokenError, KeyError):
+            return None
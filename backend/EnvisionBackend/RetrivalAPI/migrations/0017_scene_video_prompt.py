@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0016_remove_scene_sec_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scene',
+            name='video_prompt',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='scene',
+            name='video_prompt_source',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0017_scene_video_prompt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='video_file',
+            field=models.FileField(blank=True, null=True, upload_to='videos/'),
+        ),
+    ]
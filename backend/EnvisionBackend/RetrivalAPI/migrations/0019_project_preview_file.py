@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0018_project_video_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='preview_file',
+            field=models.FileField(blank=True, null=True, upload_to='previews/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0019_project_preview_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='poster',
+            field=models.FileField(blank=True, null=True, upload_to='posters/'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='thumbnail_strip',
+            field=models.FileField(blank=True, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='scene',
+            name='poster',
+            field=models.FileField(blank=True, null=True, upload_to='posters/scenes/'),
+        ),
+        migrations.AddField(
+            model_name='scene',
+            name='thumbnail_strip',
+            field=models.FileField(blank=True, null=True, upload_to='thumbnails/scenes/'),
+        ),
+    ]
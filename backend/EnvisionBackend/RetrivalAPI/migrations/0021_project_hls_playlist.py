@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0020_video_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='hls_playlist',
+            field=models.FileField(blank=True, null=True, upload_to='hls/'),
+        ),
+    ]
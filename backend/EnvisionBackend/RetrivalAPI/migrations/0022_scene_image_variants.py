@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0021_project_hls_playlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scene',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
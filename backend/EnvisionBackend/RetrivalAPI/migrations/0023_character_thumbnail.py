@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0022_scene_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='character',
+            name='thumbnail',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:48
+
+import io
+import base64
+import binascii
+
+from django.db import migrations
+from PIL import Image, ImageOps
+
+# Frozen copy of services.character_images at the time of this migration, so
+# later changes to the live thumbnail code can't change what it does
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 75
+
+
+def make_thumbnail(data_uri):
+    """WebP thumbnail data URI for a stored base64 image, or None if it can't be decoded."""
+    payload = data_uri.split(",", 1)[1] if data_uri.startswith("data:") else data_uri
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(payload)))
+        image.load()
+    except (binascii.Error, ValueError, OSError):
+        return None
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=THUMBNAIL_QUALITY)
+    return f"data:image/webp;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+
+def backfill_thumbnails(apps, schema_editor):
+    Character = apps.get_model('RetrivalAPI', 'Character')
+    # One full image in memory at a time
+    for character in Character.objects.filter(thumbnail='').exclude(image='').iterator(chunk_size=20):
+        thumbnail = make_thumbnail(character.image)
+        if thumbnail is None:
+            continue
+        character.thumbnail = thumbnail
+        character.save(update_fields=['thumbnail'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RetrivalAPI', '0023_character_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_thumbnails, migrations.RunPython.noop),
+    ]
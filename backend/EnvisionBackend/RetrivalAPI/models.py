@@ -4,7 +4,9 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 from django.db import models
-import base64
+from .services.character_images import (
+    make_character_thumbnail, normalize_character_image, thumbnail_from_data_uri, to_data_uri
+)
 class WorkflowCheckpoint(models.Model):
     thread_id = models.TextField()
     version = models.IntegerField(default=1)
@@ -18,19 +20,42 @@ class Character(models.Model):
     name = models.CharField(max_length=100)
     trigger_word = models.CharField(max_length=50, unique=True)
     image = models.TextField(blank=True)  # Stores base64
+    thumbnail = models.TextField(blank=True)  # Small WebP data URI for pickers and admin lists
     image_file = models.ImageField(upload_to='temp/', blank=True, null=True)  # For admin upload
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so save() can tell when it changes
+        instance._saved_image = instance.__dict__.get('image')
+        return instance
+
     def save(self, *args, **kwargs):
-        # Convert uploaded image to base64
+        # Normalize the uploaded image (real type, capped size) and store it as base64.
+        # Uploads are validated by the admin form; an undecodable one raises ValueError here
         if self.image_file:
             with self.image_file.open('rb') as f:
-                encoded = base64.b64encode(f.read()).decode('utf-8')
-                self.image = f"data:image/jpeg;base64,{encoded}"
+                mime_type, data = normalize_character_image(f.read())
+            self.image = to_data_uri(mime_type, data)
+            self.thumbnail = make_character_thumbnail(data)
             # Clear the file field after conversion
             self.image_file = None
+        elif 'image' not in self.get_deferred_fields():
+            image_changed = not self._state.adding and self.image != getattr(self, '_saved_image', None)
+            if image_changed or (self.image and not self.thumbnail):
+                try:
+                    self.thumbnail = thumbnail_from_data_uri(self.image) if self.image else ''
+                except ValueError:
+                    # Better no thumbnail than one of the previous image
+                    self.thumbnail = ''
+                update_fields = kwargs.get('update_fields')
+                if update_fields is not None and 'thumbnail' not in update_fields:
+                    kwargs['update_fields'] = [*update_fields, 'thumbnail']
         super().save(*args, **kwargs)
+        if 'image' not in self.get_deferred_fields():
+            self._saved_image = self.image
 
     def __str__(self):
         return self.name
@@ -61,7 +86,18 @@ class Project(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    video = models.TextField(blank=True)  # Stores base64
+    video = models.TextField(blank=True)  # Legacy base64 video, superseded by video_file
+    video_file = models.FileField(upload_to='videos/', blank=True, null=True)  # Final stitched mp4 in the media store
+    preview_file = models.FileField(upload_to='previews/', blank=True, null=True)  # Low-res slideshow of the scene images
+    poster = models.FileField(upload_to='posters/', blank=True, null=True)  # Frame of the final video
+    thumbnail_strip = models.FileField(upload_to='thumbnails/', blank=True, null=True)  # Row of frames from the final video
+    hls_playlist = models.FileField(upload_to='hls/', blank=True, null=True)  # index.m3u8 of the segmented final video
+
+    class Meta:
+        indexes = [
+            # listProjects: a user's projects, newest first, paged by (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='project_user_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -75,7 +111,12 @@ class Scene(models.Model):
     story_context = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     image_prompt = models.TextField(blank=True)
+    video_prompt = models.TextField(blank=True)  # Derived from image_prompt, reused for every render
+    video_prompt_source = models.CharField(max_length=64, blank=True)  # sha256 of the image_prompt it came from
     image = models.TextField(blank=True)  # Stores base64
+    image_variants = models.JSONField(default=dict, blank=True)  # Variant name -> media path of resized WebP/JPEG copies
+    poster = models.FileField(upload_to='posters/scenes/', blank=True, null=True)  # Frame of the scene's clip
+    thumbnail_strip = models.FileField(upload_to='thumbnails/scenes/', blank=True, null=True)  # Row of frames from the clip
     # sec_image = models.TextField(blank=True)  # Stores base64 -->temporary
     
     class Meta:
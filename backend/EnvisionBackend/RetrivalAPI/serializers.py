@@ -1,29 +1,131 @@
 from rest_framework import serializers
+from django.core.files.storage import default_storage
 from .models import Project, Scene, Character
+from .services.character_images import check_character_image
+from .services.media import decode_data_uri
 import base64
 
-class SceneSerializer(serializers.ModelSerializer):
+# Base64/JSON media columns that are only read from the database when a client asks for them
+PROJECT_MEDIA_COLUMNS = ['video']
+SCENE_MEDIA_COLUMNS = ['image', 'image_variants']
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer with sparse fieldsets.
+
+    Meta.optional_fields lists heavy fields that are left out unless asked for.
+    Extra keyword arguments:
+        fields: Only output these fields
+        include: Also output these optional fields
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        include = kwargs.pop('include', None)
+        super().__init__(*args, **kwargs)
+
+        selected = self.selected_fields(fields, include)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, fields=None, include=None):
+        """Names of the fields an instance created with fields/include will output."""
+        optional = set(getattr(cls.Meta, 'optional_fields', []))
+        available = list(cls.Meta.fields)
+        selected = set(fields) & set(available) if fields else set(available) - optional
+        return selected | (set(include or []) & optional)
+
+    @classmethod
+    def deferred_columns(cls, fields=None, include=None, media_columns=()):
+        """Media columns the serializer won't output, for queryset.defer()."""
+        selected = cls.selected_fields(fields, include)
+        return [column for column in media_columns if column not in selected]
+
+
+def storage_url(request, path):
+    """URL of a file in the media store, absolute when there is a request to build it from."""
+    url = default_storage.url(path)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def scene_image(request, scene, variant=None):
+    """
+    The scene image for a response: the original data URI, or the URL of the
+    requested variant. Scenes generated before variants existed fall back to
+    the original.
+    """
+    path = (scene.image_variants or {}).get(variant) if variant else None
+    return storage_url(request, path) if path else scene.image
+
+
+class SceneSerializer(DynamicFieldsModelSerializer):
     project_title = serializers.CharField(source='project.title', read_only=True)
+    # The original data URI, or the URL of context['image_variant'] when the scene has one
+    image = serializers.SerializerMethodField()
+    # Variant name -> URL of the resized copy (stored as media store paths)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Scene
-        fields = ['id', 'scene_number', 'script', 'story_context', 'created_at', 'project_title', 'title']
+        fields = ['id', 'scene_number', 'script', 'story_context', 'created_at', 'project_title', 'title',
+                  'poster', 'thumbnail_strip',
+                  'image_prompt', 'video_prompt', 'image', 'image_variants']
+        optional_fields = ['image_prompt', 'video_prompt', 'image', 'image_variants']
+
+    def get_image(self, scene):
+        return scene_image(self.context.get('request'), scene, self.context.get('image_variant'))
+
+    def get_image_variants(self, scene):
+        request = self.context.get('request')
+        return {name: storage_url(request, path) for name, path in (scene.image_variants or {}).items()}
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsModelSerializer):
     scenes = SceneSerializer(many=True, read_only=True)
-    
+
     class Meta:
         model = Project
-        fields = ['title', 'concept', 'num_scenes', 'creativity_level', 
-                'created_at', 'updated_at', 'scenes']
+        fields = ['title', 'concept', 'num_scenes', 'creativity_level',
+                'created_at', 'updated_at', 'poster', 'thumbnail_strip', 'scenes',
+                'id', 'project_type', 'trigger_word', 'video_file', 'preview_file', 'hls_playlist']
+        optional_fields = ['id', 'project_type', 'trigger_word', 'video_file', 'preview_file', 'hls_playlist']
+
+    def __init__(self, *args, **kwargs):
+        """Also takes scene_fields / scene_include, passed on to the nested SceneSerializer."""
+        scene_fields = kwargs.pop('scene_fields', None)
+        scene_include = kwargs.pop('scene_include', None)
+        super().__init__(*args, **kwargs)
+        if 'scenes' in self.fields and (scene_fields or scene_include):
+            self.fields['scenes'] = SceneSerializer(
+                many=True, read_only=True, fields=scene_fields, include=scene_include
+            )
 
 class ProjectCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = ['title', 'concept', 'num_scenes', 'creativity_level']
-        
+
 class CharacterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Character
-        fields = ['name', 'trigger_word', 'image']
\ No newline at end of file
+        fields = ['name', 'trigger_word', 'image']
+
+    def validate_image(self, value):
+        if value:
+            try:
+                check_character_image(decode_data_uri(value)[1])
+            except ValueError:
+                raise serializers.ValidationError("Not a readable base64 image.")
+        return value
+
+class CharacterThumbnailSerializer(serializers.ModelSerializer):
+    """Character picker entry: the thumbnail instead of the full reference image."""
+    # Deprecated: clients that still read "image" get the thumbnail; remove in the next release
+    image = serializers.CharField(source='thumbnail', read_only=True)
+
+    class Meta:
+        model = Character
+        fields = ['name', 'trigger_word', 'thumbnail', 'image']
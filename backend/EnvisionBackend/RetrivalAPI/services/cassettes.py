@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Record/replay of provider traffic (Nebius, ComfyUI, Replicate):
+#   off     calls go to the provider as usual
+#   record  calls go to the provider and each successful response is saved
+#   replay  responses come from disk, after the recorded duration; nothing touches the network
+PROVIDER_CASSETTE_MODE = os.getenv('PROVIDER_CASSETTE_MODE', 'off').lower()
+PROVIDER_CASSETTE_DIR = os.getenv(
+    'PROVIDER_CASSETTE_DIR', os.path.join(tempfile.gettempdir(), 'envision-cassettes')
+)
+# Multiplies the recorded durations on replay; 0 replays instantly
+PROVIDER_CASSETTE_TIME_SCALE = float(os.getenv('PROVIDER_CASSETTE_TIME_SCALE', 1.0))
+# "exact" replays only identical requests; "any" falls back to another recording of
+# the same kind of call, so load tests with fresh prompts still get real payloads
+PROVIDER_CASSETTE_MATCH = os.getenv('PROVIDER_CASSETTE_MATCH', 'exact').lower()
+
+CASSETTE_MODES = ("off", "record", "replay")
+# How a response is stored: inline text, a binary file, or a file the caller owns a copy of
+RESPONSE_KINDS = ("text", "bytes", "file")
+
+
+class CassetteMissError(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+def cassette_key(request: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _directory(provider: str, group: str) -> str:
+    return os.path.join(PROVIDER_CASSETTE_DIR, provider, group)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_recording(provider: str, group: str, request: Dict[str, Any], kind: str, response: Any,
+                   elapsed: float) -> str:
+    """
+    Store one request/response pair.
+
+    Returns:
+        str: Path of the recording's metadata file
+    """
+    directory = _directory(provider, group)
+    os.makedirs(directory, exist_ok=True)
+    key = cassette_key(request)
+    entry = {
+        "provider": provider,
+        "request": request,
+        "kind": kind,
+        "elapsed_seconds": elapsed,
+        "recorded_at": time.time(),
+    }
+    if kind == "text":
+        entry["body"] = response
+    else:
+        entry["body_file"] = f"{key}.bin"
+        body_path = os.path.join(directory, entry["body_file"])
+        if kind == "file":
+            tmp_path = body_path + ".tmp"
+            shutil.copyfile(response, tmp_path)
+            os.replace(tmp_path, body_path)
+        else:
+            _write_atomic(body_path, response)
+
+    path = os.path.join(directory, f"{key}.json")
+    _write_atomic(path, json.dumps(entry).encode('utf-8'))
+    return path
+
+
+def find_recording(provider: str, group: str, request: Dict[str, Any]) -> Optional[str]:
+    """Path of the recording for a request, falling back per PROVIDER_CASSETTE_MATCH; None if there is none."""
+    directory = _directory(provider, group)
+    key = cassette_key(request)
+    path = os.path.join(directory, f"{key}.json")
+    if os.path.exists(path) or PROVIDER_CASSETTE_MATCH != "any":
+        return path if os.path.exists(path) else None
+    try:
+        candidates = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    except OSError:
+        return None
+    if not candidates:
+        return None
+    # Same request, same substitute: keeps replays deterministic
+    return os.path.join(directory, candidates[int(key, 16) % len(candidates)])
+
+
+def load_recording(path: str, suffix: str = "") -> Any:
+    """
+    Read back a recorded response after its recorded duration (times PROVIDER_CASSETTE_TIME_SCALE).
+    "file" responses are copied to a new temporary file the caller removes.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entry = json.load(f)
+    if PROVIDER_CASSETTE_TIME_SCALE > 0:
+        time.sleep(entry.get("elapsed_seconds", 0) * PROVIDER_CASSETTE_TIME_SCALE)
+
+    if entry["kind"] == "text":
+        return entry["body"]
+    body_path = os.path.join(os.path.dirname(path), entry["body_file"])
+    if entry["kind"] == "bytes":
+        with open(body_path, 'rb') as f:
+            return f.read()
+    fd, copy_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    shutil.copyfile(body_path, copy_path)
+    return copy_path
+
+
+def recorded(provider: str, request: Dict[str, Any], call: Callable[[], Any], kind: str = "text",
+             group: str = "default", suffix: str = "") -> Any:
+    """
+    Run a provider call through the cassette layer.
+
+    Args:
+        provider: Provider name, the top-level cassette directory
+        request: JSON-serializable description of everything that determines the response
+            (no credentials; hash large inputs rather than embedding them)
+        call: Makes the real request and returns the response
+        kind: "text" (str), "bytes", or "file" (path of a file the caller removes)
+        group: Kind of call within the provider, used by PROVIDER_CASSETTE_MATCH=any
+        suffix: Extension for files handed out on replay
+
+    Raises:
+        CassetteMissError: In replay mode, if no recording matches
+        ValueError: If PROVIDER_CASSETTE_MODE or kind is invalid
+    """
+    if PROVIDER_CASSETTE_MODE not in CASSETTE_MODES:
+        raise ValueError(f"PROVIDER_CASSETTE_MODE must be one of: {', '.join(CASSETTE_MODES)}")
+    if kind not in RESPONSE_KINDS:
+        raise ValueError(f"Unknown cassette response kind '{kind}'")
+
+    if PROVIDER_CASSETTE_MODE == "off":
+        return call()
+
+    if PROVIDER_CASSETTE_MODE == "replay":
+        path = find_recording(provider, group, request)
+        if path is None:
+            raise CassetteMissError(
+                f"No {provider} recording for request {cassette_key(request)[:12]} in {PROVIDER_CASSETTE_DIR}"
+            )
+        return load_recording(path, suffix)
+
+    started = time.perf_counter()
+    response = call()
+    elapsed = time.perf_counter() - started
+    # Failed calls come back empty (or raise) and are never recorded
+    if response:
+        try:
+            save_recording(provider, group, request, kind, response, elapsed)
+        except OSError as e:
+            logger.warning("Could not record %s response: %s", provider, e)
+    return response
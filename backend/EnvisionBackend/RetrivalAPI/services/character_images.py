@@ -0,0 +1,94 @@
+import io
+import os
+import base64
+from typing import Tuple
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+from .media import decode_data_uri
+
+# Load environment variables
+load_dotenv()
+
+# Uploaded character references are capped to this longest side
+CHARACTER_IMAGE_MAX_SIDE = int(os.getenv('CHARACTER_IMAGE_MAX_SIDE', 1536))
+CHARACTER_IMAGE_QUALITY = int(os.getenv('CHARACTER_IMAGE_QUALITY', 88))
+# Thumbnails for the character picker and admin list
+CHARACTER_THUMBNAIL_SIZE = int(os.getenv('CHARACTER_THUMBNAIL_SIZE', 256))
+CHARACTER_THUMBNAIL_QUALITY = 75
+
+
+def _open_image(image_data: bytes) -> Image.Image:
+    """Decode an image and apply its EXIF orientation (phone photos are often stored rotated)."""
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.load()
+    except OSError as e:
+        raise ValueError(f"Could not decode character image: {str(e)}")
+    return ImageOps.exif_transpose(image)
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def to_data_uri(mime_type: str, data: bytes) -> str:
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def check_character_image(image_data: bytes) -> None:
+    """
+    Check an upload before it's saved, so forms and serializers can reject it.
+
+    Raises:
+        ValueError: If the upload isn't an image Pillow can read
+    """
+    _open_image(image_data)
+
+
+def normalize_character_image(image_data: bytes) -> Tuple[str, bytes]:
+    """
+    Normalize an uploaded character reference: cap its dimensions and
+    recompress it. Images with transparency stay PNG, everything else is
+    stored as JPEG.
+
+    Returns:
+        tuple: (mime_type, image bytes)
+
+    Raises:
+        ValueError: If the upload isn't an image Pillow can read
+    """
+    image = _open_image(image_data)
+    image.thumbnail((CHARACTER_IMAGE_MAX_SIDE, CHARACTER_IMAGE_MAX_SIDE), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if _has_alpha(image):
+        image.convert("RGBA").save(buffer, "PNG", optimize=True)
+        return "image/png", buffer.getvalue()
+    image.convert("RGB").save(buffer, "JPEG", quality=CHARACTER_IMAGE_QUALITY, optimize=True, progressive=True)
+    return "image/jpeg", buffer.getvalue()
+
+
+def make_character_thumbnail(image_data: bytes) -> str:
+    """
+    Build a small WebP thumbnail of a character image.
+
+    Returns:
+        str: Thumbnail as a data URI (a few KB), stored next to the full image
+
+    Raises:
+        ValueError: If the image can't be decoded
+    """
+    image = _open_image(image_data)
+    image.thumbnail((CHARACTER_THUMBNAIL_SIZE, CHARACTER_THUMBNAIL_SIZE), Image.LANCZOS)
+    image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=CHARACTER_THUMBNAIL_QUALITY)
+    return to_data_uri("image/webp", buffer.getvalue())
+
+
+def thumbnail_from_data_uri(data: str) -> str:
+    """Thumbnail for an image already stored as a data URI (characters saved without an upload)."""
+    _, image_data = decode_data_uri(data)
+    return make_character_thumbnail(image_data)
@@ -1,11 +1,23 @@
 # import websocket 
 import uuid
 import json
+import time
+import logging
 import urllib.request
 import urllib.parse
+import os
+from dotenv import load_dotenv
 from websocket import create_connection
+from .cassettes import recorded
+from .logs import Abbreviated
+from .metrics import PROVIDER_BYTES, observe_stage, span
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
 save_image_websocket = 'SaveImageWebsocket'
-server_address = "127.0.0.1:8188"
+# host:port of the ComfyUI server (or the fake one from run_fake_providers)
+server_address = os.getenv('COMFYUI_SERVER_ADDRESS', "127.0.0.1:8188")
 client_id = str(uuid.uuid4())
 
 
@@ -155,8 +167,8 @@ def get_prompt_with_workflow(input):
     prompt_json["5"]["inputs"]["text"] = input
     return prompt_json
 
-def queue_prompt(prompt):
-    p = {"prompt": prompt, "client_id": client_id}
+def queue_prompt(prompt, prompt_client_id=None):
+    p = {"prompt": prompt, "client_id": prompt_client_id or client_id}
     data = json.dumps(p).encode('utf-8')
     req =  urllib.request.Request("http://{}/prompt".format(server_address), data=data)
     return json.loads(urllib.request.urlopen(req).read())
@@ -171,25 +183,34 @@ def get_history(prompt_id):
     with urllib.request.urlopen("http://{}/history/{}".format(server_address, prompt_id)) as response:
         return json.loads(response.read())
 
-def get_images(ws, prompt):
-    prompt_id = queue_prompt(prompt)['prompt_id']
+def get_images(ws, prompt, prompt_client_id=None):
+    with span("comfyui.queue"):
+        prompt_id = queue_prompt(prompt, prompt_client_id)['prompt_id']
     output_image = None
     current_node = ""
-    while True:
-        out = ws.recv()
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message['type'] == 'executing':
-                data = message['data']
-                if data['prompt_id'] == prompt_id:
-                    if data['node'] is None:
-                        break #Execution is done
-                    else:
-                        node_number = data['node']
-                        current_node = prompt[node_number]["class_type"]
-        else:
-            if current_node == save_image_websocket:
-                output_image = out[8:]
+    # Time from the SaveImageWebsocket node starting to its image arriving
+    transfer_started = None
+    with span("comfyui.execution"):
+        while True:
+            out = ws.recv()
+            if isinstance(out, str):
+                message = json.loads(out)
+                if message['type'] == 'executing':
+                    data = message['data']
+                    if data['prompt_id'] == prompt_id:
+                        if data['node'] is None:
+                            break #Execution is done
+                        else:
+                            node_number = data['node']
+                            current_node = prompt[node_number]["class_type"]
+                            if current_node == save_image_websocket:
+                                transfer_started = time.perf_counter()
+            else:
+                if current_node == save_image_websocket:
+                    output_image = out[8:]
+                    if transfer_started is not None:
+                        observe_stage("comfyui.transfer", time.perf_counter() - transfer_started)
+                    PROVIDER_BYTES.inc(len(output_image), provider="comfyui")
 
     return output_image
 
@@ -212,17 +233,28 @@ def fetch_image_from_comfy(prompt):
     Raises:
         Exception: If connection fails or image generation fails
     """
+    # Recorded or replayed when PROVIDER_CASSETTE_MODE is set; keyed by the full workflow
+    return recorded(
+        "comfyui", {"workflow": get_prompt_with_workflow(prompt)},
+        lambda: _fetch_image_from_comfy(prompt), kind="bytes",
+    )
+
+def _fetch_image_from_comfy(prompt):
+    """Run the workflow on the ComfyUI server and read the image off the websocket."""
     ws = None
+    # ComfyUI delivers progress and images only to the latest socket of a
+    # client id, so concurrent requests each need their own
+    request_client_id = str(uuid.uuid4())
     try:
-        ws_url = f"ws://{server_address}/ws?clientId={client_id}"
+        ws_url = f"ws://{server_address}/ws?clientId={request_client_id}"
         
-        print(f"DEBUG: Connecting to ComfyUI at {ws_url}")
+        logger.debug("Connecting to ComfyUI at %s", ws_url)
         ws = create_connection(ws_url, timeout=5000)
         
         workflow = get_prompt_with_workflow(prompt)
-        print(f"DEBUG: Prompt: {prompt}...")
+        logger.debug("Prompt: %s", Abbreviated(prompt))
         
-        images = get_images(ws, workflow)
+        images = get_images(ws, workflow, request_client_id)
         
         if images is None:
             raise Exception("No image data received from ComfyUI")
@@ -0,0 +1,607 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import struct
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from PIL import Image
+
+from .video_assembly import run_ffmpeg
+from .video_generator import CLIP_DURATION
+
+# Load environment variables
+load_dotenv()
+
+# Stand-ins for Nebius, ComfyUI, Replicate and RunPod that speak the same
+# HTTP/websocket shapes the services use, so the backend can be load tested
+# offline. Each provider's behaviour is set from the environment:
+#   FAKE_<PROVIDER>_LATENCY       seconds per job, "0.5" or a "min-max" range sampled uniformly
+#   FAKE_<PROVIDER>_FAILURE_RATE  fraction of jobs that fail, 0..1
+#   FAKE_<PROVIDER>_PAYLOAD       "n" or "min-max": words per LLM scene/prompt,
+#                                 image side in pixels (ComfyUI), clip height in pixels (video)
+FAKE_PROVIDERS = ("nebius", "comfyui", "replicate", "runpod")
+FAKE_PROVIDER_DEFAULTS = {
+    "nebius": {"latency": "0.2-0.8", "failure_rate": "0", "payload": "40-80"},
+    "comfyui": {"latency": "1-3", "failure_rate": "0", "payload": "512"},
+    "replicate": {"latency": "2-5", "failure_rate": "0", "payload": "360"},
+    "runpod": {"latency": "2-5", "failure_rate": "0", "payload": "360"},
+}
+FAKE_PROVIDER_SEED = os.getenv('FAKE_PROVIDER_SEED')
+FAKE_PROVIDER_HOST = os.getenv('FAKE_PROVIDER_HOST', '127.0.0.1')
+# Providers listen on consecutive ports from here, in FAKE_PROVIDERS order
+FAKE_PROVIDER_PORT = int(os.getenv('FAKE_PROVIDER_PORT', 18001))
+FAKE_RUNPOD_ENDPOINT = "fake-endpoint"
+
+# Longest a Replicate "Prefer: wait" request is held open, like the real API
+REPLICATE_MAX_WAIT = 60
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+_WORDS = (
+    "golden light drifts across the quiet street as rain glistens on old stone walls while a red umbrella "
+    "sways in the wind near the wooden door of a small cafe where warm lamps glow behind fogged glass and "
+    "distant mountains fade into soft blue mist under a cloudy sky"
+).split()
+
+
+def parse_range(value: str) -> Tuple[float, float]:
+    """
+    Parse "x" or "min-max" into a (min, max) tuple.
+
+    Raises:
+        ValueError: If the value isn't a number or range, or min > max
+    """
+    parts = str(value).split("-", 1)
+    try:
+        low = float(parts[0])
+        high = float(parts[1]) if len(parts) > 1 else low
+    except ValueError:
+        raise ValueError(f"Expected a number or 'min-max' range, got '{value}'")
+    if low > high or low < 0:
+        raise ValueError(f"Invalid range '{value}'")
+    return low, high
+
+
+class ProviderBehaviour:
+    """
+    Latency, failure rate and payload size of one fake provider
+    """
+
+    def __init__(self, latency: Tuple[float, float] = (0, 0), failure_rate: float = 0.0,
+                 payload: Tuple[float, float] = (1, 1), seed: Optional[str] = None):
+        if not 0 <= failure_rate <= 1:
+            raise ValueError("failure_rate must be between 0 and 1")
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.payload = payload
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, provider: str, seed: Optional[str] = FAKE_PROVIDER_SEED) -> "ProviderBehaviour":
+        defaults = FAKE_PROVIDER_DEFAULTS[provider]
+        prefix = f"FAKE_{provider.upper()}_"
+        return cls(
+            latency=parse_range(os.getenv(prefix + "LATENCY", defaults["latency"])),
+            failure_rate=float(os.getenv(prefix + "FAILURE_RATE", defaults["failure_rate"])),
+            payload=parse_range(os.getenv(prefix + "PAYLOAD", defaults["payload"])),
+            seed=f"{seed}-{provider}" if seed is not None else None,
+        )
+
+    def delay(self) -> float:
+        """Seconds the next job takes."""
+        with self._lock:
+            return self._random.uniform(*self.latency)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def payload_size(self) -> int:
+        with self._lock:
+            return int(self._random.uniform(*self.payload))
+
+    def choice(self, options):
+        with self._lock:
+            return self._random.choice(options)
+
+
+################# Payloads #################
+def fake_text(behaviour: ProviderBehaviour) -> str:
+    words = [behaviour.choice(_WORDS) for _ in range(max(1, behaviour.payload_size()))]
+    return " ".join(words).capitalize() + "."
+
+
+def requested_scene_numbers(prompt: str) -> Optional[List[int]]:
+    """
+    Work out which scene numbers a script prompt asks for, or None when the
+    prompt wants a single block of text (image and video prompts).
+    """
+    missing = re.search(r'missing these scenes: ((?:Scene \d+(?:, )?)+)', prompt)
+    if missing:
+        return [int(n) for n in re.findall(r'\d+', missing.group(1))]
+    single = re.search(r'You MUST rewrite Scene (\d+)', prompt)
+    if single:
+        return [int(single.group(1))]
+    span = re.search(r'Scenes? (\d+) to (?:Scene )?(\d+)', prompt)
+    if span:
+        return list(range(int(span.group(1)), int(span.group(2)) + 1))
+    everything = re.search(r'Rewrite ALL (\d+) scenes', prompt)
+    if everything:
+        return list(range(1, int(everything.group(1)) + 1))
+    exact = re.search(r'exactly (\d+) scenes', prompt)
+    if exact:
+        first = re.search(r'\*\*Scene (\d+): "Title of Scene"\*\*', prompt)
+        start = int(first.group(1)) if first else 1
+        return list(range(start, start + int(exact.group(1))))
+    return None
+
+
+def fake_completion(messages: List[Dict[str, str]], behaviour: ProviderBehaviour) -> str:
+    """Reply to a chat completion in the format the calling prompt asks for."""
+    prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    numbers = requested_scene_numbers(prompt)
+    if numbers is None:
+        return fake_text(behaviour)
+    return "\n\n".join(
+        f"**Scene {n}: \"Fake Scene {n}\"**\n{{character}} {fake_text(behaviour)}" for n in numbers
+    )
+
+
+def fake_image(side: int) -> bytes:
+    """A noise PNG, so the payload doesn't compress away like a flat colour would."""
+    side = max(16, side)
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+_clip_dir = None
+_clip_paths = {}
+_clip_lock = threading.Lock()
+
+
+def fake_clip(height: int) -> str:
+    """
+    Path of a CLIP_DURATION second 16:9 test clip. Heights are rounded down
+    to a multiple of 16 and each size is rendered once per process.
+    """
+    global _clip_dir
+    height = max(16, height - height % 16)
+    with _clip_lock:
+        if height not in _clip_paths:
+            if _clip_dir is None:
+                _clip_dir = tempfile.mkdtemp(prefix="envision-fake-clips-")
+            path = os.path.join(_clip_dir, f"clip-{height}.mp4")
+            run_ffmpeg([
+                "-f", "lavfi", "-i", f"testsrc2=size={height * 16 // 9 // 2 * 2}x{height}:rate=24",
+                "-t", str(CLIP_DURATION), "-c:v", "libx264", "-preset", "ultrafast",
+                "-pix_fmt", "yuv420p", path,
+            ])
+            _clip_paths[height] = path
+        return _clip_paths[height]
+
+
+################# Websocket #################
+class WebSocketConnection:
+    """
+    Minimal server side of RFC 6455: unmasked outgoing frames, masked incoming
+    frames, no fragmentation or extensions. Enough for ComfyUI's /ws.
+    """
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.closed = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def accept_key(key: str) -> str:
+        return base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+
+    def send(self, payload, binary: bool = False, opcode: Optional[int] = None) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        opcode = opcode if opcode is not None else (0x2 if binary else 0x1)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.wfile.write(header + payload)
+                self.wfile.flush()
+            except OSError:
+                self.closed = True
+
+    def receive(self) -> Optional[Tuple[int, bytes]]:
+        """Read one frame as (opcode, payload), or None once the client is gone."""
+        try:
+            head = self.rfile.read(2)
+            if len(head) < 2:
+                return None
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self.rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self.rfile.read(8))[0]
+            mask = self.rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+            data = self.rfile.read(length)
+        except (OSError, struct.error):
+            return None
+        return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+    def serve(self) -> None:
+        """Answer pings and wait for the client to close."""
+        while True:
+            frame = self.receive()
+            if frame is None:
+                break
+            opcode, data = frame
+            if opcode == 0x8:
+                self.send(data[:2], opcode=0x8)
+                break
+            if opcode == 0x9:
+                self.send(data, opcode=0xA)
+        with self._lock:
+            self.closed = True
+
+
+################# Servers #################
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, behaviour: ProviderBehaviour, verbose: bool = False):
+        super().__init__(address, handler_class)
+        self.behaviour = behaviour
+        self.verbose = verbose
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        # ComfyUI websockets by client id
+        self.sockets = {}
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.address}"
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_body(self, body: bytes, content_type: str, code: int = 200) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, code: int = 200) -> None:
+        self.send_body(json.dumps(data).encode("utf-8"), "application/json", code)
+
+    def send_clip(self, name: str) -> None:
+        path = os.path.join(_clip_dir or "", os.path.basename(name))
+        if not _clip_dir or not os.path.exists(path):
+            return self.send_json({"detail": "Not found"}, 404)
+        with open(path, "rb") as f:
+            self.send_body(f.read(), "video/mp4")
+
+
+class NebiusHandler(FakeProviderHandler):
+    """POST .../chat/completions"""
+
+    def do_POST(self):
+        if not urlparse(self.path).path.endswith("/chat/completions"):
+            return self.send_json({"detail": "Not found"}, 404)
+        payload = self.read_json()
+        behaviour = self.server.behaviour
+        time.sleep(behaviour.delay())
+        if behaviour.should_fail():
+            return self.send_json({"detail": "Fake provider failure"}, 500)
+
+        content = fake_completion(payload.get("messages", []), behaviour)
+        self.send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": 0},
+        })
+
+
+class ComfyUIHandler(FakeProviderHandler):
+    """POST /prompt, GET /ws (websocket), /history/<prompt_id> and /view"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/ws":
+            return self.open_websocket(parse_qs(url.query).get("clientId", [""])[0])
+        if url.path.startswith("/history/"):
+            prompt_id = url.path.rsplit("/", 1)[-1]
+            job = self.server.jobs.get(prompt_id)
+            return self.send_json({prompt_id: job["history"]} if job and "history" in job else {})
+        if url.path == "/view":
+            filename = parse_qs(url.query).get("filename", [""])[0]
+            job = self.server.jobs.get(filename.split(".")[0])
+            if not job or "image" not in job:
+                return self.send_json({"detail": "Not found"}, 404)
+            return self.send_body(job["image"], "image/png")
+        self.send_json({"detail": "Not found"}, 404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/prompt":
+            return self.send_json({"detail": "Not found"}, 404)
+        data = self.read_json()
+        prompt_id = str(uuid.uuid4())
+        with self.server.jobs_lock:
+            self.server.jobs[prompt_id] = {}
+        threading.Thread(
+            target=run_comfy_prompt, args=(self.server, prompt_id, data.get("prompt", {}), data.get("client_id")),
+            daemon=True,
+        ).start()
+        self.send_json({"prompt_id": prompt_id, "number": 0, "node_errors": {}})
+
+    def open_websocket(self, client_id: str):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key or "websocket" not in self.headers.get("Upgrade", "").lower():
+            return self.send_json({"detail": "Expected a websocket upgrade"}, 400)
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", WebSocketConnection.accept_key(key))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        socket = WebSocketConnection(self.rfile, self.wfile)
+        # Like ComfyUI, the newest socket of a client id receives its messages
+        with self.server.jobs_lock:
+            self.server.sockets[client_id] = socket
+        socket.send(json.dumps({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 0}}, "sid": client_id}}))
+        socket.serve()
+        with self.server.jobs_lock:
+            if self.server.sockets.get(client_id) is socket:
+                del self.server.sockets[client_id]
+
+
+def run_comfy_prompt(server: FakeProviderServer, prompt_id: str, prompt: dict, client_id: str) -> None:
+    """Walk the workflow's nodes, then push the image over the client's socket as ComfyUI's SaveImageWebsocket does."""
+    behaviour = server.behaviour
+    delay = behaviour.delay()
+    nodes = list(prompt)
+    failed = behaviour.should_fail()
+    image = None if failed else fake_image(behaviour.payload_size())
+
+    def send(message, binary=False):
+        socket = server.sockets.get(client_id)
+        if socket:
+            socket.send(message, binary=binary)
+
+    def executing(node):
+        send(json.dumps({"type": "executing", "data": {"node": node, "prompt_id": prompt_id}}))
+
+    send(json.dumps({"type": "execution_start", "data": {"prompt_id": prompt_id}}))
+    for node in nodes:
+        executing(node)
+        time.sleep(delay / max(1, len(nodes)))
+        if failed:
+            send(json.dumps({"type": "execution_error", "data": {
+                "prompt_id": prompt_id, "node_id": node, "exception_message": "Fake provider failure"}}))
+            break
+        if prompt[node].get("class_type") == "SaveImageWebsocket":
+            # Binary frames carry an 8 byte header: event type 1 (preview image), format 2 (PNG)
+            send(struct.pack(">II", 1, 2) + image, binary=True)
+
+    with server.jobs_lock:
+        job = server.jobs[prompt_id]
+        job["history"] = {
+            "prompt": [0, prompt_id, prompt, {}, []],
+            "outputs": {} if failed else {
+                node: {"images": [{"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}]}
+                for node in nodes if prompt[node].get("class_type") == "SaveImage"
+            },
+            "status": {"status_str": "error" if failed else "success", "completed": not failed},
+        }
+        if image:
+            job["image"] = image
+    executing(None)
+
+
+def _job_state(server: FakeProviderServer, job: dict) -> str:
+    """'pending', 'failed' or 'succeeded' for a fake Replicate/RunPod job."""
+    if time.time() < job["ready_at"]:
+        return "pending"
+    if job["failed"]:
+        return "failed"
+    if "output" not in job:
+        job["output"] = f"{server.url}/files/{os.path.basename(fake_clip(job['height']))}"
+    return "succeeded"
+
+
+def _new_job(server: FakeProviderServer) -> dict:
+    behaviour = server.behaviour
+    job = {
+        "id": uuid.uuid4().hex,
+        "created_at": time.time(),
+        "ready_at": time.time() + behaviour.delay(),
+        "failed": behaviour.should_fail(),
+        "height": behaviour.payload_size(),
+    }
+    with server.jobs_lock:
+        server.jobs[job["id"]] = job
+    return job
+
+
+class ReplicateHandler(FakeProviderHandler):
+    """POST /v1/predictions, /v1/models/<owner>/<name>/predictions, GET /v1/predictions/<id> and /files/<clip>"""
+
+    def prediction(self, job: dict) -> dict:
+        state = _job_state(self.server, job)
+        status = {"pending": "processing", "failed": "failed", "succeeded": "succeeded"}[state]
+        timestamp = lambda t: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+        return {
+            "id": job["id"],
+            "model": job["model"],
+            "version": "fake",
+            "status": status,
+            "input": {},
+            "output": job.get("output") if state == "succeeded" else None,
+            "logs": "",
+            "error": "Fake provider failure" if state == "failed" else None,
+            "metrics": {},
+            "created_at": timestamp(job["created_at"]),
+            "started_at": timestamp(job["created_at"]),
+            "completed_at": timestamp(job["ready_at"]) if state != "pending" else None,
+            "urls": {
+                "get": f"{self.server.url}/v1/predictions/{job['id']}",
+                "cancel": f"{self.server.url}/v1/predictions/{job['id']}/cancel",
+            },
+        }
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        model = re.fullmatch(r"/v1/models/([^/]+/[^/]+)/predictions", path)
+        if path != "/v1/predictions" and not model:
+            return self.send_json({"detail": "Not found"}, 404)
+        self.read_json()
+        job = _new_job(self.server)
+        job["model"] = model.group(1) if model else "fake/model"
+
+        if self.headers.get("Prefer", "").startswith("wait"):
+            # Blocking request: hold it until the job is done or the wait runs out
+            time.sleep(max(0, min(job["ready_at"] - time.time(), REPLICATE_MAX_WAIT)))
+            prediction = self.prediction(job)
+            if prediction["status"] == "processing":
+                prediction["status"] = "starting"
+            return self.send_json(prediction, 201)
+        prediction = self.prediction(job)
+        prediction["status"] = "starting"
+        self.send_json(prediction, 201)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/files/"):
+            return self.send_clip(path[len("/files/"):])
+        match = re.fullmatch(r"/v1/predictions/([^/]+)", path)
+        job = self.server.jobs.get(match.group(1)) if match else None
+        if not job:
+            return self.send_json({"detail": "Not found"}, 404)
+        self.send_json(self.prediction(job))
+
+
+class RunPodHandler(FakeProviderHandler):
+    """POST /v2/<endpoint>/run, GET /v2/<endpoint>/status/<id> and /files/<clip>"""
+
+    def do_POST(self):
+        if not re.fullmatch(r"/v2/[^/]+/run", urlparse(self.path).path):
+            return self.send_json({"error": "Not found"}, 404)
+        self.read_json()
+        job = _new_job(self.server)
+        self.send_json({"id": job["id"], "status": "IN_QUEUE"})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/files/"):
+            return self.send_clip(path[len("/files/"):])
+        match = re.fullmatch(r"/v2/[^/]+/status/([^/]+)", path)
+        job = self.server.jobs.get(match.group(1)) if match else None
+        if not job:
+            return self.send_json({"error": "Not found"}, 404)
+
+        state = _job_state(self.server, job)
+        if state == "pending":
+            return self.send_json({"id": job["id"], "status": "IN_PROGRESS"})
+        if state == "failed":
+            return self.send_json({"id": job["id"], "status": "FAILED", "error": "Fake provider failure"})
+        self.send_json({
+            "id": job["id"],
+            "status": "COMPLETED",
+            "delayTime": 0,
+            "executionTime": int((job["ready_at"] - job["created_at"]) * 1000),
+            "output": [job["output"]],
+        })
+
+
+PROVIDER_HANDLERS = {
+    "nebius": NebiusHandler,
+    "comfyui": ComfyUIHandler,
+    "replicate": ReplicateHandler,
+    "runpod": RunPodHandler,
+}
+
+
+def start_fake_providers(host: str = FAKE_PROVIDER_HOST, port: int = FAKE_PROVIDER_PORT,
+                         behaviours: Optional[Dict[str, ProviderBehaviour]] = None,
+                         verbose: bool = False) -> Dict[str, FakeProviderServer]:
+    """
+    Start every fake provider on its own thread.
+
+    Args:
+        host: Interface to listen on
+        port: First port; providers take consecutive ports in FAKE_PROVIDERS order (0 picks free ports)
+        behaviours: Per-provider overrides of the FAKE_<PROVIDER>_* settings
+
+    Returns:
+        dict: provider name -> running server; pass to stop_fake_providers when done
+    """
+    behaviours = behaviours or {}
+    servers = {}
+    try:
+        for offset, provider in enumerate(FAKE_PROVIDERS):
+            server = FakeProviderServer(
+                (host, port + offset if port else 0),
+                PROVIDER_HANDLERS[provider],
+                behaviours.get(provider) or ProviderBehaviour.from_env(provider),
+                verbose=verbose,
+            )
+            servers[provider] = server
+            threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    except Exception:
+        stop_fake_providers(servers)
+        raise
+    return servers
+
+
+def stop_fake_providers(servers: Dict[str, FakeProviderServer]) -> None:
+    for server in servers.values():
+        server.shutdown()
+        server.server_close()
+
+
+def provider_environment(servers: Dict[str, FakeProviderServer]) -> Dict[str, str]:
+    """Environment variables that point the backend at the fake providers."""
+    return {
+        "NEBIUS_API_BASE": f"{servers['nebius'].url}/v1",
+        "COMFYUI_SERVER_ADDRESS": servers["comfyui"].address,
+        "REPLICATE_BASE_URL": servers["replicate"].url,
+        "RUNPOD_API_BASE": f"{servers['runpod'].url}/v2/{FAKE_RUNPOD_ENDPOINT}",
+    }
@@ -1,9 +1,12 @@
 import re
 import json
 import os
+import hashlib
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
+from .llm_cache import cached_chat_completion
 
 # Load environment variables
 load_dotenv()
@@ -18,12 +21,18 @@ if not NEBIUS_API_KEY:
 # Model to use
 LLAMA_MODEL = "meta-llama/Meta-Llama-3.1-8B-Instruct"
 
+# Parallel LLM calls when deriving video prompts for a whole project
+VIDEO_PROMPT_MAX_WORKERS = int(os.getenv('VIDEO_PROMPT_MAX_WORKERS', 4))
+
 class ImagePromptGenerator:
     """
     Service class for generating detailed image prompts from scene data using LLM
     """
     
-    def __init__(self):
+    def __init__(self, use_cache: bool = True):
+        # Serve identical LLM requests from the response cache
+        self.use_cache = use_cache
+
         # Default settings - no user input needed
         self.default_style = "cinematic"
         self.default_quality = "high"
@@ -163,15 +172,14 @@ Create a complete, cinematic image prompt that includes all styling elements nat
                 "max_tokens": 1000
             }
 
-            response = requests.post(
-                f"{NEBIUS_API_BASE}/chat/completions",
-                headers=headers,
-                json=payload,
-            )
+            try:
+                llm_response = cached_chat_completion(
+                    NEBIUS_API_BASE, headers, payload, use_cache=self.use_cache
+                ).strip()
+            except requests.HTTPError:
+                llm_response = None
 
-            if response.status_code == 200:
-                result = response.json()
-                llm_response = result["choices"][0]["message"]["content"].strip()
+            if llm_response is not None:
                 
                 # Clean up any unwanted formatting
                 # Remove JSON code blocks if present
@@ -376,10 +384,11 @@ Create a complete, cinematic image prompt that includes all styling elements nat
         return ", ".join(negative_elements)
     
     
-def CreateVideoPrompt(image_prompt: str) -> str:
+def CreateVideoPrompt(image_prompt: str, use_cache: bool = True) -> str:
     """
     Converts an image-style prompt into a detailed, cinematic video prompt.
     Adds camera motion, angles, lighting, pacing, and environmental dynamics.
+    Repeated calls with the same image prompt are served from the LLM response cache.
     """
 
     base = image_prompt.strip()
@@ -435,15 +444,12 @@ Create a complete, cinematic video prompt that includes all these elements natur
         "max_tokens": 1000
     }
 
-    response = requests.post(
-        f"{NEBIUS_API_BASE}/chat/completions",
-        headers=headers,
-        json=payload,
-    )
+    try:
+        llm_response = cached_chat_completion(NEBIUS_API_BASE, headers, payload, use_cache=use_cache).strip()
+    except requests.HTTPError:
+        llm_response = None
 
-    if response.status_code == 200:
-        result = response.json()
-        llm_response = result["choices"][0]["message"]["content"].strip()
+    if llm_response is not None:
         
         # Clean up any unwanted formatting
         llm_response = re.sub(r'```json.*?```', '', llm_response, flags=re.DOTALL)
@@ -465,4 +471,30 @@ Create a complete, cinematic video prompt that includes all these elements natur
         return final_video_prompt
     else:
         # Fallback in case of an error
-        return f"{base}, cinematic motion, high quality, dynamic lighting, professional cinematography, 8K resolution"
\ No newline at end of file
+        return f"{base}, cinematic motion, high quality, dynamic lighting, professional cinematography, 8K resolution"
+
+
+def video_prompt_source(image_prompt: str) -> str:
+    """Fingerprint of the image prompt a stored video prompt was derived from."""
+    return hashlib.sha256((image_prompt or "").encode('utf-8')).hexdigest()
+
+
+def generate_video_prompts(image_prompts: Dict[int, str]) -> Dict[int, str]:
+    """
+    Run CreateVideoPrompt for several scenes concurrently.
+
+    Args:
+        image_prompts: Mapping of scene_number -> image prompt
+
+    Returns:
+        Dict: scene_number -> video prompt
+    """
+    if not image_prompts:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(len(image_prompts), VIDEO_PROMPT_MAX_WORKERS)) as pool:
+        futures = {
+            scene_number: pool.submit(CreateVideoPrompt, image_prompt)
+            for scene_number, image_prompt in image_prompts.items()
+        }
+        return {scene_number: future.result() for scene_number, future in futures.items()}
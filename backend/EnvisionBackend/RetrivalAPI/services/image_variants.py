@@ -0,0 +1,74 @@
+import io
+import os
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+from PIL import Image
+
+from .metrics import timed
+
+# Load environment variables
+load_dotenv()
+
+# Widths of the resized copies kept next to the original scene image
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '256,512,1024').split(',')]
+# Output formats; WebP for browsers that take it, JPEG for everything else
+IMAGE_VARIANT_FORMATS = [f.strip().lower() for f in os.getenv('IMAGE_VARIANT_FORMATS', 'webp,jpeg').split(',')]
+
+# Pillow save options per format: (extension, Pillow format name, options)
+_FORMAT_OPTIONS = {
+    "webp": ("webp", "WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def variant_name(fmt: str, width: int) -> str:
+    """Name a variant the way clients ask for it, e.g. 'webp_512'."""
+    return f"{fmt}_{width}"
+
+
+def available_variants():
+    """All variant names the pipeline produces, in width order."""
+    return [variant_name(fmt, width) for width in IMAGE_VARIANT_WIDTHS for fmt in IMAGE_VARIANT_FORMATS]
+
+
+@timed("image.variants")
+def create_image_variants(image_data: bytes) -> Dict[str, Tuple[str, bytes]]:
+    """
+    Produce compressed, resized copies of an image.
+
+    The image is decoded once and each width is resized from the original, so
+    quality doesn't degrade from chaining resizes. Images are never upscaled:
+    a width larger than the source is encoded at the source width.
+
+    Args:
+        image_data: Encoded source image (PNG from ComfyUI)
+
+    Returns:
+        dict: variant name -> (file extension, encoded bytes)
+
+    Raises:
+        ValueError: If a configured format isn't supported or the image can't be decoded
+    """
+    try:
+        source = Image.open(io.BytesIO(image_data))
+        source.load()
+    except OSError as e:
+        raise ValueError(f"Could not decode image: {str(e)}")
+    if source.mode not in ("RGB", "RGBA"):
+        source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+
+    variants = {}
+    for width in IMAGE_VARIANT_WIDTHS:
+        if width < source.width:
+            resized = source.resize((width, round(source.height * width / source.width)), Image.LANCZOS)
+        else:
+            resized = source
+        for fmt in IMAGE_VARIANT_FORMATS:
+            if fmt not in _FORMAT_OPTIONS:
+                raise ValueError(f"Unsupported image variant format '{fmt}'")
+            extension, pillow_format, options = _FORMAT_OPTIONS[fmt]
+            image = resized.convert("RGB") if pillow_format == "JPEG" and resized.mode != "RGB" else resized
+            buffer = io.BytesIO()
+            image.save(buffer, pillow_format, **options)
+            variants[variant_name(fmt, width)] = (extension, buffer.getvalue())
+    return variants
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import requests
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from .cassettes import recorded
+from .metrics import LLM_CACHE_TOTAL, span
+
+# Load environment variables
+load_dotenv()
+
+# Cache settings
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') != '0'
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 60 * 60 * 24))          # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 512))   # in-process tier
+LLM_CACHE_MAX_FILES = int(os.getenv('LLM_CACHE_MAX_FILES', 5000))      # filesystem tier
+LLM_CACHE_DIR = os.getenv('LLM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'envision-llm-cache'))
+
+
+class LRUCache:
+    """
+    In-process cache with least-recently-used eviction and per-entry TTL
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int = LLM_CACHE_TTL) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class FileSystemCache:
+    """
+    Cache shared between worker processes, one JSON file per entry.
+    Values must be JSON serializable. When the directory holds more than
+    max_files entries the least recently written ones are removed.
+    """
+
+    def __init__(self, directory: str = LLM_CACHE_DIR, max_files: int = LLM_CACHE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._writes = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def set(self, key: str, value: Any, ttl: int = LLM_CACHE_TTL) -> None:
+        entry = {"expires_at": time.time() + ttl, "value": value}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            return
+
+        # Only scan the directory every so often; eviction doesn't need to be exact
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._evict()
+
+    def _evict(self) -> None:
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+        except OSError:
+            return
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+class TieredCache:
+    """
+    Looks tiers up in order (fastest first) and back-fills faster tiers on a hit
+    """
+
+    def __init__(self, tiers: List[Any]):
+        self.tiers = tiers
+
+    def get(self, key: str) -> Optional[Any]:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def set(self, key: str, value: Any, ttl: int = LLM_CACHE_TTL) -> None:
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """Return the process-wide LLM response cache, creating the default tiers on first use."""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = TieredCache([LRUCache(), FileSystemCache()])
+    return _llm_cache
+
+
+def set_llm_cache(cache) -> None:
+    """Swap in a different cache backend (anything with get/set/clear), or None to reset to the default."""
+    global _llm_cache
+    _llm_cache = cache
+
+
+def completion_request(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a chat completion payload that affect its output."""
+    return {
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+    }
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """Key a chat completion by everything that affects its output."""
+    return hashlib.sha256(json.dumps(completion_request(payload), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def completion_group(payload: Dict[str, Any]) -> str:
+    """Name the kind of completion (script, image prompt, ...) by its system prompt, for cassette matching."""
+    system = next((m.get("content", "") for m in payload.get("messages", []) if m.get("role") == "system"), "")
+    return hashlib.sha256(system.encode('utf-8')).hexdigest()[:12]
+
+
+def cached_chat_completion(api_base: str, headers: Dict[str, str], payload: Dict[str, Any],
+                           use_cache: bool = True, ttl: int = LLM_CACHE_TTL,
+                           validate: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    POST a chat completion and return the message content, serving repeated
+    identical requests from the cache.
+
+    Only enable the cache where replaying an earlier reply is acceptable: at
+    temperature > 0 every cache hit returns the same sample. Replies for which
+    validate returns False (truncated, unparseable) are returned but never cached.
+
+    Raises:
+        requests.HTTPError: If the API returns a non-200 response (never cached)
+    """
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    key = make_cache_key(payload) if use_cache else None
+
+    if use_cache:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            LLM_CACHE_TOTAL.inc(result="hit")
+            return cached
+        LLM_CACHE_TOTAL.inc(result="miss")
+
+    def post():
+        response = requests.post(
+            f"{api_base}/chat/completions",
+            headers=headers,
+            json=payload,
+        )
+        if response.status_code != 200:
+            raise requests.HTTPError(f"API Error {response.status_code}: {response.text}", response=response)
+        return response.json()["choices"][0]["message"]["content"]
+
+    # Recorded or replayed when PROVIDER_CASSETTE_MODE is set
+    with span("llm.chat_completion"):
+        content = recorded("nebius", completion_request(payload), post, group=completion_group(payload))
+    if use_cache and content and (validate is None or validate(content)):
+        get_llm_cache().set(key, content, ttl)
+    return content
@@ -0,0 +1,113 @@
+import os
+import re
+import json
+import logging
+from typing import Any, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Longest string logged from a single value (states, provider inputs, LLM replies)
+LOG_VALUE_MAX_CHARS = int(os.getenv('LOG_VALUE_MAX_CHARS', 300))
+# Longest message the formatters write; tracebacks are never cut
+LOG_MESSAGE_MAX_CHARS = int(os.getenv('LOG_MESSAGE_MAX_CHARS', 4000))
+# Containers are cut to this many items before they are formatted
+LOG_MAX_ITEMS = int(os.getenv('LOG_MAX_ITEMS', 20))
+
+DATA_URI_PATTERN = re.compile(r"data:([\w.+-]+/[\w.+-]+)?(?:;[\w.+-]+=[\w.+-]+)*;base64,([A-Za-z0-9+/=]+)")
+# Bare base64 (scene images are stored without the data: prefix)
+BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]{256,}={0,2}")
+
+# LogRecord attributes that aren't extra=... fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def redact(text: str) -> str:
+    """Replace data URIs and long base64 runs with their type and size."""
+    text = DATA_URI_PATTERN.sub(
+        lambda m: f"data:{m.group(1) or ''};base64,<{len(m.group(2))} chars>", text
+    )
+    return BASE64_PATTERN.sub(lambda m: f"<base64 {len(m.group(0))} chars>", text)
+
+
+def truncate(text: str, limit: int = LOG_VALUE_MAX_CHARS) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... <{len(text) - limit} more chars>"
+
+
+def shorten(value: Any, limit: int = LOG_VALUE_MAX_CHARS, items: int = LOG_MAX_ITEMS, depth: int = 4) -> Any:
+    """
+    Copy of `value` that is cheap to format: strings redacted and truncated,
+    containers cut to `items` entries and `depth` levels.
+    """
+    if isinstance(value, str):
+        return truncate(redact(value), limit)
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        if depth <= 0:
+            return f"<dict with {len(value)} keys>"
+        shortened = {key: shorten(item, limit, items, depth - 1) for key, item in list(value.items())[:items]}
+        if len(value) > items:
+            shortened["..."] = f"<{len(value) - items} more keys>"
+        return shortened
+    if isinstance(value, (list, tuple, set)):
+        if depth <= 0:
+            return f"<{type(value).__name__} of {len(value)}>"
+        shortened = [shorten(item, limit, items, depth - 1) for item in list(value)[:items]]
+        if len(value) > items:
+            shortened.append(f"<{len(value) - items} more>")
+        return shortened
+    return value
+
+
+class Abbreviated:
+    """
+    Log argument that is only shortened and formatted if the record is emitted:
+
+        logger.debug("State: %s", Abbreviated(state))
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        limit = self.limit if self.limit is not None else LOG_VALUE_MAX_CHARS
+        return truncate(str(shorten(self.value, limit)), max(limit, LOG_MESSAGE_MAX_CHARS))
+
+    __repr__ = __str__
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    Formatter that redacts data URIs and caps the message at LOG_MESSAGE_MAX_CHARS,
+    for messages whose arguments weren't wrapped in Abbreviated.
+    """
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(redact(record.message), LOG_MESSAGE_MAX_CHARS)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(RedactingFormatter):
+    """One JSON object per line, with extra=... fields as keys (LOG_FORMAT=json)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.message = truncate(redact(record.getMessage()), LOG_MESSAGE_MAX_CHARS)
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.message,
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = shorten(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
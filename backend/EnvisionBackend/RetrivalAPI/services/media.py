@@ -0,0 +1,149 @@
+import io
+import os
+import time
+import base64
+import binascii
+import tempfile
+import requests
+from typing import BinaryIO, Optional, Tuple
+
+# A data URI header ("data:video/mp4;base64,") is never longer than this
+DATA_URI_HEADER_LIMIT = 256
+
+# Characters of base64 text decoded per step; a multiple of 4 keeps chunks aligned
+DECODE_CHUNK_SIZE = 1 << 20
+
+# Streaming downloads
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+DOWNLOAD_MAX_RETRIES = 3
+
+_WHITESPACE = str.maketrans("", "", " \t\r\n")
+
+
+def split_data_uri(data: str) -> Tuple[Optional[str], int]:
+    """
+    Parse the header of a base64 data URI without touching the body.
+
+    Returns:
+        tuple: (mime_type or None, offset where the base64 payload starts).
+        Plain base64 strings return (None, 0).
+
+    Raises:
+        ValueError: If the string looks like a data URI but the header is malformed
+    """
+    if not data.startswith("data:"):
+        return None, 0
+
+    comma = data.find(",", 0, DATA_URI_HEADER_LIMIT)
+    if comma == -1:
+        raise ValueError("Malformed data URI: header not terminated")
+
+    header = data[5:comma]
+    if not header.endswith(";base64"):
+        raise ValueError("Only base64 encoded data URIs are supported")
+    return header[:-len(";base64")] or None, comma + 1
+
+
+def decode_base64_to(data: str, out: BinaryIO, offset: int = 0, chunk_size: int = DECODE_CHUNK_SIZE) -> int:
+    """
+    Decode base64 text from data[offset:] into a binary file-like object,
+    one chunk at a time. Whitespace is skipped, missing padding is tolerated
+    and invalid characters are rejected while decoding, so no separate
+    validation pass is needed.
+
+    Returns:
+        int: Number of bytes written
+
+    Raises:
+        ValueError: If the payload is not valid base64
+    """
+    chunk_size -= chunk_size % 4
+    written = 0
+    carry = ""
+    padded = False
+    pos = offset
+    end = len(data)
+
+    try:
+        while pos < end:
+            chunk = data[pos:pos + chunk_size].translate(_WHITESPACE)
+            pos += chunk_size
+            if not chunk:
+                continue
+            if padded:
+                raise ValueError("Invalid Base64 string: data after padding")
+
+            chunk = carry + chunk
+            usable = len(chunk) - len(chunk) % 4
+            carry = chunk[usable:]
+            if usable:
+                block = chunk[:usable]
+                padded = "=" in block
+                written += out.write(base64.b64decode(block, validate=True))
+
+        if carry:
+            if padded or len(carry) == 1:
+                raise ValueError("Invalid Base64 string: truncated data")
+            written += out.write(base64.b64decode(carry + "=" * (4 - len(carry)), validate=True))
+    except binascii.Error as e:
+        raise ValueError(f"Invalid Base64 string: {str(e)}")
+
+    return written
+
+
+def decode_data_uri(data: str) -> Tuple[Optional[str], bytes]:
+    """Decode a data URI (or plain base64 string) to (mime_type, bytes) in a single pass."""
+    mime_type, offset = split_data_uri(data)
+    buffer = io.BytesIO()
+    decode_base64_to(data, buffer, offset)
+    return mime_type, buffer.getvalue()
+
+
+def download_to_file(url: str, suffix: str = "", timeout: int = 30, max_retries: int = DOWNLOAD_MAX_RETRIES,
+                     chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    """
+    Stream a URL to a new temporary file without holding the body in memory.
+    If the connection drops part way, the download is resumed with a Range
+    request (or restarted if the server doesn't support ranges).
+
+    Returns:
+        str: Path of the downloaded file; the caller is responsible for removing it
+
+    Raises:
+        requests.RequestException / IOError: If the download still fails after max_retries
+    """
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    written = 0
+    try:
+        for attempt in range(max_retries + 1):
+            headers = {"Range": f"bytes={written}-"} if written else {}
+            try:
+                with requests.get(url, stream=True, timeout=timeout, headers=headers) as response:
+                    response.raise_for_status()
+                    if written and response.status_code != 206:
+                        # Range ignored: the body is the whole file again
+                        temp_file.seek(0)
+                        temp_file.truncate()
+                        written = 0
+
+                    content_length = response.headers.get("Content-Length")
+                    expected = written + int(content_length) if content_length else None
+
+                    for chunk in response.iter_content(chunk_size):
+                        temp_file.write(chunk)
+                        written += len(chunk)
+
+                if expected is not None and written < expected:
+                    raise IOError(f"Incomplete download: {written} of {expected} bytes")
+
+                temp_file.close()
+                return temp_file.name
+            except (requests.RequestException, IOError):
+                if attempt == max_retries:
+                    raise
+                temp_file.flush()
+                time.sleep(2 ** attempt)
+    except Exception:
+        temp_file.close()
+        os.unlink(temp_file.name)
+        raise
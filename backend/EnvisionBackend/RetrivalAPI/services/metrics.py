@@ -0,0 +1,357 @@
+import os
+import json
+import math
+import time
+import logging
+import tempfile
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages run from milliseconds (DB saves) to many minutes (video predictions)
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# With several worker processes (gunicorn) on one host, set this to a directory
+# shared by them: each process writes its metrics there as <pid>.json and
+# /metrics reports the sum of the processes still running
+METRICS_DIR = os.getenv('METRICS_DIR')
+# Seconds between a process's snapshots in METRICS_DIR
+METRICS_EXPORT_INTERVAL = float(os.getenv('METRICS_EXPORT_INTERVAL', 5))
+
+LabelValues = Tuple[str, ...]
+# Joins label values into snapshot keys (snapshots are written as JSON)
+_KEY_SEPARATOR = "\x1f"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic counter with labels
+    """
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _changed()
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {_KEY_SEPARATOR.join(key): value for key, value in self._values.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(into: dict, other: dict) -> None:
+        for key, value in other.items():
+            into[key] = into.get(key, 0) + value
+
+    def render(self, values: dict) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key.split(_KEY_SEPARATOR) if self.label_names else ())} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Counter):
+    """
+    Cumulative-bucket histogram with labels, as Prometheus expects
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["count"] += 1
+            entry["sum"] += value
+        _changed()
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry["count"] if entry else 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                _KEY_SEPARATOR.join(key): {"buckets": list(e["buckets"]), "count": e["count"], "sum": e["sum"]}
+                for key, e in self._values.items()
+            }
+
+    @staticmethod
+    def merge(into: dict, other: dict) -> None:
+        for key, entry in other.items():
+            if key not in into:
+                into[key] = {"buckets": list(entry["buckets"]), "count": entry["count"], "sum": entry["sum"]}
+                continue
+            target = into[key]
+            target["buckets"] = [a + b for a, b in zip(target["buckets"], entry["buckets"])]
+            target["count"] += entry["count"]
+            target["sum"] += entry["sum"]
+
+    def render(self, values: dict) -> List[str]:
+        lines = []
+        for key, entry in sorted(values.items()):
+            label_values = key.split(_KEY_SEPARATOR) if self.label_names else ()
+            for bound, count in zip(self.buckets + (math.inf,), entry["buckets"] + [entry["count"]]):
+                labels = _format_labels(self.label_names, label_values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry['sum'])}")
+            lines.append(f"{self.name}_count{labels} {entry['count']}")
+        return lines
+
+
+class Registry:
+    """
+    Named metrics of one process, rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Counter) -> Counter:
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def reset(self) -> None:
+        """Drop every recorded value (tests start from a clean registry)."""
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def render(self, snapshot: Optional[dict] = None) -> str:
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            lines.extend(metric.render(snapshot.get(name, {})))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "envision_stage_duration_seconds", "Time spent in each pipeline stage", ["stage"]
+)
+STAGE_TOTAL = registry.counter(
+    "envision_stage_total", "Pipeline stage runs by outcome", ["stage", "outcome"]
+)
+REQUEST_SECONDS = registry.histogram(
+    "envision_http_request_duration_seconds", "API request latency", ["view", "method", "status"]
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "envision_db_query_duration_seconds", "SQL statement latency during API requests", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+LLM_CACHE_TOTAL = registry.counter(
+    "envision_llm_cache_total", "LLM completions served from the cache or the API", ["result"]
+)
+PROVIDER_BYTES = registry.counter(
+    "envision_provider_bytes_total", "Bytes received from generation providers", ["provider"]
+)
+
+
+################# Spans #################
+# Stage timings of the current request, for the Server-Timing header
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a block as one run of `stage`: feeds envision_stage_duration_seconds
+    and envision_stage_total, and the current request's Server-Timing header.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, outcome)
+
+
+def observe_stage(stage: str, elapsed: float, outcome: str = "ok") -> None:
+    """Record one run of a stage timed some other way than span()."""
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+    STAGE_TOTAL.inc(stage=stage, outcome=outcome)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, elapsed))
+
+
+def timed(stage: str):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request_spans():
+    """Start collecting this request's spans; returns a token for finish_request_spans."""
+    return _request_spans.set([])
+
+
+def finish_request_spans(token) -> List[Tuple[str, float]]:
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    return spans
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    """Server-Timing header value with the total milliseconds per stage, in first-seen order."""
+    totals: Dict[str, float] = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0) + elapsed
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items())
+
+
+################# Multi-process export #################
+_last_export = 0.0
+_export_lock = threading.Lock()
+
+
+def _changed() -> None:
+    """Write this process's snapshot to METRICS_DIR, at most every METRICS_EXPORT_INTERVAL seconds."""
+    global _last_export
+    if not METRICS_DIR or time.time() - _last_export < METRICS_EXPORT_INTERVAL:
+        return
+    if not _export_lock.acquire(blocking=False):
+        return
+    try:
+        _last_export = time.time()
+        export_snapshot()
+    finally:
+        _export_lock.release()
+
+
+def export_snapshot(directory: Optional[str] = None) -> None:
+    directory = directory or METRICS_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, f"{os.getpid()}.json"))
+    except OSError as e:
+        logger.warning("Could not export metrics: %s", e)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+def collect(directory: Optional[str] = None) -> dict:
+    """
+    This process's metrics, summed with the latest snapshot of every other
+    process in METRICS_DIR when that is set.
+
+    Snapshots of processes that have exited are deleted rather than summed,
+    so counters don't keep growing across worker restarts. Totals drop when a
+    worker goes away, which Prometheus treats as a counter reset.
+    """
+    directory = directory or METRICS_DIR
+    snapshot = registry.snapshot()
+    if not directory:
+        return snapshot
+    export_snapshot(directory)
+    merged = {name: {} for name in registry.metrics}
+    for entry in os.scandir(directory):
+        pid, _, extension = entry.name.partition(".")
+        if extension != "json" or not pid.isdigit():
+            continue
+        if not _process_alive(int(pid)):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(entry.path) as f:
+                other = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, metric in registry.metrics.items():
+            metric.merge(merged[name], other.get(name, {}))
+    return merged
+
+
+def render_metrics() -> str:
+    """Everything collect() returns, in the Prometheus text exposition format."""
+    return registry.render(collect())
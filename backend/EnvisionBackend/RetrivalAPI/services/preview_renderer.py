@@ -0,0 +1,151 @@
+import io
+import os
+import subprocess
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from PIL import Image
+
+from .media import decode_data_uri
+from .video_assembly import get_ffmpeg_binary
+from .metrics import timed
+from .video_generator import CLIP_DURATION
+
+# Load environment variables
+load_dotenv()
+
+# Preview settings; small and choppy on purpose, it only has to show pacing
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', 480))
+PREVIEW_FPS = int(os.getenv('PREVIEW_FPS', 12))
+# Each scene is shown for as long as its generated clip will run
+PREVIEW_SCENE_SECONDS = float(os.getenv('PREVIEW_SCENE_SECONDS', CLIP_DURATION))
+# How far the camera pushes in over one scene (1.15 = 15%)
+PREVIEW_MAX_ZOOM = 1.15
+
+
+def _even(value: float) -> int:
+    """libx264 with yuv420p needs even frame dimensions."""
+    return max(2, int(value) // 2 * 2)
+
+
+def preview_frame_size(image: Image.Image, width: int = PREVIEW_WIDTH) -> Tuple[int, int]:
+    """Frame size for a preview: the given width at the image's aspect ratio."""
+    return _even(width), _even(width * image.height / image.width)
+
+
+def load_scene_image(data: str, frame_size: Tuple[int, int]) -> Image.Image:
+    """
+    Decode a scene's base64 image and cover-crop it to the frame's aspect ratio,
+    leaving enough resolution for the zoom so frames never upscale.
+    """
+    _, raw = decode_data_uri(data)
+    image = Image.open(io.BytesIO(raw))
+    image.draft("RGB", (int(frame_size[0] * PREVIEW_MAX_ZOOM), int(frame_size[1] * PREVIEW_MAX_ZOOM)))
+    image = image.convert("RGB")
+
+    frame_w, frame_h = frame_size
+    scale = max(frame_w * PREVIEW_MAX_ZOOM / image.width, frame_h * PREVIEW_MAX_ZOOM / image.height)
+    crop_w, crop_h = frame_w * PREVIEW_MAX_ZOOM / scale, frame_h * PREVIEW_MAX_ZOOM / scale
+    left, top = (image.width - crop_w) / 2, (image.height - crop_h) / 2
+    return image.resize(
+        (round(frame_w * PREVIEW_MAX_ZOOM), round(frame_h * PREVIEW_MAX_ZOOM)),
+        Image.BILINEAR,
+        box=(left, top, left + crop_w, top + crop_h),
+    )
+
+
+def ken_burns_frames(image: Image.Image, frame_size: Tuple[int, int], num_frames: int, index: int):
+    """
+    Yield raw RGB frames that slowly zoom and pan across the image.
+    Even scenes push in, odd scenes pull out, and the pan direction alternates
+    so consecutive scenes don't all drift the same way.
+    """
+    frame_w, frame_h = frame_size
+    zoom_in = index % 2 == 0
+    pan = 1 if index % 4 < 2 else -1
+
+    for i in range(num_frames):
+        t = i / max(1, num_frames - 1)
+        t = t * t * (3 - 2 * t)  # ease in and out
+        zoom = 1 + (PREVIEW_MAX_ZOOM - 1) * (t if zoom_in else 1 - t)
+
+        # Visible window in the source image (which is PREVIEW_MAX_ZOOM x the frame)
+        view_w, view_h = image.width / zoom, image.height / zoom
+        slack_x, slack_y = image.width - view_w, image.height - view_h
+        left = slack_x * (0.5 + pan * (t - 0.5))
+        top = slack_y / 2
+
+        frame = image.resize((frame_w, frame_h), Image.BILINEAR, box=(left, top, left + view_w, top + view_h))
+        yield frame.tobytes()
+
+
+@timed("video.preview")
+def render_preview(images: List[str], output_path: str, seconds_per_scene: float = PREVIEW_SCENE_SECONDS,
+                   width: int = PREVIEW_WIDTH, fps: int = PREVIEW_FPS) -> str:
+    """
+    Render a low resolution pan-and-zoom slideshow of the scene images, one
+    scene after another. Frames are piped straight into ffmpeg, so only the
+    current scene's image is held in memory.
+
+    Args:
+        images: Scene images as base64 data URIs, in scene order
+        output_path: Where to write the mp4
+        seconds_per_scene: How long each scene is shown
+        width: Frame width; the height follows the first image's aspect ratio
+        fps: Frame rate of the preview
+
+    Returns:
+        str: output_path
+
+    Raises:
+        ValueError: If there are no images or one can't be decoded
+        RuntimeError: If ffmpeg fails
+    """
+    if not images:
+        raise ValueError("No scene images to preview")
+
+    frames_per_scene = max(1, round(seconds_per_scene * fps))
+    frame_size: Optional[Tuple[int, int]] = None
+    process = None
+
+    try:
+        for index, data in enumerate(images):
+            if frame_size is None:
+                _, raw = decode_data_uri(data)
+                frame_size = preview_frame_size(Image.open(io.BytesIO(raw)), width)
+                process = subprocess.Popen(
+                    [
+                        get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+                        "-f", "rawvideo", "-pix_fmt", "rgb24",
+                        "-s", f"{frame_size[0]}x{frame_size[1]}", "-r", str(fps), "-i", "-",
+                        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "28", "-pix_fmt", "yuv420p",
+                        "-movflags", "+faststart",
+                        output_path,
+                    ],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                )
+
+            try:
+                image = load_scene_image(data, frame_size)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Could not decode image for scene {index + 1}: {str(e)}")
+            for frame in ken_burns_frames(image, frame_size, frames_per_scene, index):
+                process.stdin.write(frame)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its stderr below says why
+    except Exception:
+        if process is not None:
+            process.kill()
+            process.wait()
+        raise
+
+    try:
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    stderr = process.stderr.read()
+    process.stderr.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode('utf-8', 'replace')[-2000:]}")
+    return output_path
@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import tempfile
+import functools
+import threading
+from collections import Counter
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Requests sending this value in an X-Profile header are profiled; unset disables header opt-in
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+# Comma-separated user ids whose requests are always profiled
+PROFILING_USER_IDS = {uid.strip() for uid in os.getenv('PROFILING_USER_IDS', '').split(',') if uid.strip()}
+# Comma-separated URL names (e.g. "edit_all_scenes,generate_video"); empty profiles any view
+PROFILING_VIEWS = {name.strip() for name in os.getenv('PROFILING_VIEWS', '').split(',') if name.strip()}
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'envision-profiles'))
+# "cprofile" (deterministic, pstats), "sample" (collapsed stacks) or "both"
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'both').lower()
+# Seconds between stack samples
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', 0.005))
+
+PROFILING_MODES = ("cprofile", "sample", "both")
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# cProfile can't nest, and profiling is meant for the odd request: one at a time per process
+_profile_lock = threading.Lock()
+
+
+def request_id_for(header_value: Optional[str]) -> str:
+    """The client's X-Request-ID if it is safe to use as a file name, else a new id."""
+    if header_value and REQUEST_ID_PATTERN.match(header_value):
+        return header_value
+    return uuid.uuid4().hex
+
+
+@functools.lru_cache(maxsize=4096)
+def frame_label(code) -> str:
+    """Frame name for collapsed stacks: function (module path:first line)."""
+    path = code.co_filename
+    for root in sorted(sys.path, key=len, reverse=True):
+        if root and path.startswith(root + os.sep):
+            path = path[len(root) + 1:]
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack every `interval` seconds from a background
+    thread. Cheap enough to leave the profiled request's timings mostly
+    intact, and its output is the collapsed format flamegraph.pl and
+    speedscope read.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILING_SAMPLE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class RequestProfiler:
+    """
+    Profiles the calling thread between start() and stop() and saves the
+    result under PROFILING_DIR as <request id>.pstats / .collapsed / .json.
+    Work handed to other threads (thread pools, LangGraph) is only seen by
+    the sampler as time spent waiting.
+    """
+
+    def __init__(self, request_id: str, mode: str = PROFILING_MODE):
+        if mode not in PROFILING_MODES:
+            raise ValueError(f"Profiling mode must be one of: {', '.join(PROFILING_MODES)}")
+        self.request_id = request_id
+        self.mode = mode
+        self.profiler = cProfile.Profile() if mode in ("cprofile", "both") else None
+        self.sampler = SamplingProfiler() if mode in ("sample", "both") else None
+        self.elapsed = 0.0
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        if self.sampler:
+            self.sampler.start()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self) -> None:
+        if self.profiler:
+            self.profiler.disable()
+        if self.sampler:
+            self.sampler.stop()
+        self.elapsed = time.perf_counter() - self._started
+
+    def save(self, metadata: Dict, directory: Optional[str] = None) -> Dict[str, str]:
+        """
+        Write the profile files.
+
+        Returns:
+            dict: Kind of output ("pstats", "collapsed", "metadata") -> file path
+        """
+        directory = directory or PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.request_id)
+        paths = {}
+        if self.profiler:
+            paths["pstats"] = f"{base}.pstats"
+            pstats.Stats(self.profiler).dump_stats(paths["pstats"])
+        if self.sampler:
+            paths["collapsed"] = f"{base}.collapsed"
+            with open(paths["collapsed"], "w") as f:
+                f.write(self.sampler.collapsed())
+        paths["metadata"] = f"{base}.json"
+        with open(paths["metadata"], "w") as f:
+            json.dump({
+                "request_id": self.request_id,
+                "mode": self.mode,
+                "elapsed_seconds": self.elapsed,
+                "samples": sum(self.sampler.stacks.values()) if self.sampler else None,
+                "finished_at": time.time(),
+                **metadata,
+            }, f, indent=2)
+        return paths
+
+
+def try_acquire() -> bool:
+    """Claim the process's profiling slot; False if another request is being profiled."""
+    return _profile_lock.acquire(blocking=False)
+
+
+def release() -> None:
+    _profile_lock.release()
@@ -0,0 +1,104 @@
+import io
+import os
+import base64
+import hashlib
+import tempfile
+from dotenv import load_dotenv
+from PIL import Image
+
+from .llm_cache import FileSystemCache, LRUCache, TieredCache
+from .media import decode_data_uri
+
+# Load environment variables
+load_dotenv()
+
+# Longest side of the starting image each video provider is sent. Larger
+# images only cost upload time and provider-side decoding: Kling renders at
+# up to 1080p and Wan 2.2 on RunPod at 480p/720p.
+REFERENCE_IMAGE_MAX_SIDE = {
+    "kling": int(os.getenv('KLING_REFERENCE_MAX_SIDE', 1024)),
+    "wan": int(os.getenv('WAN_REFERENCE_MAX_SIDE', 832)),
+}
+REFERENCE_IMAGE_QUALITY = int(os.getenv('REFERENCE_IMAGE_QUALITY', 90))
+
+REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', 60 * 60 * 24 * 7))  # seconds
+REFERENCE_CACHE_DIR = os.getenv(
+    'REFERENCE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'envision-reference-cache')
+)
+
+_reference_cache = None
+
+
+def get_reference_cache():
+    """Return the process-wide prepared image cache, creating the default tiers on first use."""
+    global _reference_cache
+    if _reference_cache is None:
+        _reference_cache = TieredCache([
+            LRUCache(max_entries=64),
+            FileSystemCache(directory=REFERENCE_CACHE_DIR, max_files=1000),
+        ])
+    return _reference_cache
+
+
+def set_reference_cache(cache) -> None:
+    """Swap in a different cache backend (anything with get/set/clear), or None to reset to the default."""
+    global _reference_cache
+    _reference_cache = cache
+
+
+def encode_reference_image(image_data: bytes, max_side: int, quality: int = REFERENCE_IMAGE_QUALITY) -> bytes:
+    """
+    Fit an image within max_side x max_side (never upscaling) and re-encode it as JPEG.
+
+    Raises:
+        ValueError: If the image can't be decoded
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.draft("RGB", (max_side, max_side))
+        image = image.convert("RGB")
+    except OSError as e:
+        raise ValueError(f"Could not decode reference image: {str(e)}")
+
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_reference_image(image: str, provider: str) -> str:
+    """
+    Resize and recompress a scene image for a video provider.
+
+    Results are cached by a hash of the source image and the provider
+    settings, so re-rendering an unchanged scene skips the work entirely.
+
+    Args:
+        image: Scene image as a data URI or plain base64 string
+        provider: Key of REFERENCE_IMAGE_MAX_SIDE ("kling" or "wan")
+
+    Returns:
+        str: Base64 JPEG payload without a data URI header
+
+    Raises:
+        ValueError: If the provider is unknown or the image can't be decoded
+    """
+    if provider not in REFERENCE_IMAGE_MAX_SIDE:
+        raise ValueError(f"Unknown video provider '{provider}'")
+    max_side = REFERENCE_IMAGE_MAX_SIDE[provider]
+
+    digest = hashlib.sha256(image.encode('utf-8')).hexdigest()
+    key = f"{provider}-{max_side}-{REFERENCE_IMAGE_QUALITY}-{digest}"
+    cached = get_reference_cache().get(key)
+    if cached is not None:
+        return cached
+
+    _, image_data = decode_data_uri(image)
+    prepared = base64.b64encode(encode_reference_image(image_data, max_side)).decode('utf-8')
+    get_reference_cache().set(key, prepared, REFERENCE_CACHE_TTL)
+    return prepared
+
+
+def prepare_reference_data_uri(image: str, provider: str) -> str:
+    """Like prepare_reference_image, wrapped as a data:image/jpeg URI."""
+    return f"data:image/jpeg;base64,{prepare_reference_image(image, provider)}"
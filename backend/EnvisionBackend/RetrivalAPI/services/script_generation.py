@@ -3,6 +3,7 @@ import requests
 import re
 from typing import Dict, List, Any, TypedDict, Optional
 from dotenv import load_dotenv
+from .llm_cache import cached_chat_completion
 
 # Load environment variables
 load_dotenv()
@@ -78,7 +79,97 @@ def extractScenes(script: str) -> List[SceneData]:
     return scenes
 
 
-def generate_script(concept: str, num_scenes: int = 5, creativity_level: str = 'balanced', previous_context: str = None, trigger_word: str = None) -> Dict[str, Any]:
+def format_script(scene_details: List[SceneData]) -> str:
+    """Script text in the format extractScenes reads, one block per scene."""
+    return "\n\n".join(
+        f"**Scene {scene['scene_number']}: \"{scene['title']}\"**\n{scene['story']}"
+        for scene in scene_details
+    )
+
+
+def find_missing_scenes(scene_details: List[SceneData], first_scene: int, num_scenes: int) -> List[int]:
+    """
+    Return the expected scene numbers that extractScenes did not produce,
+    including scenes that parsed but came back without any content.
+    """
+    parsed = {s["scene_number"] for s in scene_details if s.get("story", "").strip()}
+    return [n for n in range(first_scene, first_scene + num_scenes) if n not in parsed]
+
+
+def request_missing_scenes(scene_details: List[SceneData], missing: List[int], concept: str, system_prompt: str,
+                           placeholder: str, temperature: float, headers: Dict[str, str],
+                           use_cache: bool = False) -> List[SceneData]:
+    """
+    Ask the LLM for just the missing scene numbers, giving it the neighbouring
+    scenes as context, and merge whatever comes back into scene_details.
+    Returns the merged, scene-number ordered list; on failure the input is returned unchanged.
+    """
+    by_number = {s["scene_number"]: s for s in scene_details if s.get("story", "").strip()}
+
+    context_numbers = set()
+    for n in missing:
+        before = [k for k in by_number if k < n]
+        after = [k for k in by_number if k > n]
+        if before:
+            context_numbers.add(max(before))
+        if after:
+            context_numbers.add(min(after))
+    context = "\n\n".join(
+        f"**Scene {k}: \"{by_number[k]['title']}\"**\n{by_number[k]['story']}"
+        for k in sorted(context_numbers)
+    ) or "(no surrounding scenes available)"
+
+    wanted = ", ".join(f"Scene {n}" for n in missing)
+    repair_prompt = f"""
+The script for "{concept}" is missing these scenes: {wanted}.
+
+SURROUNDING SCENES (for continuity only, do NOT return them):
+{context}
+
+Write ONLY {wanted}, using {placeholder} for the main subject, so they fit between the surrounding scenes.
+Use this exact format for each one:
+**Scene #: "TITLE"**
+[Summary of what happens in the scene]
+"""
+    payload = {
+        "model": LLAMA_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": repair_prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": 400 * len(missing)
+    }
+
+    def complete(text: str) -> bool:
+        returned = {s["scene_number"] for s in extractScenes(text) if s["story"]}
+        return set(missing) <= returned
+
+    try:
+        repaired = extractScenes(cached_chat_completion(
+            NEBIUS_API_BASE, headers, payload, use_cache=use_cache, validate=complete
+        ))
+    except Exception:
+        return scene_details
+
+    merged = {s["scene_number"]: s for s in scene_details}
+    for scene in repaired:
+        if scene["scene_number"] in missing and scene["story"]:
+            merged[scene["scene_number"]] = scene
+    return sorted(merged.values(), key=lambda s: s["scene_number"])
+
+
+def generate_script(concept: str, num_scenes: int = 5, creativity_level: str = 'balanced', previous_context: str = None, trigger_word: str = None, first_scene: int = 1, repair_missing: bool = True, use_cache: bool = False) -> Dict[str, Any]:
+    """
+    Generate scene summaries for a concept.
+    first_scene lets callers continue an existing story: the returned scenes are
+    numbered first_scene..first_scene + num_scenes - 1.
+    With repair_missing, scenes the LLM skipped or formatted badly are requested
+    again on their own instead of regenerating the whole script.
+    Scripts are sampled (temperature 0.5-0.9), so the LLM response cache is opt-in:
+    with use_cache, an identical request replays an earlier script that parsed
+    into every requested scene.
+    """
     try:
         if creativity_level == "factual":
             temperature = 0.5
@@ -99,6 +190,11 @@ def generate_script(concept: str, num_scenes: int = 5, creativity_level: str = '
         character_placeholder = trigger_word if trigger_word else "{character}"
         product_placeholder = trigger_word if trigger_word else "{product}"
 
+        last_scene = first_scene + num_scenes - 1
+        numbering_note = ""
+        if first_scene != 1:
+            numbering_note = f"\nNumber the scenes from Scene {first_scene} to Scene {last_scene}.\n"
+
         # System prompt for single character stories or commercials
         if is_commercial:
             system_prompt = f"""You are a creative director making commercials, adverts, or promos for products. Your task is to create scene summaries for a visual commercial, always using the {product_placeholder} keyword instead of any real product name.
@@ -126,7 +222,7 @@ IMPORTANT RULES:
 - NO dialogue, just visual storytelling
 - Each scene should be suitable for image/video generation
 - The commercial must be {description} and focus on the concept: {concept}
-"""
+{numbering_note}"""
             if previous_context:
                 generation_prompt = (
                     f"Previous context (IMPORTANT: carry over any environmental, setting, or character changes, such as weather, ground conditions, mood or environment, into this next scene):\n{previous_context}\n\n"
@@ -161,16 +257,16 @@ IMPORTANT RULES:
 - Include only ONE character throughout the story
 
 Format:
-**Scene 1: "Title of Scene"**  
+**Scene {first_scene}: "Title of Scene"**  
 {character_placeholder} [describe what the character is doing, feeling, or experiencing visually]. [Describe the environment, actions, and visual elements without using any actual character name].
 
-**Scene 2: "Title of Scene"**  
+**Scene {first_scene + 1}: "Title of Scene"**  
 {character_placeholder} [continue the story visually]...
 
 Continue for all {num_scenes} scenes, maintaining visual continuity and using {character_placeholder} throughout.
 
 The story should be {description} and focus on the concept: {concept}
-"""
+{numbering_note}"""
             if previous_context:
                 generation_prompt = (
                     f"Previous context:\n{previous_context}\n\n"
@@ -193,27 +289,14 @@ The story should be {description} and focus on the concept: {concept}
             "max_tokens": 4000
         }
 
-        response = requests.post(
-            f"{NEBIUS_API_BASE}/chat/completions",
-            headers=headers,
-            json=payload,
-        )
-
-        if response.status_code == 200:
-            result = response.json()
-            script_text = result["choices"][0]["message"]["content"]
-            scene_details = extractScenes(script_text)
-            return {
-                "script": script_text, 
-                "temperature": temperature,
-                "scene_details": scene_details,
-                "product_details": {},
-                "project_type": project_type,
-                "trigger_word": trigger_word
-            }
-        else:
+        try:
+            script_text = cached_chat_completion(
+                NEBIUS_API_BASE, headers, payload, use_cache=use_cache,
+                validate=lambda text: not find_missing_scenes(extractScenes(text), first_scene, num_scenes)
+            )
+        except requests.HTTPError as e:
             return {
-                "script": f"API Error {response.status_code}: {response.text}", 
+                "script": str(e), 
                 "character_details": {},
                 "scene_details": [],
                 "product_details": {},
@@ -222,6 +305,31 @@ The story should be {description} and focus on the concept: {concept}
                 "trigger_word": trigger_word
             }
 
+        scene_details = extractScenes(script_text)
+
+        missing = find_missing_scenes(scene_details, first_scene, num_scenes)
+        if missing and repair_missing:
+            repaired = request_missing_scenes(
+                scene_details, missing, concept, system_prompt,
+                character_placeholder if not is_commercial else product_placeholder,
+                temperature, headers, use_cache=use_cache
+            )
+            still_missing = find_missing_scenes(repaired, first_scene, num_scenes)
+            if len(still_missing) < len(missing):
+                # Keep the script text in step with the scenes the repair filled in
+                scene_details, missing = repaired, still_missing
+                script_text = format_script(scene_details)
+
+        return {
+            "script": script_text, 
+            "temperature": temperature,
+            "scene_details": scene_details,
+            "missing_scenes": missing,
+            "product_details": {},
+            "project_type": project_type,
+            "trigger_word": trigger_word
+        }
+
     except Exception as e:
         return {
             "temperature": temperature,
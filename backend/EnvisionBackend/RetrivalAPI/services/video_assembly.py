@@ -0,0 +1,92 @@
+import os
+import subprocess
+import tempfile
+from typing import List, Optional, Tuple
+
+# ffmpeg binary; moviepy already ships one through imageio-ffmpeg
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY')
+
+
+def get_ffmpeg_binary() -> str:
+    """Return the ffmpeg executable to run, preferring FFMPEG_BINARY if set."""
+    if FFMPEG_BINARY:
+        return FFMPEG_BINARY
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def probe_video(video_path: str) -> dict:
+    """Read a clip's metadata (size, duration, fps, ...) from its header without decoding any frames."""
+    import imageio_ffmpeg
+    reader = imageio_ffmpeg.read_frames(video_path)
+    try:
+        return next(reader)
+    finally:
+        reader.close()
+
+
+def probe_video_size(video_path: str) -> Tuple[int, int]:
+    """Read a clip's frame size from its header without decoding any frames."""
+    return tuple(probe_video(video_path)["size"])
+
+
+def run_ffmpeg(args: List[str]) -> None:
+    """
+    Run ffmpeg with the given arguments.
+
+    Raises:
+        RuntimeError: If ffmpeg exits with an error (the tail of stderr is included)
+    """
+    result = subprocess.run(
+        [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace')[-2000:]}")
+
+
+# Encoder arguments used when no encoding profile is given
+DEFAULT_ENCODER_ARGS = ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac"]
+
+
+def assemble_video(clip_paths: List[str], output_path: str, size: Optional[Tuple[int, int]] = None,
+                   encoder_args: Optional[List[str]] = None) -> str:
+    """
+    Concatenate clips into a single mp4 at output_path.
+
+    ffmpeg's concat demuxer reads the clips one after another, so only one
+    input is open at any time and nothing is buffered in Python no matter how
+    many scenes the project has. Clips are scaled and padded to a common size
+    (the first clip's, unless size is given), which matches what
+    concatenate_videoclips(method="compose") used to do. encoder_args
+    replaces the default codec settings (see video_encoding.ENCODING_PROFILES).
+
+    Returns:
+        str: output_path
+    """
+    if not clip_paths:
+        raise ValueError("No clips to assemble")
+
+    width, height = size or probe_video_size(clip_paths[0])
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as concat_list:
+        for clip_path in clip_paths:
+            escaped = os.path.abspath(clip_path).replace("'", "'\\''")
+            concat_list.write(f"file '{escaped}'\n")
+
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", concat_list.name,
+            "-vf", (
+                f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+            ),
+            *(encoder_args or DEFAULT_ENCODER_ARGS),
+            "-movflags", "+faststart",
+            output_path,
+        ])
+    finally:
+        os.unlink(concat_list.name)
+
+    return output_path
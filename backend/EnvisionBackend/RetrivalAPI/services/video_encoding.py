@@ -0,0 +1,163 @@
+import os
+import time
+import tempfile
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+
+from .video_assembly import assemble_video
+from .metrics import observe_stage, span
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process limit
+    fcntl = None
+
+# Load environment variables
+load_dotenv()
+
+# Named encoding profiles for the final libx264/aac encode
+ENCODING_PROFILES = {
+    # Quick previews: cheap to encode, larger and softer output
+    "draft": {"preset": "veryfast", "crf": 30, "audio_bitrate": "96k"},
+    # What the user downloads
+    "final": {"preset": "medium", "crf": 20, "audio_bitrate": "192k"},
+}
+DEFAULT_ENCODING_PROFILE = os.getenv('VIDEO_ENCODE_PROFILE', 'final')
+
+# Keyframe spacing in seconds; keeps HLS segments short when they are stream-copied
+VIDEO_KEYFRAME_INTERVAL = int(os.getenv('VIDEO_KEYFRAME_INTERVAL', 2))
+
+# Threads given to each ffmpeg encode
+VIDEO_ENCODE_THREADS = int(os.getenv('VIDEO_ENCODE_THREADS', 2))
+# Encodes allowed at once on this machine, across all gunicorn workers
+VIDEO_ENCODE_SLOTS = int(os.getenv(
+    'VIDEO_ENCODE_SLOTS', max(1, (os.cpu_count() or 1) // VIDEO_ENCODE_THREADS)
+))
+# How long a request waits for a free slot before giving up (seconds)
+VIDEO_ENCODE_SLOT_TIMEOUT = int(os.getenv('VIDEO_ENCODE_SLOT_TIMEOUT', 600))
+# Scheduling priority of the encoding processes (ffmpeg inherits it)
+VIDEO_ENCODE_NICE = int(os.getenv('VIDEO_ENCODE_NICE', 10))
+VIDEO_ENCODE_LOCK_DIR = os.getenv(
+    'VIDEO_ENCODE_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'envision-encode-slots')
+)
+
+
+def encoder_args_for(profile: str) -> List[str]:
+    """
+    Build the ffmpeg codec arguments for a named profile.
+
+    Raises:
+        ValueError: If the profile is unknown
+    """
+    if profile not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile '{profile}'. Choose from: {', '.join(ENCODING_PROFILES)}")
+    settings = ENCODING_PROFILES[profile]
+    return [
+        "-c:v", "libx264",
+        "-preset", settings["preset"],
+        "-crf", str(settings["crf"]),
+        "-threads", str(VIDEO_ENCODE_THREADS),
+        "-force_key_frames", f"expr:gte(t,n_forced*{VIDEO_KEYFRAME_INTERVAL})",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-b:a", settings["audio_bitrate"],
+    ]
+
+
+def _lower_priority() -> None:
+    """Pool initializer: keep encodes from competing with request handling for CPU."""
+    if VIDEO_ENCODE_NICE and hasattr(os, "nice"):
+        try:
+            os.nice(VIDEO_ENCODE_NICE)
+        except OSError:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local_slots = threading.BoundedSemaphore(VIDEO_ENCODE_SLOTS)
+
+
+def get_encoding_pool() -> ProcessPoolExecutor:
+    """Return this process's encoding pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the web worker has threads and open DB connections
+            _pool = ProcessPoolExecutor(
+                max_workers=VIDEO_ENCODE_SLOTS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority,
+            )
+        return _pool
+
+
+@contextmanager
+def encoding_slot(timeout: int = VIDEO_ENCODE_SLOT_TIMEOUT):
+    """
+    Hold one of the machine-wide encoding slots for the duration of the block.
+
+    Slots are lock files in VIDEO_ENCODE_LOCK_DIR, so the limit holds across
+    every worker process on the node. Locks are released by the OS if a
+    worker dies mid-encode.
+
+    Raises:
+        TimeoutError: If no slot frees up within timeout seconds
+    """
+    if fcntl is None:
+        if not _local_slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a free video encoding slot")
+        try:
+            yield
+        finally:
+            _local_slots.release()
+        return
+
+    os.makedirs(VIDEO_ENCODE_LOCK_DIR, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        for slot in range(VIDEO_ENCODE_SLOTS):
+            fd = os.open(os.path.join(VIDEO_ENCODE_LOCK_DIR, f"slot-{slot}.lock"), os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            return
+        if time.monotonic() >= deadline:
+            raise TimeoutError("Timed out waiting for a free video encoding slot")
+        time.sleep(0.5)
+
+
+def encode_video(clip_paths: List[str], output_path: str, profile: Optional[str] = None,
+                 size: Optional[Tuple[int, int]] = None) -> str:
+    """
+    Assemble and encode clips into output_path in the encoding pool, blocking
+    until it is done. The request thread only waits; the encode itself runs in
+    a separate, lower-priority process once a node-wide slot is free.
+
+    Returns:
+        str: output_path
+
+    Raises:
+        ValueError: If the profile is unknown
+        TimeoutError: If no encoding slot frees up in time
+        RuntimeError: If ffmpeg fails
+    """
+    encoder_args = encoder_args_for(profile or DEFAULT_ENCODING_PROFILE)
+    waiting_since = time.perf_counter()
+    with encoding_slot():
+        # Slot wait and the encode itself are reported as separate stages
+        observe_stage("video.encode_queue", time.perf_counter() - waiting_since)
+        with span("video.encode"):
+            future = get_encoding_pool().submit(assemble_video, clip_paths, output_path, size, encoder_args)
+            return future.result()
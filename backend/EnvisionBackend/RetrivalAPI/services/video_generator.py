@@ -2,15 +2,32 @@ import replicate
 from replicate import Client
 from dotenv import load_dotenv
 import os
-import requests
-import base64
+import hashlib
+import logging
 from typing import Optional
+from .cassettes import recorded
+from .logs import Abbreviated
+from .metrics import PROVIDER_BYTES, span
+from .media import download_to_file
+from .reference_images import prepare_reference_data_uri
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 REPLICATE_KEY = os.getenv('REPLICATE_KEY')
+# Override to point at a different Replicate API (e.g. the fake one from run_fake_providers)
+REPLICATE_BASE_URL = os.getenv('REPLICATE_BASE_URL')
+# Length of each generated clip in seconds
+CLIP_DURATION = 5
 class VideoGenerator:
-    def generate_video(self, prompt: str, ref_image: str) -> str:
-        client = Client(api_token=REPLICATE_KEY)
+    def generate_video(self, prompt: str, ref_image: str) -> Optional[str]:
+        """
+        Generate a clip for one scene.
+
+        Returns:
+            str: Path of the downloaded mp4 (caller removes it), or None on failure
+        """
+        client = Client(api_token=REPLICATE_KEY, base_url=REPLICATE_BASE_URL)
         # model = 'bytedance/seedance-1-pro'
         model = "kwaivgi/kling-v2.5-turbo-pro"
         if not model:
@@ -20,48 +37,53 @@ class VideoGenerator:
         if not ref_image:
             raise ValueError("Reference image is required")
         
-        # Ensure the Base64 string has the correct prefix
-        if not ref_image.startswith("data:image"):
-            ref_image = f"data:image/png;base64,{ref_image}"
+        # Send a downscaled JPEG rather than the full-size PNG (cached per source image)
+        ref_image = prepare_reference_data_uri(ref_image, "kling")
         
         input = {
             'prompt': prompt + ", high quality, no skew, no distortion, detailed, cinematic lighting",
             "starting_image": ref_image,
             # 'image': ref_image,
             # 'duration': 3,
-            'duration': 5,
+            'duration': CLIP_DURATION,
         }
         
-        # Log the input for debugging
-        print("DEBUG: Input to replicate API:", input)
+        # The starting image is redacted to its size
+        logger.debug("Input to Replicate API: %s", Abbreviated(input))
         
-        output = client.run(
-            model,
-            input=input
-        )
-        if not output:
-            raise ValueError("Failed to generate video")
-        
-        if output:
-            if isinstance(output, list):
-                video_url = str(output[0])
+        def run():
+            with span("replicate.prediction"):
+                output = client.run(
+                    model,
+                    input=input
+                )
+            if not output:
+                raise ValueError("Failed to generate video")
+            
+            if output:
+                if isinstance(output, list):
+                    video_url = str(output[0])
+                else:
+                    video_url = str(output)
             else:
-                video_url = str(output)
-        else:
-            print("❌ Failed to generate image")
-            return None
-        video = self._download_and_encode_video(video_url)
-        return video
-    def _download_and_encode_video(self, video_url: str) -> Optional[str]:
-        """Download a video from a URL and return it as a Base64-encoded string."""
+                logger.error("Replicate returned no video")
+                return None
+            return self._download_video(video_url)
+        
+        # Recorded or replayed when PROVIDER_CASSETTE_MODE is set; the starting image is keyed by its hash
+        request = {
+            "model": model,
+            "input": {**input, "starting_image": hashlib.sha256(ref_image.encode('utf-8')).hexdigest()},
+        }
+        return recorded("replicate", request, run, kind="file", suffix=".mp4")
+    def _download_video(self, video_url: str) -> Optional[str]:
+        """Stream a generated video to a temporary file and return its path."""
         try:
-            # Download the video as bytes
-            response = requests.get(video_url, timeout=30)
-            response.raise_for_status()
-            encoded = base64.b64encode(response.content).decode('utf-8')
-            result = f"data:video/mp4;base64,{encoded}"
-            print("✅ Video downloaded and encoded:", video_url)
-            return result
+            with span("replicate.download"):
+                video_path = download_to_file(video_url, suffix=".mp4")
+            PROVIDER_BYTES.inc(os.path.getsize(video_path), provider="replicate")
+            logger.info("Video downloaded: %s", video_url)
+            return video_path
         except Exception as e:
-            print(f"❌ Error downloading/encoding video: {e}")
-            return None
\ No newline at end of file
+            logger.error("Error downloading video %s: %s", video_url, e)
+            return None
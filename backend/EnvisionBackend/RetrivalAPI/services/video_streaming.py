@@ -0,0 +1,56 @@
+import os
+from typing import List
+from dotenv import load_dotenv
+
+from .video_assembly import run_ffmpeg
+from .metrics import timed
+
+# Load environment variables
+load_dotenv()
+
+# Target HLS segment length in seconds. Segments can only be cut on
+# keyframes, so this should be a multiple of VIDEO_KEYFRAME_INTERVAL.
+HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', 4))
+HLS_PLAYLIST_NAME = "index.m3u8"
+
+
+@timed("video.hls")
+def segment_hls(video_path: str, output_dir: str, segment_seconds: int = HLS_SEGMENT_SECONDS) -> List[str]:
+    """
+    Split an mp4 into an HLS VOD playlist and MPEG-TS segments in output_dir.
+
+    The streams are copied, not re-encoded, which is cheap because the final
+    encode already places keyframes every VIDEO_KEYFRAME_INTERVAL seconds. If
+    copying fails (e.g. a codec HLS can't carry), the video is re-encoded
+    once with keyframes on the segment boundaries.
+
+    Returns:
+        list: Names of the files written, segments first and the playlist
+        last, so uploading them in order never publishes a playlist that
+        points at missing segments
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    playlist_path = os.path.join(output_dir, HLS_PLAYLIST_NAME)
+    hls_args = [
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(output_dir, "segment_%04d.ts"),
+        playlist_path,
+    ]
+
+    try:
+        run_ffmpeg(["-i", video_path, "-c", "copy", *hls_args])
+    except RuntimeError:
+        for name in os.listdir(output_dir):
+            os.unlink(os.path.join(output_dir, name))
+        run_ffmpeg([
+            "-i", video_path,
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+            "-c:a", "aac",
+            *hls_args,
+        ])
+
+    segments = sorted(name for name in os.listdir(output_dir) if name.endswith(".ts"))
+    return [*segments, HLS_PLAYLIST_NAME]
@@ -0,0 +1,70 @@
+import os
+from typing import Tuple
+from dotenv import load_dotenv
+
+from .video_assembly import probe_video, run_ffmpeg
+from .metrics import timed
+
+# Load environment variables
+load_dotenv()
+
+# Poster frames are shown as cards in the gallery
+POSTER_WIDTH = int(os.getenv('POSTER_WIDTH', 640))
+# Thumbnail strips are a row of small frames for hover scrubbing
+THUMBNAIL_TILES = int(os.getenv('THUMBNAIL_TILES', 5))
+THUMBNAIL_TILE_WIDTH = int(os.getenv('THUMBNAIL_TILE_WIDTH', 160))
+# JPEG quality on ffmpeg's 2 (best) to 31 (worst) scale
+THUMBNAIL_JPEG_QUALITY = 5
+
+
+def extract_poster(video_path: str, output_path: str, width: int = POSTER_WIDTH) -> str:
+    """
+    Save a single JPEG frame a quarter of the way into the video, which skips
+    the fade-ins and near-identical opening frames providers tend to produce.
+
+    Returns:
+        str: output_path
+    """
+    duration = probe_video(video_path).get("duration") or 0
+    run_ffmpeg([
+        "-ss", f"{duration * 0.25:.3f}", "-i", video_path,
+        "-frames:v", "1",
+        "-vf", f"scale='min({width},iw)':-2",
+        "-q:v", str(THUMBNAIL_JPEG_QUALITY),
+        output_path,
+    ])
+    return output_path
+
+
+def extract_thumbnail_strip(video_path: str, output_path: str, tiles: int = THUMBNAIL_TILES,
+                            tile_width: int = THUMBNAIL_TILE_WIDTH) -> str:
+    """
+    Save a single JPEG with `tiles` evenly spaced frames side by side.
+    ffmpeg samples, scales and tiles the frames in one decode pass.
+
+    Returns:
+        str: output_path
+    """
+    duration = probe_video(video_path).get("duration") or 1
+    run_ffmpeg([
+        "-i", video_path,
+        "-vf", f"fps={tiles}/{duration:.3f},scale={tile_width}:-2,tile={tiles}x1",
+        "-frames:v", "1",
+        "-q:v", str(THUMBNAIL_JPEG_QUALITY),
+        output_path,
+    ])
+    return output_path
+
+
+@timed("video.thumbnails")
+def extract_thumbnails(video_path: str, work_dir: str) -> Tuple[str, str]:
+    """
+    Extract the poster frame and thumbnail strip for a video into work_dir.
+
+    Returns:
+        tuple: (poster_path, thumbnail_strip_path)
+    """
+    return (
+        extract_poster(video_path, os.path.join(work_dir, "poster.jpg")),
+        extract_thumbnail_strip(video_path, os.path.join(work_dir, "strip.jpg")),
+    )
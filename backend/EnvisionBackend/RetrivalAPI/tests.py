@@ -1,3 +1,1824 @@
-from django.test import TestCase
+import io
+import os
+import json
+import time
+import base64
+import shutil
+import pstats
+import logging
+import tempfile
+import importlib
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+# The LLM services refuse to import without a key; tests never reach the API
+os.environ.setdefault("NEBIUS_API_KEY", "test-key")
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from PIL import Image
+
+from . import admin, main, models, serializers, urls, views
+from .management.commands import benchmark_pipeline
+from .services import cassettes, comfyUIservices, fake_providers, logs, media, metrics, profiling, reference_images, script_generation, video_generator
+from .services.image_prompt_generation import video_prompt_source
+from .services import llm_cache
+from .services.llm_cache import FileSystemCache, LRUCache, TieredCache
+from .services.video_assembly import probe_video_size, run_ffmpeg
+
+
+def make_test_clip(path, seconds=1, size="320x240"):
+    """Render a short lossless (so deliberately large) test clip with ffmpeg."""
+    run_ffmpeg([
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=25", "-t", str(seconds),
+        "-c:v", "libx264", "-qp", "0", "-pix_fmt", "yuv420p", path,
+    ])
+    return path
+
+
+def make_test_image(size=(640, 360), color="teal"):
+    """Return a small PNG as a data URI, the way scene images are stored."""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+class FakeVideoGenerator:
+    """Stands in for the Replicate client by handing out copies of a pre-rendered clip."""
+    source_clip = None
+
+    def generate_video(self, prompt, ref_image):
+        fd, path = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+        shutil.copyfile(self.source_clip, path)
+        return path
+
+
+class VideoAssemblyMemoryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.work_dir = tempfile.mkdtemp()
+        FakeVideoGenerator.source_clip = make_test_clip(os.path.join(cls.work_dir, "clip.mp4"))
+        cls.clip_size = os.path.getsize(FakeVideoGenerator.source_clip)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user("video-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _make_project(self, num_scenes):
+        project = models.Project.objects.create(
+            user=self.user, title=f"{num_scenes} scenes", concept="a walk", num_scenes=num_scenes
+        )
+        for n in range(1, num_scenes + 1):
+            models.Scene.objects.create(
+                project=project, scene_number=n, title=f"Scene {n}", script="walking",
+                image_prompt="a walk", video_prompt="a slow walk",
+                video_prompt_source=video_prompt_source("a walk"),
+                image="data:image/png;base64,AAAA",
+            )
+        return project
+
+    def _peak_memory_for(self, num_scenes):
+        project = self._make_project(num_scenes)
+        tracemalloc.start()
+        try:
+            response = self.client.post("/api/generate-video/", {"project_id": str(project.id)}, format="json")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(response.status_code, 200, response.data)
+        return peak
+
+    def test_peak_memory_stays_flat_as_scene_count_grows(self):
+        with override_settings(MEDIA_ROOT=self.work_dir), \
+                mock.patch.object(views, "VideoGenerator", FakeVideoGenerator):
+            self._peak_memory_for(1)  # warm up imports, URL resolution and query compilation
+            small = self._peak_memory_for(2)
+            large = self._peak_memory_for(12)
+
+        # Ten extra scenes must cost less than holding a single clip in memory would
+        self.assertLess(large - small, self.clip_size)
+
+    def test_render_stores_posters_and_thumbnail_strips(self):
+        project = self._make_project(2)
+        with override_settings(MEDIA_ROOT=self.work_dir), \
+                mock.patch.object(views, "VideoGenerator", FakeVideoGenerator):
+            response = self.client.post("/api/generate-video/", {"project_id": str(project.id)}, format="json")
+            self.assertEqual(response.status_code, 200, response.data)
+            listing = self.client.post("/api/list-projects/", {}, format="json")
+
+        project.refresh_from_db()
+        for owner in [project, *project.scenes.all()]:
+            for field in (owner.poster, owner.thumbnail_strip):
+                path = os.path.join(self.work_dir, field.name)
+                # Kilobytes, not the clip's size
+                self.assertLess(os.path.getsize(path), self.clip_size / 4)
+        listed = listing.data[0]
+        self.assertTrue(listed["poster_url"].endswith(project.poster.url))
+        self.assertTrue(listed["thumbnail_strip_url"].endswith(project.thumbnail_strip.url))
+
+    def test_hls_output_is_stored_next_to_the_mp4(self):
+        project = self._make_project(3)
+        with override_settings(MEDIA_ROOT=self.work_dir), \
+                mock.patch.object(views, "VideoGenerator", FakeVideoGenerator):
+            response = self.client.post(
+                "/api/generate-video/", {"project_id": str(project.id), "hls": True}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        project.refresh_from_db()
+        self.assertTrue(response.data["hls_url"].endswith(project.hls_playlist.url))
+        playlist_path = os.path.join(self.work_dir, project.hls_playlist.name)
+        with open(playlist_path) as f:
+            segments = [line.strip() for line in f if line.strip().endswith(".ts")]
+        self.assertTrue(segments)
+        for segment in segments:
+            self.assertTrue(os.path.exists(os.path.join(os.path.dirname(playlist_path), segment)))
+
+
+def fake_segment_hls(video_path, output_dir):
+    names = ["segment_0000.ts", "segment_0001.ts", "index.m3u8"]
+    for name in names:
+        with open(os.path.join(output_dir, name), "w") as f:
+            f.write(name)
+    return names
+
+
+class HlsStorageTests(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        media_root = override_settings(MEDIA_ROOT=self.work_dir)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        patcher = mock.patch.object(views, "segment_hls", side_effect=fake_segment_hls)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = User.objects.create_user("hls-user", password="test-password")
+        self.project = models.Project.objects.create(user=user, title="t", concept="c", num_scenes=1)
+
+    def render_files(self, playlist_name):
+        render_dir = os.path.join(self.work_dir, os.path.dirname(playlist_name))
+        return sorted(os.listdir(render_dir)) if os.path.isdir(render_dir) else []
+
+    def test_rerender_uploads_to_a_new_prefix_before_removing_the_old_one(self):
+        views.store_project_hls(self.project, "final.mp4")
+        old_playlist = self.project.hls_playlist.name
+        old_path = os.path.join(self.work_dir, old_playlist)
+        save = views.default_storage.save
+
+        def save_while_old_render_is_live(name, content):
+            self.assertTrue(os.path.exists(old_path))
+            return save(name, content)
+
+        with mock.patch.object(views.default_storage, "save", side_effect=save_while_old_render_is_live):
+            views.store_project_hls(self.project, "final.mp4")
+
+        self.assertNotEqual(os.path.dirname(self.project.hls_playlist.name), os.path.dirname(old_playlist))
+        self.assertEqual(self.render_files(old_playlist), [])
+        self.assertEqual(self.render_files(self.project.hls_playlist.name),
+                         ["index.m3u8", "segment_0000.ts", "segment_0001.ts"])
+
+    def test_renamed_upload_fails_and_keeps_the_old_render(self):
+        views.store_project_hls(self.project, "final.mp4")
+        old_playlist = self.project.hls_playlist.name
+        save = views.default_storage.save
+
+        def save_with_collision(name, content):
+            # What a storage backend does when the name is already taken
+            return save(name.replace("index", "index_x7") if name.endswith(".m3u8") else name, content)
+
+        with mock.patch.object(views.default_storage, "save", side_effect=save_with_collision), \
+                self.assertRaises(RuntimeError):
+            views.store_project_hls(self.project, "final.mp4")
+
+        self.assertEqual(self.project.hls_playlist.name, old_playlist)
+        self.assertEqual(self.render_files(old_playlist), ["index.m3u8", "segment_0000.ts", "segment_0001.ts"])
+        # The partial upload is removed
+        project_dir = os.path.join(self.work_dir, "hls", str(self.project.id))
+        for render_id in os.listdir(project_dir):
+            if render_id != os.path.basename(os.path.dirname(old_playlist)):
+                self.assertEqual(os.listdir(os.path.join(project_dir, render_id)), [])
+
+
+class PreviewRenderTests(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        self.user = User.objects.create_user("preview-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = models.Project.objects.create(
+            user=self.user, title="preview", concept="a walk", num_scenes=3
+        )
+        for n, color in enumerate(["teal", "orange", "navy"], start=1):
+            models.Scene.objects.create(
+                project=self.project, scene_number=n, title=f"Scene {n}", script="walking",
+                image=make_test_image(color=color),
+            )
+
+    def test_preview_mode_renders_locally_without_the_provider(self):
+        with override_settings(MEDIA_ROOT=self.work_dir), \
+                mock.patch.object(views, "VideoGenerator") as generator:
+            response = self.client.post(
+                "/api/generate-video/", {"project_id": str(self.project.id), "mode": "preview"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["mode"], "preview")
+        generator.assert_not_called()
+        self.project.refresh_from_db()
+        preview_path = os.path.join(self.work_dir, self.project.preview_file.name)
+        self.assertEqual(probe_video_size(preview_path), (480, 270))
+
+    def test_preview_requires_every_scene_image(self):
+        models.Scene.objects.filter(project=self.project, scene_number=2).update(image="")
+        response = self.client.post(
+            "/api/generate-video/", {"project_id": str(self.project.id), "mode": "preview"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        self.user = User.objects.create_user("image-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = models.Project.objects.create(
+            user=self.user, title="images", concept="a walk", num_scenes=2
+        )
+        for n in (1, 2):
+            models.Scene.objects.create(
+                project=self.project, scene_number=n, title=f"Scene {n}", script="walking", image_prompt="a walk"
+            )
+        buffer = io.BytesIO()
+        Image.effect_mandelbrot((1024, 1024), (-2, -1.5, 1, 1.5), 64).convert("RGB").save(buffer, "PNG")
+        self.png = buffer.getvalue()
+
+    def _generate(self, query=""):
+        with override_settings(MEDIA_ROOT=self.work_dir), \
+                mock.patch.object(views, "generate_image_prompts", return_value={}), \
+                mock.patch.object(views, "fetch_image_from_comfy", return_value=self.png):
+            return self.client.post(
+                f"/api/generate-images/{query}", {"project_id": str(self.project.id)}, format="json"
+            )
+
+    def test_variant_query_returns_small_resized_copies(self):
+        response = self._generate("?variant=webp_256")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        for scene_data in response.data["data"]["scenes"]:
+            url = scene_data["image"]
+            self.assertTrue(url.endswith(".webp"), url)
+            path = os.path.join(self.work_dir, url.split("/media/", 1)[1])
+            with Image.open(path) as image:
+                self.assertEqual(image.width, 256)
+            self.assertLess(os.path.getsize(path) * 10, len(self.png))
+
+        # The original is still stored and returned by default
+        scene = models.Scene.objects.get(project=self.project, scene_number=1)
+        self.assertTrue(scene.image.startswith("data:image/png;base64,"))
+        self.assertEqual(self._generate().data["data"]["scenes"][0]["image"], scene.image)
+
+    def test_unknown_variant_is_rejected(self):
+        response = self._generate("?variant=gif_99")
+        self.assertEqual(response.status_code, 400)
+
+    def stored_variants(self, scene):
+        return {name: os.path.join(self.work_dir, path) for name, path in scene.image_variants.items()}
+
+    def test_old_variants_are_deleted_after_the_new_image_is_saved(self):
+        scene = models.Scene.objects.get(project=self.project, scene_number=1)
+        with override_settings(MEDIA_ROOT=self.work_dir):
+            with self.captureOnCommitCallbacks(execute=True):
+                views.save_scene_image(scene, self.png)
+            old = self.stored_variants(scene)
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                views.save_scene_image(scene, self.png)
+                # Not yet committed: the old files are still there
+                self.assertTrue(all(os.path.exists(path) for path in old.values()))
+            for callback in callbacks:
+                callback()
+
+        new = self.stored_variants(scene)
+        self.assertNotEqual(old, new)
+        self.assertFalse(any(os.path.exists(path) for path in old.values()))
+        self.assertTrue(all(os.path.exists(path) for path in new.values()))
+        scene.refresh_from_db()
+        self.assertEqual(self.stored_variants(scene), new)
+
+    def test_failed_save_keeps_the_old_variants(self):
+        scene = models.Scene.objects.get(project=self.project, scene_number=1)
+        with override_settings(MEDIA_ROOT=self.work_dir):
+            with self.captureOnCommitCallbacks(execute=True):
+                views.save_scene_image(scene, self.png)
+            old = self.stored_variants(scene)
+            with mock.patch.object(scene, "save", side_effect=RuntimeError("database went away")), \
+                    self.assertRaises(RuntimeError):
+                views.save_scene_image(scene, self.png)
+
+        self.assertTrue(all(os.path.exists(path) for path in old.values()))
+        # Only the old variants are left on disk
+        stored = {os.path.join(self.work_dir, "scenes", str(scene.id), name)
+                  for name in os.listdir(os.path.join(self.work_dir, "scenes", str(scene.id)))}
+        self.assertEqual(stored, set(old.values()))
+        scene.refresh_from_db()
+        self.assertEqual(self.stored_variants(scene), old)
+
+    def test_project_detail_lists_variant_urls(self):
+        self._generate()
+        with override_settings(MEDIA_ROOT=self.work_dir):
+            response = self.client.post("/api/project/scenes/", {
+                "project_id": str(self.project.id), "scene_include": ["image_variants"]
+            }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        variants = response.data["project"]["scenes"][0]["image_variants"]
+        self.assertIn("webp_256", variants)
+        for url in variants.values():
+            self.assertTrue(url.startswith("http://testserver/media/scenes/"), url)
+
+    def test_project_views_honour_the_variant_query(self):
+        self._generate()
+        with override_settings(MEDIA_ROOT=self.work_dir):
+            original = self.client.post("/api/project/scenes/", {
+                "project_id": str(self.project.id), "scene_include": ["image"]
+            }, format="json")
+            detail = self.client.post("/api/project/scenes/?variant=webp_256", {
+                "project_id": str(self.project.id), "scene_include": ["image"]
+            }, format="json")
+            project_status = self.client.get(
+                f"/api/project-status/{self.project.id}/?variant=webp_256&scene_include=image"
+            )
+            rejected = self.client.get(f"/api/project-status/{self.project.id}/?variant=gif_99")
+
+        self.assertTrue(original.data["project"]["scenes"][0]["image"].startswith("data:image/png;base64,"))
+        for response in (detail, project_status):
+            self.assertEqual(response.status_code, 200, response.data)
+            for scene in response.data["project"]["scenes"]:
+                self.assertTrue(scene["image"].endswith(".webp"), scene["image"])
+        self.assertLess(len(detail.content) * 10, len(original.content))
+        self.assertEqual(rejected.status_code, 400)
+
+
+class MediaTests(TestCase):
+    def decode(self, text, chunk_size=8):
+        out = io.BytesIO()
+        written = media.decode_base64_to(text, out, chunk_size=chunk_size)
+        self.assertEqual(written, len(out.getvalue()))
+        return out.getvalue()
+
+    def test_decode_base64_to_decodes_across_chunks(self):
+        payload = bytes(range(256)) * 3
+        encoded = base64.b64encode(payload).decode("ascii")
+        for chunk_size in (4, 6, 8, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.decode(encoded, chunk_size), payload)
+        # Whitespace (line-wrapped base64) straddling chunk boundaries is skipped
+        wrapped = "\n".join(encoded[i:i + 7] for i in range(0, len(encoded), 7))
+        self.assertEqual(self.decode(wrapped), payload)
+
+    def test_decode_base64_to_handles_padding(self):
+        for payload in (b"a", b"ab", b"abc", b"abcd"):
+            encoded = base64.b64encode(payload).decode("ascii")
+            with self.subTest(payload=payload):
+                self.assertEqual(self.decode(encoded), payload)
+                self.assertEqual(self.decode(encoded.rstrip("=")), payload)
+
+    def test_decode_base64_to_decodes_data_uri_payload(self):
+        mime_type, data = media.decode_data_uri("data:image/png;base64," + base64.b64encode(b"png bytes").decode())
+        self.assertEqual((mime_type, data), ("image/png", b"png bytes"))
+
+    def test_decode_base64_to_rejects_malformed_input(self):
+        for text in ("abc!defg", "YWJj=YWJj", "YQ==YWJj", "YWJjZ", "data:image/png,YWJj"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                media.decode_data_uri(text) if text.startswith("data:") else self.decode(text, chunk_size=4)
+
+
+class FakeDownload:
+    """A streamed requests response whose body can break off after `drop_after` bytes."""
+
+    def __init__(self, body, status_code=200, drop_after=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {"Content-Length": str(len(body))}
+        self.drop_after = drop_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        end = len(self.body) if self.drop_after is None else self.drop_after
+        for start in range(0, end, chunk_size):
+            yield self.body[start:min(start + chunk_size, end)]
+        if self.drop_after is not None:
+            raise requests.ConnectionError("connection reset")
+
+
+class DownloadResumeTests(TestCase):
+    body = bytes(range(256)) * 40
+
+    def download(self, *responses):
+        with mock.patch.object(media.requests, "get", side_effect=list(responses)) as get, \
+                mock.patch.object(media.time, "sleep"):
+            path = media.download_to_file("https://example.com/clip.mp4", suffix=".mp4", chunk_size=1000)
+        self.addCleanup(os.unlink, path)
+        with open(path, "rb") as f:
+            return f.read(), get
+
+    def test_resumes_with_a_range_request_after_a_dropped_connection(self):
+        data, get = self.download(
+            FakeDownload(self.body, drop_after=3000),
+            FakeDownload(self.body[3000:], status_code=206),
+        )
+        self.assertEqual(data, self.body)
+        self.assertEqual(get.call_args_list[1].kwargs["headers"], {"Range": "bytes=3000-"})
+
+    def test_restarts_when_the_server_ignores_range(self):
+        data, get = self.download(
+            FakeDownload(self.body, drop_after=3000),
+            FakeDownload(self.body, status_code=200),
+        )
+        # The partial bytes are discarded, not duplicated
+        self.assertEqual(data, self.body)
+        self.assertEqual(get.call_args_list[1].kwargs["headers"], {"Range": "bytes=3000-"})
+
+    def test_gives_up_and_removes_the_partial_file(self):
+        created = []
+        named_temporary_file = tempfile.NamedTemporaryFile
+
+        def track(*args, **kwargs):
+            temp_file = named_temporary_file(*args, **kwargs)
+            created.append(temp_file.name)
+            return temp_file
+
+        with mock.patch.object(media.requests, "get",
+                               side_effect=lambda *a, **k: FakeDownload(self.body, drop_after=10)), \
+                mock.patch.object(media.time, "sleep"), \
+                mock.patch.object(media.tempfile, "NamedTemporaryFile", side_effect=track), \
+                self.assertRaises(requests.ConnectionError):
+            media.download_to_file("https://example.com/clip.mp4", max_retries=2)
+        self.assertFalse(os.path.exists(created[0]))
+
+
+class FailingVideoGenerator(FakeVideoGenerator):
+    """Hands out a clip for the first scene and fails on the second."""
+    clips = []
+
+    def generate_video(self, prompt, ref_image):
+        if self.clips:
+            raise RuntimeError("provider error")
+        path = super().generate_video(prompt, ref_image)
+        self.clips.append(path)
+        return path
+
+
+class FailedRenderCleanupTests(TestCase):
+    def test_clips_from_earlier_scenes_are_removed_when_a_later_scene_fails(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, True)
+        FakeVideoGenerator.source_clip = os.path.join(work_dir, "clip.mp4")
+        with open(FakeVideoGenerator.source_clip, "wb") as f:
+            f.write(b"not really a video")
+        user = User.objects.create_user("failed-render-user", password="test-password")
+        project = models.Project.objects.create(user=user, title="t", concept="c", num_scenes=2)
+        for n in (1, 2):
+            models.Scene.objects.create(
+                project=project, scene_number=n, title=f"Scene {n}", script="walking", image_prompt="a walk",
+                video_prompt="a slow walk", video_prompt_source=video_prompt_source("a walk"),
+            )
+        client = APIClient()
+        client.force_authenticate(user)
+        FailingVideoGenerator.clips = []
+        with mock.patch.object(views, "VideoGenerator", FailingVideoGenerator):
+            response = client.post("/api/generate-video/", {"project_id": str(project.id)}, format="json")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(FailingVideoGenerator.clips), 1)
+        self.assertFalse(os.path.exists(FailingVideoGenerator.clips[0]))
+
+
+class ReferenceImageTests(TestCase):
+    def setUp(self):
+        reference_images.set_reference_cache(LRUCache())
+        self.addCleanup(reference_images.set_reference_cache, None)
+        self.image = make_test_image(size=(1024, 1024))
+
+    def test_reference_image_is_downscaled_jpeg(self):
+        prepared = reference_images.prepare_reference_image(self.image, "wan")
+        with Image.open(io.BytesIO(base64.b64decode(prepared))) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (832, 832))
+
+    def test_unchanged_scene_image_is_prepared_once(self):
+        with mock.patch.object(
+            reference_images, "encode_reference_image", wraps=reference_images.encode_reference_image
+        ) as encode:
+            first = reference_images.prepare_reference_data_uri(self.image, "kling")
+            second = reference_images.prepare_reference_data_uri(self.image, "kling")
+        self.assertEqual(first, second)
+        self.assertEqual(encode.call_count, 1)
+
+
+class CharacterImageTests(TestCase):
+    def _upload(self, mode, size, name):
+        buffer = io.BytesIO()
+        Image.new(mode, size, "teal").save(buffer, "PNG")
+        # Uploads are often mislabelled; the real type comes from the content
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_is_normalized_and_thumbnailed(self):
+        character = models.Character.objects.create(
+            name="Merida", trigger_word="merida", image_file=self._upload("RGB", (3000, 2000), "merida.jpg")
+        )
+        self.assertTrue(character.image.startswith("data:image/jpeg;base64,"))
+        with Image.open(io.BytesIO(base64.b64decode(character.image.split(",", 1)[1]))) as image:
+            self.assertEqual(image.size, (1536, 1024))
+        self.assertTrue(character.thumbnail.startswith("data:image/webp;base64,"))
+
+        transparent = models.Character.objects.create(
+            name="Ghost", trigger_word="ghost", image_file=self._upload("RGBA", (64, 64), "ghost.jpg")
+        )
+        self.assertTrue(transparent.image.startswith("data:image/png;base64,"))
+
+    def test_character_list_serves_thumbnails_only(self):
+        models.Character.objects.create(
+            name="Merida", trigger_word="merida", image_file=self._upload("RGB", (800, 800), "merida.png")
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("picker", password="test-password"))
+
+        response = client.get("/api/get-all-characters/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data[0]), {"name", "trigger_word", "thumbnail", "image"})
+        self.assertLess(len(response.data[0]["thumbnail"]), 20_000)
+        # "image" is kept as an alias of the thumbnail for clients that haven't switched yet
+        self.assertEqual(response.data[0]["image"], response.data[0]["thumbnail"])
+
+    def test_thumbnail_follows_image_changes(self):
+        character = models.Character.objects.create(
+            name="Merida", trigger_word="merida", image=make_test_image((800, 400))
+        )
+        character = models.Character.objects.get(pk=character.pk)
+        original = character.thumbnail
+
+        character.image = make_test_image((400, 800))
+        character.save(update_fields=["image"])
+        character.refresh_from_db()
+        self.assertNotEqual(character.thumbnail, original)
+        with Image.open(io.BytesIO(base64.b64decode(character.thumbnail.split(",", 1)[1]))) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 256))
+
+        # An image that can't be decoded leaves no thumbnail rather than a stale one
+        character.image = "data:image/png;base64,AAAA"
+        character.save()
+        self.assertEqual(models.Character.objects.get(pk=character.pk).thumbnail, "")
+
+    def test_saving_without_image_changes_keeps_the_thumbnail(self):
+        models.Character.objects.create(
+            name="Merida", trigger_word="merida", image=make_test_image(), thumbnail="data:image/webp;base64,kept"
+        )
+        # The admin list defers the full image
+        character = models.Character.objects.defer("image").get(trigger_word="merida")
+        character.name = "Merida of DunBroch"
+        character.save()
+        self.assertEqual(models.Character.objects.get(pk=character.pk).thumbnail, "data:image/webp;base64,kept")
+
+    def test_admin_form_rejects_undecodable_uploads(self):
+        upload = SimpleUploadedFile("merida.png", b"\x89PNG\r\n\x1a\nnot really", content_type="image/png")
+        form = admin.CharacterAdminForm(
+            data={"name": "Merida", "trigger_word": "merida"}, files={"image_file": upload}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("image_file", form.errors)
+
+        form = admin.CharacterAdminForm(
+            data={"name": "Merida", "trigger_word": "merida"},
+            files={"image_file": self._upload("RGB", (64, 64), "merida.png")},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertTrue(form.save().thumbnail.startswith("data:image/webp;base64,"))
+
+    def test_serializer_rejects_undecodable_images(self):
+        serializer = serializers.CharacterSerializer(
+            data={"name": "Merida", "trigger_word": "merida", "image": "data:image/png;base64,AAAA"}
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("image", serializer.errors)
+
+        serializer = serializers.CharacterSerializer(
+            data={"name": "Merida", "trigger_word": "merida", "image": make_test_image()}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_backfill_migration_thumbnails_existing_characters(self):
+        migration = importlib.import_module("RetrivalAPI.migrations.0024_backfill_character_thumbnails")
+        models.Character.objects.create(name="Merida", trigger_word="merida", image=make_test_image((800, 400)))
+        models.Character.objects.create(name="Broken", trigger_word="broken", image="data:image/png;base64,AAAA")
+        models.Character.objects.update(thumbnail="")
+
+        migration.backfill_thumbnails(django_apps, None)
+
+        merida = models.Character.objects.get(trigger_word="merida")
+        with Image.open(io.BytesIO(base64.b64decode(merida.thumbnail.split(",", 1)[1]))) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ("WEBP", (256, 128)))
+        self.assertEqual(models.Character.objects.get(trigger_word="broken").thumbnail, "")
+
+
+class FakeProviderTests(TestCase):
+    """The fake provider servers against the real client code, with no latency."""
+
+    def setUp(self):
+        self.behaviours = {
+            provider: fake_providers.ProviderBehaviour(payload=(64, 64) if provider != "nebius" else (5, 5))
+            for provider in fake_providers.FAKE_PROVIDERS
+        }
+        self.servers = fake_providers.start_fake_providers(port=0, behaviours=self.behaviours)
+        self.addCleanup(fake_providers.stop_fake_providers, self.servers)
+        env = fake_providers.provider_environment(self.servers)
+        for target, name, value in [
+            (comfyUIservices, "server_address", env["COMFYUI_SERVER_ADDRESS"]),
+            (script_generation, "NEBIUS_API_BASE", env["NEBIUS_API_BASE"]),
+            (video_generator, "REPLICATE_BASE_URL", env["REPLICATE_BASE_URL"]),
+            (video_generator, "REPLICATE_KEY", "test-key"),
+            (views, "RUNPOD_API_BASE", env["RUNPOD_API_BASE"]),
+        ]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_comfyui_image_over_websocket(self):
+        image = Image.open(io.BytesIO(comfyUIservices.fetch_image_from_comfy("a lighthouse")))
+        self.assertEqual(image.size, (64, 64))
+
+    def test_comfyui_failure_raises(self):
+        self.behaviours["comfyui"].failure_rate = 1
+        with self.assertRaises(Exception):
+            comfyUIservices.fetch_image_from_comfy("a lighthouse")
+
+    def test_nebius_script_has_requested_scenes(self):
+        result = script_generation.generate_script("a lighthouse keeper", 4, use_cache=False)
+        self.assertEqual([s["scene_number"] for s in result["scene_details"]], [1, 2, 3, 4])
+
+    def test_replicate_prediction_downloads_clip(self):
+        path = video_generator.VideoGenerator().generate_video("waves", make_test_image())
+        self.addCleanup(os.remove, path)
+        self.assertEqual(probe_video_size(path), (112, 64))
+
+    def test_runpod_job_completes(self):
+        self.behaviours["runpod"].latency = (0.2, 0.2)
+        response = requests.post(f"{views.RUNPOD_API_BASE}/run", json={"input": {}})
+        result = views.poll_status_and_hit_api(response.json()["id"], delay=0.1)
+        self.assertEqual(result["status"], "COMPLETED")
+        self.assertTrue(result["output"][0].endswith(".mp4"))
+
+
+class FakeLLMPromptTests(TestCase):
+    """
+    The fake Nebius server reads the wanted scene numbers out of the prompt text.
+    These build each prompt with the production code so a wording change that
+    the parser no longer understands fails here, not in a load test.
+    """
+
+    def scenes(self, *numbers):
+        return [{"scene_number": n, "title": f"Scene {n}", "story": f"story {n}", "script": f"story {n}"}
+                for n in numbers]
+
+    def user_prompt(self, payload):
+        return next(m["content"] for m in payload["messages"] if m["role"] == "user")
+
+    def script_prompts(self, call):
+        with mock.patch.object(script_generation, "cached_chat_completion", return_value="") as llm:
+            call()
+        return [self.user_prompt(c.args[2]) for c in llm.call_args_list]
+
+    def main_prompts(self, call):
+        response = mock.Mock(**{"json.return_value": {"choices": [{"message": {"content": ""}}]}})
+        with mock.patch.dict(os.environ, {"NEBIUS_API_BASE": "http://nebius.test"}), \
+                mock.patch.object(requests, "post", return_value=response) as post:
+            call()
+        return [self.user_prompt(c.kwargs["json"]) for c in post.call_args_list]
+
+    def test_script_prompt(self):
+        prompt, = self.script_prompts(lambda: script_generation.generate_script("a walk", 4, repair_missing=False))
+        self.assertEqual(fake_providers.requested_scene_numbers(prompt), [1, 2, 3, 4])
+
+    def test_continued_script_prompt(self):
+        prompt, = self.script_prompts(lambda: script_generation.generate_script(
+            "a walk", 3, trigger_word="merida", first_scene=5, repair_missing=False
+        ))
+        self.assertEqual(fake_providers.requested_scene_numbers(prompt), [5, 6, 7])
+
+    def test_missing_scene_prompt(self):
+        prompt, = self.script_prompts(lambda: script_generation.request_missing_scenes(
+            self.scenes(1, 3), [2, 4], "a walk", "system", "merida", 0.7, {}
+        ))
+        self.assertEqual(fake_providers.requested_scene_numbers(prompt), [2, 4])
+
+    def test_single_scene_rewrite_prompt(self):
+        state = {"concept": "a walk", "scenes": self.scenes(1, 2, 3), "scene_to_edit": 2,
+                 "rewrite_instructions": "make it rain", "trigger_word": "merida"}
+        prompt = self.main_prompts(lambda: main.rewrite_single_scene(state))[0]
+        self.assertEqual(fake_providers.requested_scene_numbers(prompt), [2])
+
+    def test_rewrite_all_prompt(self):
+        state = {"concept": "a walk", "scenes": self.scenes(1, 2, 3), "windowed_rewrite": False,
+                 "rewrite_instructions": "make it rain", "trigger_word": "merida"}
+        prompt, = self.main_prompts(lambda: main.rewrite_all_scenes(state))
+        self.assertEqual(fake_providers.requested_scene_numbers(prompt), [1, 2, 3])
+
+    def test_rewrite_window_prompt(self):
+        window = {"before": self.scenes(3), "targets": self.scenes(4, 5, 6), "after": self.scenes(7)}
+        prompt, = self.main_prompts(lambda: main._rewrite_window(
+            {"concept": "a walk"}, window, 10, "system", "make it rain", "merida", "key", "http://nebius.test"
+        ))
+        self.assertEqual(fake_providers.requested_scene_numbers(prompt), [4, 5, 6])
+
+
+class CassetteTests(TestCase):
+    """Provider calls recorded against the fake servers replay with the servers gone."""
+
+    def setUp(self):
+        self.cassette_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cassette_dir, ignore_errors=True)
+        self.servers = fake_providers.start_fake_providers(port=0, behaviours={
+            provider: fake_providers.ProviderBehaviour(latency=(0.2, 0.2), payload=(64, 64) if provider != "nebius" else (5, 5))
+            for provider in fake_providers.FAKE_PROVIDERS
+        })
+        self.addCleanup(fake_providers.stop_fake_providers, self.servers)
+        env = fake_providers.provider_environment(self.servers)
+        for target, name, value in [
+            (cassettes, "PROVIDER_CASSETTE_DIR", self.cassette_dir),
+            (cassettes, "PROVIDER_CASSETTE_MODE", "record"),
+            (cassettes, "PROVIDER_CASSETTE_TIME_SCALE", 1.0),
+            (comfyUIservices, "server_address", env["COMFYUI_SERVER_ADDRESS"]),
+            (video_generator, "REPLICATE_BASE_URL", env["REPLICATE_BASE_URL"]),
+            (video_generator, "REPLICATE_KEY", "test-key"),
+        ]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.nebius_base = env["NEBIUS_API_BASE"]
+        self.payload = {"model": "m", "messages": [{"role": "system", "content": "s"}, {"role": "user", "content": "hi"}]}
+
+    def replay(self, scale=0.0, match="exact"):
+        fake_providers.stop_fake_providers(self.servers)
+        self.servers = {}
+        cassettes.PROVIDER_CASSETTE_MODE = "replay"
+        cassettes.PROVIDER_CASSETTE_TIME_SCALE = scale
+        cassettes.PROVIDER_CASSETTE_MATCH = match
+        self.addCleanup(setattr, cassettes, "PROVIDER_CASSETTE_MATCH", "exact")
+
+    def test_llm_image_and_video_replay(self):
+        text = llm_cache.cached_chat_completion(self.nebius_base, {}, self.payload, use_cache=False)
+        image = comfyUIservices.fetch_image_from_comfy("a lighthouse")
+        clip = video_generator.VideoGenerator().generate_video("waves", make_test_image())
+        self.addCleanup(os.remove, clip)
+
+        self.replay()
+        self.assertEqual(llm_cache.cached_chat_completion(self.nebius_base, {}, self.payload, use_cache=False), text)
+        self.assertEqual(comfyUIservices.fetch_image_from_comfy("a lighthouse"), image)
+        replayed = video_generator.VideoGenerator().generate_video("waves", make_test_image())
+        self.addCleanup(os.remove, replayed)
+        self.assertNotEqual(replayed, clip)
+        with open(clip, "rb") as original, open(replayed, "rb") as copy:
+            self.assertEqual(original.read(), copy.read())
+
+    def test_replay_keeps_recorded_timing_scaled(self):
+        llm_cache.cached_chat_completion(self.nebius_base, {}, self.payload, use_cache=False)
+        self.replay(scale=0.5)
+        started = time.perf_counter()
+        llm_cache.cached_chat_completion(self.nebius_base, {}, self.payload, use_cache=False)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+
+    def test_replay_miss(self):
+        llm_cache.cached_chat_completion(self.nebius_base, {}, self.payload, use_cache=False)
+        other = {**self.payload, "messages": [self.payload["messages"][0], {"role": "user", "content": "bye"}]}
+        self.replay()
+        with self.assertRaises(cassettes.CassetteMissError):
+            llm_cache.cached_chat_completion(self.nebius_base, {}, other, use_cache=False)
+
+        # "any" substitutes a recording of the same kind of call
+        cassettes.PROVIDER_CASSETTE_MATCH = "any"
+        self.assertTrue(llm_cache.cached_chat_completion(self.nebius_base, {}, other, use_cache=False))
+
+
+class BenchmarkPipelineTests(TransactionTestCase):
+    """The benchmark runner end to end against zero-latency fake providers."""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        servers = fake_providers.start_fake_providers(port=0, behaviours={
+            provider: fake_providers.ProviderBehaviour(payload=(64, 64) if provider != "nebius" else (5, 5))
+            for provider in fake_providers.FAKE_PROVIDERS
+        })
+        self.addCleanup(fake_providers.stop_fake_providers, servers)
+        self.environment = fake_providers.provider_environment(servers)
+
+    def test_reports_every_endpoint(self):
+        with override_settings(MEDIA_ROOT=self.work_dir), \
+                benchmark_pipeline.provider_settings(self.environment), \
+                mock.patch.object(llm_cache, "_llm_cache", LRUCache()):
+            results = benchmark_pipeline.run_benchmark(users=2, num_scenes=2)
+
+        self.assertEqual(results["pipelines_completed"], 2)
+        self.assertEqual(list(results["endpoints"]), benchmark_pipeline.PIPELINE)
+        for endpoint, stats in results["endpoints"].items():
+            self.assertEqual((stats["requests"], stats["errors"]), (2, 0), endpoint)
+            self.assertLessEqual(stats["p50_seconds"], stats["p99_seconds"])
+            self.assertGreater(stats["queries_total"], 0)
+        self.assertEqual(results["queries_total"], sum(s["queries_total"] for s in results["endpoints"].values()))
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark_pipeline.percentile(values, 50), 50)
+        self.assertEqual(benchmark_pipeline.percentile(values, 99), 99)
+        self.assertEqual(benchmark_pipeline.percentile([3.0], 95), 3.0)
+        self.assertIsNone(benchmark_pipeline.percentile([], 50))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user("metrics-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_spans_feed_histograms_and_counters(self):
+        with metrics.span("test.stage"):
+            pass
+        with self.assertRaises(ValueError), metrics.span("test.stage"):
+            raise ValueError("boom")
+
+        self.assertEqual(metrics.STAGE_SECONDS.count(stage="test.stage"), 2)
+        self.assertEqual(metrics.STAGE_TOTAL.value(stage="test.stage", outcome="ok"), 1)
+        self.assertEqual(metrics.STAGE_TOTAL.value(stage="test.stage", outcome="error"), 1)
+
+    def test_prometheus_text_format(self):
+        metrics.STAGE_SECONDS.observe(0.3, stage="test.stage")
+        text = metrics.registry.render()
+        self.assertIn("# TYPE envision_stage_duration_seconds histogram", text)
+        self.assertIn('envision_stage_duration_seconds_bucket{stage="test.stage",le="0.25"} 0', text)
+        self.assertIn('envision_stage_duration_seconds_bucket{stage="test.stage",le="0.5"} 1', text)
+        self.assertIn('envision_stage_duration_seconds_bucket{stage="test.stage",le="+Inf"} 1', text)
+        self.assertIn('envision_stage_duration_seconds_count{stage="test.stage"} 1', text)
+
+    def test_request_reports_server_timing_and_metrics(self):
+        with mock.patch.object(views, "build_workflow", side_effect=lambda **kwargs: RewritingWorkflow()):
+            response = self.client.post("/api/generate-scenes/", {"prompt": "a walk", "num_scenes": 2,
+                                                                  "trigger_word": "merida"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("db.save;dur=", response["Server-Timing"])
+
+        with mock.patch.object(views, "METRICS_TOKEN", "secret"):
+            text = self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        self.assertIn('envision_http_request_duration_seconds_count{view="generate_scenes",method="POST",status="200"} 1', text)
+        self.assertIn('envision_db_query_duration_seconds_count{operation="insert"}', text)
+
+    def test_metrics_token(self):
+        with mock.patch.object(views, "METRICS_TOKEN", "secret"):
+            self.assertEqual(self.client.get("/api/metrics/").status_code, 401)
+            self.assertEqual(self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+    def test_metrics_are_disabled_without_a_token(self):
+        with mock.patch.object(views, "METRICS_TOKEN", None):
+            response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(b"envision_", response.content)
+
+    def test_worker_snapshots_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        metrics.STAGE_TOTAL.inc(stage="test.stage", outcome="ok")
+        # Another (running) worker's snapshot
+        other = {"envision_stage_total": {"test.stage\x1fok": 2}}
+        with open(os.path.join(directory, f"{os.getppid()}.json"), "w") as f:
+            json.dump(other, f)
+        merged = metrics.collect(directory)
+        self.assertEqual(merged["envision_stage_total"]["test.stage\x1fok"], 3)
+
+    def test_snapshots_of_exited_workers_are_pruned(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        metrics.STAGE_TOTAL.inc(stage="test.stage", outcome="ok")
+        dead_path = os.path.join(directory, "4242.json")
+        with open(dead_path, "w") as f:
+            json.dump({"envision_stage_total": {"test.stage\x1fok": 5}}, f)
+        with mock.patch.object(metrics, "_process_alive", side_effect=lambda pid: pid == os.getpid()):
+            merged = metrics.collect(directory)
+        self.assertEqual(merged["envision_stage_total"]["test.stage\x1fok"], 1)
+        self.assertFalse(os.path.exists(dead_path))
+        self.assertTrue(os.path.exists(os.path.join(directory, f"{os.getpid()}.json")))
+
+
+class LoggingTests(TestCase):
+    image = "data:image/jpeg;base64," + "A" * 50000
+
+    def test_data_uris_are_redacted_and_values_truncated(self):
+        text = str(logs.Abbreviated({"prompt": "a walk " * 100, "starting_image": self.image, "duration": 5}))
+        self.assertIn("'starting_image': 'data:image/jpeg;base64,<50000 chars>'", text)
+        self.assertIn("<400 more chars>", text)
+        self.assertIn("'duration': 5", text)
+        self.assertLess(len(text), 500)
+
+    def test_long_containers_are_cut(self):
+        text = str(logs.Abbreviated({"scenes": list(range(100))}))
+        self.assertIn("<80 more>", text)
+
+    def test_disabled_levels_format_nothing(self):
+        logger = logging.getLogger("RetrivalAPI.tests.quiet")
+        logger.setLevel(logging.INFO)
+        with mock.patch.object(logs, "shorten") as shorten:
+            logger.debug("State: %s", logs.Abbreviated({"image": self.image}))
+        shorten.assert_not_called()
+
+    def test_formatters_redact_plain_arguments(self):
+        record = logging.LogRecord("RetrivalAPI.views", logging.INFO, __file__, 1, "Body: %s", (self.image,), None)
+        self.assertEqual(logs.RedactingFormatter("%(message)s").format(record),
+                         "Body: data:image/jpeg;base64,<50000 chars>")
+
+        record = logging.LogRecord("RetrivalAPI.views", logging.INFO, __file__, 1, "Done", (), None)
+        record.project_id = "p1"
+        entry = json.loads(logs.JsonFormatter().format(record))
+        self.assertEqual((entry["level"], entry["logger"], entry["message"], entry["project_id"]),
+                         ("INFO", "RetrivalAPI.views", "Done", "p1"))
+
+    def test_replicate_input_is_logged_without_the_image(self):
+        generator = video_generator.VideoGenerator()
+        with mock.patch.object(video_generator, "prepare_reference_data_uri", return_value=self.image), \
+                mock.patch.object(video_generator, "recorded", return_value="/tmp/clip.mp4"), \
+                self.assertLogs("RetrivalAPI.services.video_generator", "DEBUG") as captured:
+            generator.generate_video("a walk", "source-image")
+        self.assertEqual(len(captured.output), 1)
+        self.assertIn("base64,<50000 chars>", captured.output[0])
+        self.assertLess(len(captured.output[0]), 1000)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        self.user = User.objects.create_user("profiled-user", password="test-password")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        for name, value in (("PROFILING_DIR", self.work_dir), ("PROFILING_TOKEN", "secret"),
+                            ("PROFILING_USER_IDS", set()), ("PROFILING_VIEWS", set())):
+            patcher = mock.patch.object(profiling, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        return self.client.get("/api/get-all-characters/", **headers)
+
+    def test_token_header_profiles_the_request(self):
+        response = self.get(HTTP_X_PROFILE="secret", HTTP_X_REQUEST_ID="req-42")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Profile-Id"], "req-42")
+
+        stats = pstats.Stats(os.path.join(self.work_dir, "req-42.pstats"))
+        self.assertTrue(any(func[2] == "getCharacters" for func in stats.stats))
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, "req-42.collapsed")))
+        with open(os.path.join(self.work_dir, "req-42.json")) as f:
+            metadata = json.load(f)
+        self.assertEqual((metadata["view"], metadata["status"], metadata["mode"]), ("get_all_characters", 200, "both"))
+
+    def test_other_requests_are_not_profiled(self):
+        self.assertNotIn("X-Profile-Id", self.get())
+        self.assertNotIn("X-Profile-Id", self.get(HTTP_X_PROFILE="wrong"))
+        with mock.patch.object(profiling, "PROFILING_VIEWS", {"generate_video"}):
+            self.assertNotIn("X-Profile-Id", self.get(HTTP_X_PROFILE="secret"))
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_allowlisted_users_are_profiled(self):
+        with mock.patch.object(profiling, "PROFILING_USER_IDS", {str(self.user.pk)}):
+            response = self.get(HTTP_X_PROFILE_MODE="sample", HTTP_X_REQUEST_ID="../escape")
+        profile_id = response["X-Profile-Id"]
+        self.assertNotIn("/", profile_id)
+        self.assertEqual(sorted(os.listdir(self.work_dir)), [f"{profile_id}.collapsed", f"{profile_id}.json"])
+
+    def test_sampler_writes_collapsed_stacks(self):
+        def busy_loop():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = profiling.SamplingProfiler(interval=0.001)
+        sampler.start()
+        busy_loop()
+        sampler.stop()
+        lines = sampler.collapsed().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[-1].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(any("busy_loop (" in line for line in lines))
+
+
+def scene(number, text="old"):
+    return {"scene_number": number, "title": f"{text} title {number}", "story": f"{text} story {number}",
+            "script": f"{text} script {number}", "story_context": f"{text} story {number}"}
+
+
+def script_reply(*numbers):
+    return "\n\n".join(f'**Scene {n}: "Title {n}"**\nmerida walks {n}' for n in numbers)
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.now = 1000.0
+        patcher = mock.patch.object(llm_cache.time, "time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lru_entries_expire(self):
+        cache = LRUCache()
+        cache.set("key", "value", ttl=10)
+        self.now += 9
+        self.assertEqual(cache.get("key"), "value")
+        self.now += 2
+        self.assertIsNone(cache.get("key"))
+
+    def test_lru_evicts_the_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_file_entries_expire(self):
+        cache = FileSystemCache(self.directory)
+        cache.set("key", "value", ttl=10)
+        self.now += 11
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_files_are_evicted_every_fifty_writes(self):
+        cache = FileSystemCache(self.directory, max_files=10)
+        for i in range(49):
+            cache.set(f"key-{i}", i)
+            # Distinct, increasing write times
+            os.utime(os.path.join(self.directory, f"key-{i}.json"), (i, i))
+        self.assertEqual(len(os.listdir(self.directory)), 49)
+
+        cache.set("key-49", 49)
+        kept = sorted(int(name[4:-5]) for name in os.listdir(self.directory))
+        self.assertEqual(kept, list(range(40, 50)))
+
+    def test_file_hits_are_promoted_to_memory(self):
+        memory, files = LRUCache(), FileSystemCache(self.directory)
+        cache = TieredCache([memory, files])
+        files.set("key", "value")
+        self.assertIsNone(memory.get("key"))
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(memory.get("key"), "value")
+
+    def test_rejected_replies_are_not_cached(self):
+        payload = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+        with mock.patch.object(llm_cache, "_llm_cache", LRUCache()), \
+                mock.patch.object(llm_cache, "recorded", return_value="truncated") as call:
+            for _ in range(2):
+                llm_cache.cached_chat_completion("http://nebius.test", {}, payload, validate=lambda text: False)
+            self.assertEqual(call.call_count, 2)
+            for _ in range(2):
+                llm_cache.cached_chat_completion("http://nebius.test", {}, payload)
+            self.assertEqual(call.call_count, 3)
+
+    def test_scripts_are_not_cached_by_default(self):
+        reply = "\n\n".join(f'**Scene {n}: "Title {n}"**\nmerida walks {n}' for n in (1, 2))
+        with mock.patch.object(llm_cache, "_llm_cache", LRUCache()), \
+                mock.patch.object(llm_cache, "recorded", return_value=reply) as call:
+            script_generation.generate_script("a walk", 2)
+            script_generation.generate_script("a walk", 2)
+            self.assertEqual(call.call_count, 2)
+            script_generation.generate_script("a walk", 2, use_cache=True)
+            script_generation.generate_script("a walk", 2, use_cache=True)
+            self.assertEqual(call.call_count, 3)
+
+
+class MissingSceneRepairTests(TestCase):
+    """generate_script's repair of skipped scenes, against a stubbed LLM."""
+
+    def generate(self, *replies):
+        with mock.patch.object(script_generation, "cached_chat_completion", side_effect=list(replies)) as llm:
+            result = script_generation.generate_script("a walk", 4, trigger_word="merida")
+        return result, llm
+
+    def test_only_missing_scenes_are_requested_and_merged_in_order(self):
+        first = script_reply(1, 3) + '\n\n**Scene 4: "Title 4"**\n'
+        result, llm = self.generate(first, script_reply(2, 4))
+
+        self.assertEqual(llm.call_count, 2)
+        repair_payload = llm.call_args_list[1].args[2]
+        self.assertIn("is missing these scenes: Scene 2, Scene 4.", repair_payload["messages"][1]["content"])
+        self.assertEqual(repair_payload["max_tokens"], 800)
+
+        self.assertEqual([s["scene_number"] for s in result["scene_details"]], [1, 2, 3, 4])
+        self.assertEqual(result["missing_scenes"], [])
+        self.assertEqual(result["script"], script_reply(1, 2, 3, 4))
+        self.assertEqual(script_generation.extractScenes(result["script"]), result["scene_details"])
+
+    def test_complete_reply_makes_one_call(self):
+        result, llm = self.generate(script_reply(1, 2, 3, 4))
+        self.assertEqual(llm.call_count, 1)
+        self.assertEqual(result["script"], script_reply(1, 2, 3, 4))
+
+    def test_failed_repair_leaves_the_output_unchanged(self):
+        first = script_reply(1, 2, 4)
+        for repair in (requests.HTTPError("502 Bad Gateway"), "Sorry, I can't help with that."):
+            result, llm = self.generate(first, repair)
+            self.assertEqual(llm.call_count, 2)
+            self.assertEqual(result["script"], first)
+            self.assertEqual([s["scene_number"] for s in result["scene_details"]], [1, 2, 4])
+            self.assertEqual(result["missing_scenes"], [3])
+
+    def test_repair_can_be_turned_off(self):
+        with mock.patch.object(script_generation, "cached_chat_completion", return_value=script_reply(1, 2)) as llm:
+            result = script_generation.generate_script("a walk", 4, repair_missing=False)
+        self.assertEqual(llm.call_count, 1)
+        self.assertEqual(result["missing_scenes"], [3, 4])
+
+
+class TailRegenerationTests(TestCase):
+    """_regenerate_tail_in_one_shot against a stubbed generate_script."""
+
+    def regenerate(self, reply_numbers):
+        scene_map = {n: scene(n) for n in range(1, 6)}
+        reply = {"scene_details": [scene(n, "new") for n in reply_numbers]}
+        with mock.patch.object(main, "generate_script", return_value=reply) as generate:
+            done = main._regenerate_tail_in_one_shot({"concept": "a walk"}, scene_map, 2, "merida")
+        self.assertFalse(generate.call_args.kwargs["repair_missing"])
+        self.assertEqual(generate.call_args.kwargs["first_scene"], 3)
+        return done, scene_map
+
+    def test_correct_numbering(self):
+        done, scene_map = self.regenerate([3, 4, 5])
+        self.assertEqual(done, {3, 4, 5})
+        self.assertEqual([scene_map[n]["story"] for n in range(1, 6)],
+                         ["old story 1", "old story 2", "new story 3", "new story 4", "new story 5"])
+
+    def test_numbering_restarted_at_one(self):
+        done, scene_map = self.regenerate([1, 2, 3])
+        self.assertEqual(done, {3, 4, 5})
+        self.assertEqual([scene_map[n]["story"] for n in (3, 4, 5)], ["new story 1", "new story 2", "new story 3"])
+        self.assertEqual(scene_map[1]["story"], "old story 1")
+
+    def test_short_reply_leaves_the_rest_for_the_fallback(self):
+        done, scene_map = self.regenerate([3, 4])
+        self.assertEqual(done, {3, 4})
+        self.assertEqual(scene_map[5]["story"], "old story 5")
+
+
+class WindowedRewriteTests(TestCase):
+    """The windowed all-scenes rewrite with _rewrite_window stubbed out."""
+
+    def setUp(self):
+        self.scenes = [scene(n) for n in range(1, 11)]
+        self.windows = []
+
+    def rewrite(self, reply):
+        def fake_window(state, window, total, *args):
+            self.windows.append(window)
+            return reply(window)
+
+        state = {"concept": "a walk", "unchanged_scenes": [99]}
+        with mock.patch.object(main, "_rewrite_window", side_effect=fake_window):
+            rewritten = main._rewrite_scenes_windowed(state, self.scenes, "system", "make it rain", "merida", "key", "base")
+        return state, rewritten
+
+    @staticmethod
+    def numbers(scenes):
+        return [s["scene_number"] for s in scenes]
+
+    @staticmethod
+    def all_targets(window, skip=()):
+        return {s["scene_number"]: (str(s["scene_number"]), "new", "new story")
+                for s in window["targets"] if s["scene_number"] not in skip}
+
+    def test_windows_cover_every_scene_with_overlapping_context(self):
+        state, rewritten = self.rewrite(self.all_targets)
+        self.assertEqual(
+            [(self.numbers(w["before"]), self.numbers(w["targets"]), self.numbers(w["after"])) for w in self.windows],
+            [([], [1, 2, 3, 4], [5]), ([4], [5, 6, 7, 8], [9]), ([8], [9, 10], [])],
+        )
+        self.assertEqual([int(r[0]) for r in rewritten], list(range(1, 11)))
+        self.assertEqual(state["unchanged_scenes"], [])
+
+    def test_dropped_scenes_are_retried_then_reported(self):
+        state, rewritten = self.rewrite(lambda window: self.all_targets(window, skip={6}))
+        self.assertEqual(self.numbers(self.windows[-1]["targets"]), [6])
+        self.assertEqual(self.numbers(self.windows[-1]["before"]), [5])
+        self.assertEqual(state["unchanged_scenes"], [6])
+        self.assertNotIn(6, [int(r[0]) for r in rewritten])
+
+    def test_failed_window_is_reported(self):
+        def reply(window):
+            if window["targets"][0]["scene_number"] == 1:
+                raise requests.HTTPError("502 Bad Gateway")
+            return self.all_targets(window)
+
+        state, rewritten = self.rewrite(reply)
+        self.assertEqual(state["unchanged_scenes"], [1, 2, 3, 4])
+        self.assertEqual([int(r[0]) for r in rewritten], list(range(5, 11)))
+
+    def test_single_call_rewrite_clears_a_stale_list(self):
+        content = "\n\n".join(f'**Scene {n}: "New {n}"**\nnew story {n}' for n in range(1, 4))
+        response = mock.Mock(**{"json.return_value": {"choices": [{"message": {"content": content}}]}})
+        state = {"concept": "a walk", "scenes": [scene(n) for n in range(1, 4)], "rewrite_instructions": "rain",
+                 "trigger_word": "merida", "windowed_rewrite": False, "unchanged_scenes": [2]}
+        with mock.patch.dict(os.environ, {"NEBIUS_API_BASE": "http://nebius.test"}), \
+                mock.patch.object(main.requests, "post", return_value=response):
+            state = main.rewrite_all_scenes(state)
+        self.assertNotIn("error", state)
+        self.assertEqual(state["unchanged_scenes"], [])
+        self.assertEqual(state["scenes"][1]["story"], "new story 2")
+
+
+class FakeWorkflow:
+    """Stands in for the LangGraph app, returning a canned state without any LLM calls."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def invoke(self, state, config=None, interrupt_before=None):
+        return {**state, **self.state}
+
+
+class EditAllScenesStateTests(TestCase):
+    def test_checkpointed_rewrite_settings_are_reset(self):
+        user = User.objects.create_user("stale-user", password="test-password")
+        project = models.Project.objects.create(user=user, title="t", concept="c", num_scenes=3)
+        models.Scene.objects.bulk_create(
+            models.Scene(project=project, scene_number=n, title=f"Scene {n}", script=f"script {n}",
+                         story_context=f"story {n}")
+            for n in range(1, 4)
+        )
+        models.WorkflowCheckpoint.objects.create(
+            thread_id=f"user-{user.id}-{project.id}", version=1,
+            state_json=json.dumps({"concept": "c", "scenes": [], "unchanged_scenes": [3], "windowed_rewrite": True}),
+        )
+        workflow = RewritingWorkflow()
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(views, "build_workflow", return_value=workflow), \
+                mock.patch.object(workflow, "invoke", wraps=workflow.invoke) as invoke:
+            response = client.post("/api/edit-all-scenes/", {"project_id": str(project.id),
+                                                              "edit_instructions": "make it rain"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertNotIn("windowed_rewrite", invoke.call_args.args[0])
+        self.assertEqual(response.data["data"]["unchanged_scenes"], [])
+
+
+class EditSceneCheckpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("checkpoint-user", password="test-password")
+        self.project = models.Project.objects.create(user=self.user, title="t", concept="c", num_scenes=3)
+        models.Scene.objects.bulk_create(
+            models.Scene(project=self.project, scene_number=n, title=f"Scene {n}", script=f"script {n}",
+                         story_context=f"story {n}")
+            for n in range(1, 4)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def store_checkpoint(self, **state):
+        scenes = [{"scene_number": n, "title": f"Scene {n}", "story": f"story {n}", "script": f"script {n}"}
+                  for n in range(1, 4)]
+        # The shape LangGraph saves: the state sits under channel_values/__root__
+        models.WorkflowCheckpoint.objects.create(
+            thread_id=f"user-{self.user.id}-{self.project.id}", version=1,
+            state_json=json.dumps({"channel_values": {"__root__": {"concept": "c", "scenes": scenes, **state}}}),
+        )
+
+    def edit(self, **body):
+        workflow = RewritingWorkflow()
+        with mock.patch.object(views, "build_workflow", return_value=workflow), \
+                mock.patch.object(workflow, "invoke", wraps=workflow.invoke) as invoke:
+            response = self.client.post("/api/edit-scene/", {
+                "project_id": str(self.project.id), "scene_number": 2, "edit_instructions": "make it rain", **body
+            }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return invoke.call_args.args[0]
+
+    def test_batch_flag_reaches_a_stored_checkpoint(self):
+        self.store_checkpoint(batch_tail_regeneration=False, scene_to_edit=1)
+        state = self.edit(batch_regenerate=True)
+        self.assertTrue(state["batch_tail_regeneration"])
+        self.assertEqual(state["scene_to_edit"], 2)
+        self.assertEqual(state["rewrite_instructions"], "make it rain")
+        self.assertNotIn("channel_values", state)
+
+    def test_stale_batch_flag_is_cleared(self):
+        self.store_checkpoint(batch_tail_regeneration=True)
+        self.assertFalse(self.edit()["batch_tail_regeneration"])
+        self.assertFalse(self.edit(batch_regenerate="false")["batch_tail_regeneration"])
+
+    def test_failures_are_logged_not_returned(self):
+        self.store_checkpoint()
+        workflow = RewritingWorkflow()
+        with mock.patch.object(views, "build_workflow", return_value=workflow), \
+                mock.patch.object(workflow, "invoke", side_effect=RuntimeError("graph blew up")), \
+                self.assertLogs(views.logger, "ERROR") as logged:
+            response = self.client.post("/api/edit-scene/", {
+                "project_id": str(self.project.id), "scene_number": 2, "edit_instructions": "make it rain"
+            }, format="json")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(set(response.data), {"status", "message", "error_code"})
+        self.assertNotIn("Traceback", json.dumps(response.data))
+        self.assertIn("Traceback", logged.output[0])
+
+
+class RequestFlagTests(TestCase):
+    def test_parse_flag(self):
+        for value, expected in [(True, True), (False, False), ("true", True), ("False", False),
+                                ("1", True), ("0", False), (1, True), (0, False)]:
+            with self.subTest(value=value):
+                self.assertIs(views.parse_flag({"hls": value}, "hls"), expected)
+        self.assertIs(views.parse_flag({}, "hls"), False)
+        for value in ("yes", "", "2", None, [], {}):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                views.parse_flag({"hls": value}, "hls")
+
+    def test_invalid_flag_is_rejected(self):
+        user = User.objects.create_user("flag-user", password="test-password")
+        project = models.Project.objects.create(user=user, title="t", concept="c", num_scenes=1)
+        models.Scene.objects.create(project=project, scene_number=1, title="Scene 1", script="s")
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(views, "VideoGenerator") as generator:
+            response = client.post("/api/generate-video/", {"project_id": str(project.id), "hls": "maybe"},
+                                   format="json")
+        self.assertEqual(response.status_code, 400)
+        generator.assert_not_called()
+
+        response = client.post("/api/create-project/", {"concept": "a walk", "use_cache": "nope"}, format="json")
+        self.assertEqual(response.data["error_code"], "invalid_flag")
+
+
+class VideoPromptReuseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("prompt-user", password="test-password")
+        self.project = models.Project.objects.create(user=self.user, title="t", concept="c", num_scenes=2)
+        models.Scene.objects.bulk_create([
+            models.Scene(project=self.project, scene_number=1, title="Scene 1", script="s",
+                         image_prompt="a walk", video_prompt="a slow walk",
+                         video_prompt_source=video_prompt_source("a walk")),
+            models.Scene(project=self.project, scene_number=2, title="Scene 2", script="s",
+                         image_prompt="a run", video_prompt="a slow run",
+                         video_prompt_source=video_prompt_source("a run")),
+        ])
+
+    def ensure(self):
+        with mock.patch.object(views, "generate_video_prompts",
+                               side_effect=lambda prompts: {n: f"moving {p}" for n, p in prompts.items()}) as generate:
+            prompts = views.ensure_video_prompts(list(self.project.scenes.order_by("scene_number")))
+        return prompts, generate
+
+    def test_matching_image_prompt_reuses_stored_video_prompt(self):
+        prompts, generate = self.ensure()
+        generate.assert_not_called()
+        self.assertEqual(prompts, {1: "a slow walk", 2: "a slow run"})
+
+    def test_changed_image_prompt_regenerates_only_that_scene(self):
+        self.project.scenes.filter(scene_number=2).update(image_prompt="a sprint")
+        prompts, generate = self.ensure()
+        generate.assert_called_once_with({2: "a sprint"})
+        self.assertEqual(prompts, {1: "a slow walk", 2: "moving a sprint"})
+
+        scene = self.project.scenes.get(scene_number=2)
+        self.assertEqual(scene.video_prompt_source, video_prompt_source("a sprint"))
+        # Stored, so the next render reuses it
+        _, generate = self.ensure()
+        generate.assert_not_called()
+
+    def test_image_prompt_stage_defers_video_prompts_to_render(self):
+        scenes = [{"scene_number": 1, "image_prompt": "a walk"}, {"scene_number": 2, "image_prompt": "a sprint"}]
+        with mock.patch.object(views, "build_workflow",
+                               return_value=FakeWorkflow({"image_prompts": {"scenes": scenes}})), \
+                mock.patch.object(views, "generate_video_prompts") as generate:
+            response = views.generate_image_prompts(self.project.id, self.user)
+        self.assertEqual(response.status_code, 200, response.data)
+        generate.assert_not_called()
+
+        prompts, generate = self.ensure()
+        generate.assert_called_once_with({2: "a sprint"})
+        self.assertEqual(prompts, {1: "a slow walk", 2: "moving a sprint"})
+
+
+class SceneWriteQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bulk-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _scenes(self, count, suffix=""):
+        return [
+            {"scene_number": n, "title": f"Scene {n}", "script": f"script {n}{suffix}",
+             "story": f"story {n}{suffix}", "image_prompt": f"prompt {n}{suffix}"}
+            for n in range(1, count + 1)
+        ]
+
+    def _make_project(self, count):
+        project = models.Project.objects.create(
+            user=self.user, title="bulk", concept=f"concept {count}", num_scenes=count
+        )
+        models.Scene.objects.bulk_create(
+            models.Scene(project=project, scene_number=n, title=f"Scene {n}", script=f"script {n}",
+                         story_context=f"story {n}")
+            for n in range(1, count + 1)
+        )
+        return project
+
+    def _count_queries(self, workflow_state, call):
+        with mock.patch.object(views, "build_workflow", return_value=FakeWorkflow(workflow_state)), \
+                mock.patch.object(views, "generate_video_prompts",
+                                  side_effect=lambda prompts: {n: "video" for n in prompts}), \
+                CaptureQueriesContext(connection) as queries:
+            response = call()
+        self.assertIn(response.status_code, (200, 201), getattr(response, "data", None))
+        return len(queries)
+
+    def assertConstantQueries(self, make_call, small=2, large=7):
+        counts = [self._count_queries(*make_call(n)) for n in (small, large)]
+        self.assertEqual(counts[0], counts[1], f"queries grew with scene count: {counts}")
+
+    def test_generate_scenes(self):
+        self.assertConstantQueries(lambda n: (
+            {"scenes": self._scenes(n)},
+            lambda: self.client.post("/api/generate-scenes/", {
+                "prompt": f"walk {n}", "num_scenes": n, "trigger_word": "merida"
+            }, format="json"),
+        ))
+
+    def test_create_project(self):
+        self.assertConstantQueries(lambda n: (
+            {"scenes": self._scenes(n)},
+            lambda: self.client.post("/api/create-project/", {
+                "concept": f"walk {n}", "num_scenes": n
+            }, format="json"),
+        ))
+
+    def test_edit_scene(self):
+        def make_call(n):
+            project = self._make_project(n)
+            return (
+                {"scenes": self._scenes(n, " edited")},
+                lambda: self.client.post("/api/edit-scene/", {
+                    "project_id": str(project.id), "scene_number": 1, "edit_instructions": "rain"
+                }, format="json"),
+            )
+        self.assertConstantQueries(make_call)
+
+    def test_edit_all_scenes(self):
+        def make_call(n):
+            project = self._make_project(n)
+            return (
+                {"scenes": self._scenes(n, " edited")},
+                lambda: self.client.post("/api/edit-all-scenes/", {
+                    "project_id": str(project.id), "edit_instructions": "rain"
+                }, format="json"),
+            )
+        self.assertConstantQueries(make_call)
+
+    def test_generate_image_prompts(self):
+        def make_call(n):
+            project = self._make_project(n)
+            return (
+                {"image_prompts": {"scenes": self._scenes(n)}},
+                lambda: views.generate_image_prompts(project.id, self.user),
+            )
+        self.assertConstantQueries(make_call)
+
+
+class ProjectListingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("list-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        other = User.objects.create_user("someone-else", password="test-password")
+        models.Project.objects.create(user=other, title="not mine", concept="x", num_scenes=1)
+        models.Project.objects.bulk_create(
+            models.Project(user=self.user, title=f"project {n}", concept="x", num_scenes=1, video="A" * 1000)
+            for n in range(25)
+        )
+        # Ties on created_at straddle page boundaries; the id tie-breaker must keep them in order
+        tied = models.Project.objects.filter(user=self.user).values_list("id", flat=True)[:15]
+        models.Project.objects.filter(id__in=list(tied)).update(created_at=timezone.now())
+
+    def _list(self, **params):
+        response = self.client.post("/api/list-projects/", params, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_cursor_pages_cover_every_project_once(self):
+        seen = []
+        page = self._list(page_size=10)
+        while True:
+            self.assertLessEqual(len(page["results"]), 10)
+            seen += [item["project_id"] for item in page["results"]]
+            if not page["next_cursor"]:
+                break
+            page = self._list(page_size=10, cursor=page["next_cursor"])
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), set(models.Project.objects.filter(user=self.user).values_list("id", flat=True)))
+
+    def test_listing_skips_heavy_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._list()
+        listing_sql = next(q["sql"] for q in queries if "RetrivalAPI_project" in q["sql"])
+        self.assertNotIn('"video"', listing_sql)
+        self.assertNotIn('"concept"', listing_sql)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.post("/api/list-projects/", {"cursor": "not-a-cursor"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_unpaginated_request_keeps_the_bare_list(self):
+        listing = self._list()
+        self.assertIsInstance(listing, list)
+        self.assertEqual(len(listing), 25)
+        self.assertEqual(set(listing[0]),
+                         {"project_id", "project_name", "project_type", "poster_url", "thumbnail_strip_url"})
+
+    def test_pages_include_media_urls(self):
+        page = self._list(page_size=5)
+        self.assertEqual(len(page["results"]), 5)
+        self.assertIn("poster_url", page["results"][0])
+        self.assertIn("thumbnail_strip_url", page["results"][0])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("fields-user", password="test-password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = models.Project.objects.create(
+            user=self.user, title="fields", concept="a walk", num_scenes=5, video="A" * 1000
+        )
+        models.Scene.objects.bulk_create(
+            models.Scene(project=self.project, scene_number=n, title=f"Scene {n}", script="walking",
+                         image=make_test_image())
+            for n in range(1, 6)
+        )
+
+    def _get(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/project/scenes/", {"project_id": str(self.project.id), **params}, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data["project"], queries
+
+    def test_media_columns_are_not_loaded_by_default(self):
+        project, queries = self._get()
+        self.assertEqual(len(project["scenes"]), 5)
+        self.assertNotIn("image", project["scenes"][0])
+        for query in queries:
+            self.assertNotIn('"image"', query["sql"])
+            self.assertNotIn('"video"', query["sql"])
+        # One query for the project, one for all of its scenes
+        self.assertEqual(sum("RetrivalAPI_" in q["sql"] for q in queries), 2)
+
+    def test_fields_and_include_select_the_payload(self):
+        project, _ = self._get(fields="title,scenes", scene_fields=["scene_number"], scene_include=["image"])
+        self.assertEqual(set(project), {"title", "scenes"})
+        self.assertEqual(set(project["scenes"][0]), {"scene_number", "image"})
+        self.assertTrue(project["scenes"][0]["image"].startswith("data:image/png;base64,"))
+
+    def test_project_status_accepts_query_parameters(self):
+        response = self.client.get(f"/api/project-status/{self.project.id}/?fields=title,project_type&include=id")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data["project"]), {"title", "project_type", "id"})
+
+
+# Per-endpoint budgets recorded by EndpointRegressionTests; rewrite with UPDATE_PERF_BASELINES=1
+PERF_BASELINES_PATH = os.path.join(os.path.dirname(__file__), "perf_baselines.json")
+UPDATE_PERF_BASELINES = os.environ.get("UPDATE_PERF_BASELINES") == "1"
+# Wall-clock time depends on the machine, so it is only checked on request, against
+# baselines re-recorded on the same machine; queries, size and provider calls always are
+PERF_CHECK_TIME = os.environ.get("PERF_CHECK_TIME") == "1"
+# Timings are noisy, so only fail well past the baseline
+PERF_TIME_FACTOR = float(os.environ.get("PERF_TIME_FACTOR", 3))
+PERF_TIME_SLACK = 0.5  # seconds
+PERF_SIZE_FACTOR = 1.1
+FIXTURE_SCENE_COUNTS = (1, 7, 20)
+
+
+class RewritingWorkflow:
+    """Stands in for the LangGraph app: every scene it is given (or asked for) comes back rewritten."""
+
+    def invoke(self, state, config=None, interrupt_before=None):
+        count = len(state.get("scenes") or []) or state.get("num_scenes", 1)
+        scenes = [
+            {"scene_number": n, "title": f"Scene {n}", "script": f"rewritten script {n}",
+             "story": f"rewritten story {n}", "image_prompt": f"rewritten prompt {n}"}
+            for n in range(1, count + 1)
+        ]
+        return {**state, "scenes": scenes, "image_prompts": {"scenes": scenes}}
+
+
+# Route name -> request for a fixture project: (method, path, body)
+ENDPOINT_CASES = {
+    "get_all_characters": lambda project: ("get", "/api/get-all-characters/", None),
+    "select_character": lambda project: ("post", "/api/select-character/", {"trigger_word": "merida"}),
+    "generate_scenes": lambda project: ("post", "/api/generate-scenes/", {
+        "prompt": f"new walk {project.num_scenes}", "num_scenes": project.num_scenes, "trigger_word": "merida"
+    }),
+    "list_projects": lambda project: ("post", "/api/list-projects/", {}),
+    "create_project": lambda project: ("post", "/api/create-project/", {
+        "concept": f"new concept {project.num_scenes}", "num_scenes": project.num_scenes
+    }),
+    "review_script": lambda project: ("post", "/api/review-script/", {
+        "project_id": str(project.id), "scene_number": 1
+    }),
+    "edit_scene": lambda project: ("post", "/api/edit-scene/", {
+        "project_id": str(project.id), "scene_number": 1, "edit_instructions": "make it rain"
+    }),
+    "edit_all_scenes": lambda project: ("post", "/api/edit-all-scenes/", {
+        "project_id": str(project.id), "edit_instructions": "make it rain"
+    }),
+    "generate_images": lambda project: ("post", "/api/generate-images/", {"project_id": str(project.id)}),
+    "edit_images": lambda project: ("post", "/api/edit-image/", {
+        "project_id": str(project.id), "scene_number": 1, "edit_instructions": "make it rain"
+    }),
+    "edit_all_images": lambda project: ("post", "/api/edit-all-images/", {
+        "project_id": str(project.id), "edit_instructions": "make it rain"
+    }),
+    "generate_video": lambda project: ("post", "/api/generate-video/", {"project_id": str(project.id)}),
+    "project_status": lambda project: ("get", f"/api/project-status/{project.id}/", None),
+    "get_project_and_scenes": lambda project: ("post", "/api/project/scenes/", {"project_id": str(project.id)}),
+    "metrics": lambda project: ("get", "/api/metrics/", None),
+}
+
+
+class EndpointRegressionTests(TestCase):
+    """
+    Calls every API route against fixture projects of 1, 7 and 20 scenes with
+    all providers stubbed, and fails if SQL queries, response size or calls to
+    each provider go past the recorded baselines in perf_baselines.json (and
+    time too, with PERF_CHECK_TIME=1).
+    """
+    measurements = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.work_dir = tempfile.mkdtemp()
+        cls.clip = make_test_clip(os.path.join(cls.work_dir, "clip.mp4"), size="160x120")
+        buffer = io.BytesIO()
+        Image.new("RGB", (256, 256), "teal").save(buffer, "PNG")
+        cls.png = buffer.getvalue()
+        try:
+            with open(PERF_BASELINES_PATH) as f:
+                cls.baselines = json.load(f)
+        except FileNotFoundError:
+            cls.baselines = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+        if UPDATE_PERF_BASELINES and cls.measurements:
+            baselines = {**cls.baselines, **cls.measurements}
+            with open(PERF_BASELINES_PATH, "w") as f:
+                json.dump(dict(sorted(baselines.items())), f, indent=2)
+                f.write("\n")
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("regression-user", password="test-password")
+        models.Character.objects.create(
+            name="Merida", trigger_word="merida", image=make_test_image(), thumbnail=make_test_image((64, 64))
+        )
+        cls.projects = {}
+        for count in FIXTURE_SCENE_COUNTS:
+            project = models.Project.objects.create(
+                user=cls.user, title=f"{count} scenes", concept=f"a walk in {count} scenes",
+                num_scenes=count, trigger_word="merida",
+            )
+            models.Scene.objects.bulk_create(
+                models.Scene(
+                    project=project, scene_number=n, title=f"Scene {n}", script=f"script {n}",
+                    story_context=f"story {n}", image_prompt=f"prompt {n}", image=make_test_image(),
+                    video_prompt="a slow walk", video_prompt_source=video_prompt_source(f"prompt {n}"),
+                )
+                for n in range(1, count + 1)
+            )
+            cls.projects[count] = project
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        FakeVideoGenerator.source_clip = self.clip
+        # Provider name -> stub whose call_count is compared against the baseline
+        self.providers = {}
+        for name, patcher in (
+            ("llm_workflow", mock.patch.object(RewritingWorkflow, "invoke", autospec=True,
+                                               side_effect=RewritingWorkflow.invoke)),
+            ("comfyui", mock.patch.object(views, "fetch_image_from_comfy", return_value=self.png)),
+            ("video_prompts", mock.patch.object(views, "generate_video_prompts",
+                                                side_effect=lambda prompts: {n: "a slow walk" for n in prompts})),
+            ("video_generator", mock.patch.object(FakeVideoGenerator, "generate_video", autospec=True,
+                                                  side_effect=FakeVideoGenerator.generate_video)),
+            (None, mock.patch.object(views, "build_workflow", side_effect=lambda **kwargs: RewritingWorkflow())),
+            (None, mock.patch.object(views, "VideoGenerator", FakeVideoGenerator)),
+        ):
+            stub = patcher.start()
+            self.addCleanup(patcher.stop)
+            if name:
+                self.providers[name] = stub
+        media_root = override_settings(MEDIA_ROOT=self.work_dir)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        # /metrics is only served with a token
+        patcher = mock.patch.object(views, "METRICS_TOKEN", "metrics-token")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer metrics-token")
+        # /metrics output grows with everything recorded before it
+        metrics.registry.reset()
+
+    def measure(self, name, count):
+        method, path, body = ENDPOINT_CASES[name](self.projects[count])
+        for stub in self.providers.values():
+            stub.reset_mock()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == "get":
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, body, format="json")
+            elapsed = time.perf_counter() - started
+        self.assertLess(response.status_code, 300, getattr(response, "data", response.content))
+        return {
+            "queries": len(queries),
+            "bytes": len(response.content),
+            "provider_calls": {provider: stub.call_count for provider, stub in sorted(self.providers.items())},
+            "seconds": round(elapsed, 4),
+        }
+
+    def check_endpoint(self, name):
+        for count in FIXTURE_SCENE_COUNTS:
+            key = f"{name}[{count}]"
+            with self.subTest(endpoint=name, scenes=count):
+                result = self.measure(name, count)
+                self.measurements[key] = result
+                if UPDATE_PERF_BASELINES:
+                    continue
+                baseline = self.baselines.get(key)
+                self.assertIsNotNone(baseline, f"No baseline for {key}; run with UPDATE_PERF_BASELINES=1")
+                self.assertLessEqual(result["queries"], baseline["queries"], f"{key}: more SQL queries")
+                self.assertLessEqual(
+                    result["bytes"], baseline["bytes"] * PERF_SIZE_FACTOR, f"{key}: response grew"
+                )
+                for provider, calls in result["provider_calls"].items():
+                    self.assertLessEqual(
+                        calls, baseline["provider_calls"].get(provider, 0), f"{key}: more {provider} calls"
+                    )
+                if PERF_CHECK_TIME:
+                    self.assertLessEqual(
+                        result["seconds"],
+                        max(baseline["seconds"] * PERF_TIME_FACTOR, baseline["seconds"] + PERF_TIME_SLACK),
+                        f"{key}: slower than baseline",
+                    )
+
+    def test_every_route_has_a_case(self):
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns}, set(ENDPOINT_CASES))
+
+
+def _endpoint_test(name):
+    def test(self):
+        self.check_endpoint(name)
+    test.__name__ = f"test_{name}"
+    return test
+
+
+for _name in ENDPOINT_CASES:
+    setattr(EndpointRegressionTests, f"test_{_name}", _endpoint_test(_name))
@@ -31,5 +31,8 @@ urlpatterns = [
     
     path('project/scenes/', views.get_project_and_scenes, name='get_project_and_scenes'),
     
+    # Prometheus metrics
+    path('metrics/', views.metrics, name='metrics'),
+    
 
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.response import Response
@@ -12,53 +13,55 @@ import json
 import re
 from .services.checkpoints import checkpointer
 from . import models, serializers
+from .serializers import PROJECT_MEDIA_COLUMNS, SCENE_MEDIA_COLUMNS
 from .services.script_generation import detect_project_type
-from .services.image_prompt_generation import ImagePromptGenerator,CreateVideoPrompt
+from .services.image_prompt_generation import ImagePromptGenerator, generate_video_prompts, video_prompt_source
 from .services.comfyUIservices import fetch_image_from_comfy
 from .services.video_generator import VideoGenerator
+from .services.media import download_to_file
+from .services.reference_images import prepare_reference_image
+from .services.video_encoding import ENCODING_PROFILES, encode_video
+from .services.preview_renderer import render_preview
+from .services.video_thumbnails import extract_thumbnails
+from .services.video_streaming import HLS_PLAYLIST_NAME, segment_hls
+from .services.image_variants import available_variants, create_image_variants
+from .services.metrics import render_metrics, span, timed
+from .services.logs import Abbreviated
 from .main import build_workflow
 from dotenv import load_dotenv
 from .models import WorkflowCheckpoint
 import base64
 import requests
 import time
-from moviepy import VideoFileClip
-from moviepy import concatenate_videoclips
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 import io
 import os
 import tempfile
+import uuid
+import binascii
+import hmac
+import logging
+from datetime import datetime
 load_dotenv()
 
-RUNPOD_API_KEY = os.getenv("RunPod_API_KEY")
+logger = logging.getLogger(__name__)
 
-################# Helper Functions #################
-def is_base64(data):
-    try:
-        # Check if the string can be decoded
-        base64.b64decode(data, validate=True)
-        return True
-    except Exception:
-        return False
-def normalize_base64(data_url):
-    # 1) Remove header (data:image/png;base64,)
-    clean = re.sub(r'^data:.*;base64,', '', data_url)
-
-    # 2) Remove whitespace
-    clean = clean.strip().replace('\n', '').replace(' ', '')
-
-    # 3) Fix padding
-    missing = len(clean) % 4
-    if missing:
-        clean += "=" * (4 - missing)
+RUNPOD_API_KEY = os.getenv("RunPod_API_KEY")
+# Serverless endpoint that renders the Wan 2.2 clips
+RUNPOD_API_BASE = os.getenv("RUNPOD_API_BASE", "https://api.runpod.ai/v2/ztc333122svqcf")
 
-    # 4) Validate Base64 string
-    try:
-        base64.b64decode(clean, validate=True)
-    except Exception as e:
-        raise ValueError(f"Invalid Base64 string: {str(e)}")
+# Bearer token Prometheus must send to /api/metrics/; unset disables the endpoint (404)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-    return clean
+# listProjects page sizes
+PROJECT_PAGE_SIZE = 20
+MAX_PROJECT_PAGE_SIZE = 100
 
+################# Helper Functions #################
 def enforce_character_placeholder(text):
     # Replace "the character's" or "character’s" with "{character}'s"
     text = re.sub(r"\b(the )?character[’']s\b", r"{character}'s", text, flags=re.IGNORECASE)
@@ -66,11 +69,12 @@ def enforce_character_placeholder(text):
     text = re.sub(r"\b(the )?character\b", r"{character}", text, flags=re.IGNORECASE)
     return text
 
+@timed("runpod.prediction")
 def poll_status_and_hit_api(response_id, max_retries=200, delay=5):
     """
     Poll the status of the API until it is 'COMPLETED' or a maximum number of retries is reached.
     """
-    status_url = f"https://api.runpod.ai/v2/ztc333122svqcf/status/{response_id}"
+    status_url = f"{RUNPOD_API_BASE}/status/{response_id}"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {RUNPOD_API_KEY}"
@@ -82,8 +86,7 @@ def poll_status_and_hit_api(response_id, max_retries=200, delay=5):
         try:
             # Check the status
             status_response = requests.get(status_url, headers=headers)
-            print("DEBUG: API response content:", status_response.text)
-            print("DEBUG: API response status code:", status_response.status_code)
+            logger.debug("RunPod status response %s: %s", status_response.status_code, Abbreviated(status_response.text))
 
             if status_response.status_code == 200:
                 try:
@@ -92,20 +95,19 @@ def poll_status_and_hit_api(response_id, max_retries=200, delay=5):
                     raise Exception("Failed to parse API response as JSON.")
 
                 status = status_data.get("status")
-                print(f"Current status: {status}")
+                logger.debug("RunPod job %s status: %s", response_id, status)
 
                 if status == "COMPLETED":
-                    print("Status is COMPLETED. Returning the final result.")
                     return status_data  # Return the final result directly
                 elif status in ["FAILED", "CANCELLED"]:
                     raise Exception(f"Process failed or cancelled with status: {status}")
                 else:
-                    print(f"Status is {status}. Retrying after {delay} seconds...")
+                    logger.debug("RunPod job %s is %s, polling again in %s seconds", response_id, status, delay)
             else:
                 raise Exception(f"Failed to fetch status. HTTP Status Code: {status_response.status_code}")
 
         except Exception as e:
-            print(f"Error while polling status: {str(e)}")
+            logger.warning("Error while polling RunPod job %s: %s", response_id, e)
             raise
 
         # Wait before polling again
@@ -115,6 +117,268 @@ def poll_status_and_hit_api(response_id, max_retries=200, delay=5):
     # If the maximum number of retries is reached
     raise TimeoutError("Polling timed out before the status became COMPLETED.")
 
+def ensure_video_prompts(scenes):
+    """
+    Make sure every scene has a video prompt derived from its current image prompt.
+    Stale or missing prompts are generated concurrently and stored; up-to-date
+    ones are reused as-is. Returns a scene_number -> video prompt mapping.
+    """
+    stale = {
+        scene.scene_number: scene for scene in scenes
+        if not scene.video_prompt or scene.video_prompt_source != video_prompt_source(scene.image_prompt)
+    }
+    if stale:
+        generated = generate_video_prompts({sn: scene.image_prompt for sn, scene in stale.items()})
+        for sn, scene in stale.items():
+            scene.video_prompt = generated[sn]
+            scene.video_prompt_source = video_prompt_source(scene.image_prompt)
+            scene.save(update_fields=['video_prompt', 'video_prompt_source'])
+    return {scene.scene_number: scene.video_prompt for scene in scenes}
+
+def store_video_thumbnails(instance, video_path):
+    """
+    Extract a poster frame and thumbnail strip from video_path onto a Project
+    or Scene (not saved). Thumbnails are a nice-to-have, so a failure here is
+    logged and never fails the render.
+    """
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            poster_path, strip_path = extract_thumbnails(video_path, work_dir)
+            for field, path in ((instance.poster, poster_path), (instance.thumbnail_strip, strip_path)):
+                if field:
+                    field.delete(save=False)
+                with open(path, "rb") as f:
+                    field.save(f"{instance.id}.jpg", File(f), save=False)
+    except (OSError, RuntimeError) as e:
+        logger.warning("Could not extract thumbnails for %s: %s", instance, e)
+
+def clear_project_hls(project):
+    """
+    Remove the project's HLS playlist and the segments next to it from the
+    media store (not saved).
+    """
+    if project.hls_playlist:
+        render_dir = os.path.dirname(project.hls_playlist.name)
+        try:
+            _, old_files = default_storage.listdir(render_dir)
+        except FileNotFoundError:
+            old_files = []
+        for name in old_files:
+            default_storage.delete(f"{render_dir}/{name}")
+    project.hls_playlist = None
+
+def store_project_hls(project, video_path):
+    """
+    Segment the final video for HLS playback and upload the segments and
+    playlist under a fresh hls/<project id>/<render id>/ prefix in the media
+    store (not saved). The earlier render is only removed once the new one is
+    fully uploaded, so its playlist keeps working in the meantime.
+
+    Raises:
+        RuntimeError: If the storage backend stores a file under a different
+        name than requested, which would break the playlist's relative links
+    """
+    prefix = f"hls/{project.id}/{uuid.uuid4().hex}"
+    uploaded = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in segment_hls(video_path, work_dir):
+                with open(os.path.join(work_dir, name), "rb") as f:
+                    stored = default_storage.save(f"{prefix}/{name}", File(f))
+                uploaded.append(stored)
+                if stored != f"{prefix}/{name}":
+                    raise RuntimeError(f"HLS file {prefix}/{name} was stored as {stored}")
+    except Exception:
+        for name in uploaded:
+            default_storage.delete(name)
+        raise
+    clear_project_hls(project)
+    project.hls_playlist.name = f"{prefix}/{HLS_PLAYLIST_NAME}"
+
+def remove_files(paths):
+    """Delete the given files, skipping any that are already gone."""
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+def store_project_video(project, clip_paths, profile=None, scenes=None, hls=False):
+    """
+    Stitch the downloaded clips into the project's final video and save it to
+    the media store. The video is never read into memory; the clips are
+    removed once they have been assembled. Encoding runs in the encoding
+    process pool with the given profile (see ENCODING_PROFILES).
+
+    Poster frames and thumbnail strips are stored for the final video and,
+    when scenes (in clip order) are given, for each scene's clip. With hls,
+    an HLS playlist and segments are stored next to the mp4.
+    """
+    try:
+        for scene, clip_path in zip(scenes or [], clip_paths):
+            store_video_thumbnails(scene, clip_path)
+            scene.save(update_fields=['poster', 'thumbnail_strip'])
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            output_path = encode_video(clip_paths, os.path.join(work_dir, "final.mp4"), profile)
+            if project.video_file:
+                project.video_file.delete(save=False)
+            with open(output_path, "rb") as f:
+                project.video_file.save(f"{project.id}.mp4", File(f), save=False)
+            store_video_thumbnails(project, output_path)
+            # A playlist from an earlier render would no longer match the mp4
+            if hls:
+                store_project_hls(project, output_path)
+            elif project.hls_playlist:
+                clear_project_hls(project)
+    finally:
+        remove_files(clip_paths)
+
+    # Drop any legacy base64 copy now that the file is the source of truth
+    project.video = ""
+    with span("db.save"):
+        project.save()
+    return project.video_file
+
+def store_project_preview(project, images):
+    """
+    Render a quick pan-and-zoom preview of the scene images and save it to the
+    media store, replacing any earlier preview.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = render_preview(images, os.path.join(work_dir, "preview.mp4"))
+        if project.preview_file:
+            project.preview_file.delete(save=False)
+        with open(output_path, "rb") as f:
+            project.preview_file.save(f"{project.id}.mp4", File(f), save=False)
+    project.save(update_fields=['preview_file', 'updated_at'])
+    return project.preview_file
+
+def media_url(request, field):
+    """Absolute URL of a stored file, or None if the field is empty."""
+    return request.build_absolute_uri(field.url) if field else None
+
+def delete_stored_files(paths):
+    """Delete files from the media store, skipping any that are already gone."""
+    for path in paths:
+        default_storage.delete(path)
+
+def save_scene_image(scene, image_data):
+    """
+    Set a scene's image from ComfyUI output and save the scene. The original
+    PNG is kept in scene.image; resized WebP/JPEG variants are written to the
+    media store. The previous image's variants are only deleted once the save
+    has committed, and the new ones are removed if it fails, so the row never
+    points at missing files.
+    """
+    old_paths = list((scene.image_variants or {}).values())
+    new_paths = {}
+    try:
+        for name, (extension, data) in create_image_variants(image_data).items():
+            new_paths[name] = default_storage.save(f"scenes/{scene.id}/{name}.{extension}", ContentFile(data))
+        scene.image = f"data:image/png;base64,{base64.b64encode(image_data).decode('utf-8')}"
+        scene.image_variants = new_paths
+        with span("db.save"):
+            scene.save()
+        # Runs immediately under autocommit, or once an enclosing transaction commits
+        transaction.on_commit(lambda: delete_stored_files(old_paths))
+    except BaseException:
+        delete_stored_files(new_paths.values())
+        raise
+
+def get_image_variant(request):
+    """
+    Read the ?variant= query parameter.
+
+    Returns:
+        tuple: (variant or None for the original, error Response or None)
+    """
+    variant = request.query_params.get('variant') or None
+    if variant in (None, 'original') or variant in available_variants():
+        return (None if variant == 'original' else variant), None
+    return None, Response({
+        "status": "error",
+        "message": f"variant must be one of: original, {', '.join(available_variants())}",
+        "success": False
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+def scenes_by_number(project):
+    """
+    Load a project's scenes in one query, keyed by scene_number. Going through
+    the related manager keeps scene.project pointing at the loaded project.
+    Image columns are deferred; script edits never read them.
+    """
+    return {scene.scene_number: scene for scene in project.scenes.defer(*SCENE_MEDIA_COLUMNS)}
+
+def parse_field_list(value):
+    """Accept a list or a comma separated string of field names; None if empty."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return [name.strip() for name in value if name and name.strip()] or None
+
+def get_sparse_fieldset(params):
+    """
+    Read the sparse fieldset parameters for ProjectSerializer from a request's
+    body or query parameters:
+        fields / include: project fields to output / optional project fields to add
+        scene_fields / scene_include: the same for each nested scene
+    """
+    return {key: parse_field_list(params.get(key)) for key in ('fields', 'include', 'scene_fields', 'scene_include')}
+
+def project_detail_queryset(fieldset):
+    """
+    Projects ready for ProjectSerializer(**fieldset): media columns the client
+    didn't ask for are deferred, and scenes (if output) are prefetched in one
+    query with their own media columns deferred.
+    """
+    ProjectSerializer, SceneSerializer = serializers.ProjectSerializer, serializers.SceneSerializer
+    projects = models.Project.objects.defer(
+        *ProjectSerializer.deferred_columns(fieldset['fields'], fieldset['include'], PROJECT_MEDIA_COLUMNS)
+    )
+    if 'scenes' in ProjectSerializer.selected_fields(fieldset['fields'], fieldset['include']):
+        scenes = models.Scene.objects.defer(
+            *SceneSerializer.deferred_columns(fieldset['scene_fields'], fieldset['scene_include'], SCENE_MEDIA_COLUMNS)
+        )
+        projects = projects.prefetch_related(Prefetch('scenes', queryset=scenes))
+    return projects
+
+# Accepted spellings of boolean request fields (JSON booleans, 0/1 and their string forms)
+FLAG_VALUES = {True: True, False: False, "true": True, "false": False, "1": True, "0": False}
+
+def parse_flag(data, name, default=False):
+    """
+    Read an optional boolean request field: true/false/1/0, as JSON values or
+    strings in any case. bool() would treat the string "false" as true.
+
+    Raises:
+        ValueError: If the value is anything else
+    """
+    value = data.get(name, default)
+    if isinstance(value, str):
+        value = value.strip().lower()
+    try:
+        return FLAG_VALUES[value]
+    except (KeyError, TypeError):
+        raise ValueError(f"{name} must be true or false.")
+
+def encode_cursor(created_at, last_id):
+    """Opaque pagination token for the position after (created_at, id)."""
+    raw = json.dumps([created_at.isoformat(), str(last_id)])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Reverse of encode_cursor.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), uuid.UUID(last_id)
+    except (TypeError, AttributeError, binascii.Error, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
 def get_user_selected_character(request):
     """Get the user's selected character trigger_word from session"""
     return request.session.get('selected_character', '')
@@ -145,8 +409,9 @@ def validate_character_selection(request):
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
 def getCharacters(request):
-    characters = models.Character.objects.all()
-    serializer = serializers.CharacterSerializer(characters, many=True)
+    # Only the thumbnail; full reference images are never needed by the picker
+    characters = models.Character.objects.only('name', 'trigger_word', 'thumbnail')
+    serializer = serializers.CharacterThumbnailSerializer(characters, many=True)
     return Response(serializer.data)
 
 @api_view(['POST'])
@@ -197,8 +462,7 @@ def setCharacter(request):
             "error_code": "invalid_json"
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        import traceback
-        print("Exception in setCharacter:", traceback.format_exc())
+        logger.exception("Exception in setCharacter")
         return Response({
             "status": "error",
             "message": f"Internal server error: {str(e)}",
@@ -218,7 +482,16 @@ def generateScenes(request):
         num_scenes = data.get('num_scenes', 3)
         prompt = data.get('prompt', '').strip()
         trigger_word = data.get('trigger_word').strip()
-
+        try:
+            # Scripts are sampled, so a repeated prompt gets a new story unless the
+            # client asks for the cached one with use_cache=true
+            use_llm_cache = parse_flag(data, 'use_cache') and not parse_flag(data, 'regenerate')
+        except ValueError as e:
+            return Response({
+                "status": "error",
+                "message": str(e),
+                "error_code": "invalid_flag"
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             num_scenes = int(num_scenes)
@@ -260,7 +533,8 @@ def generateScenes(request):
             "scenes": [],
             "project_title": project_title,
             "project_type": detect_project_type(concept),
-            "trigger_word": trigger_word  # Add trigger_word to init_state
+            "trigger_word": trigger_word,  # Add trigger_word to init_state
+            "use_llm_cache": use_llm_cache
         }
 
         # Run existing script generation workflow
@@ -277,17 +551,21 @@ def generateScenes(request):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
         # Create scenes in database
-        created_scenes = []
+        new_scenes = []
         for scene_data in state_after_script.get("scenes", []):
             scene_title = scene_data.get("title", f"Scene {scene_data.get('scene_number', 1)}")
-            scene = models.Scene.objects.create(
+            new_scenes.append(models.Scene(
                 project=project,
                 scene_number=scene_data.get("scene_number", 1),
                 script=scene_data.get("script", ""),
                 story_context=scene_data.get("story", ""),
                 title=scene_title
-            )
-            
+            ))
+        with span("db.save"), transaction.atomic():
+            models.Scene.objects.bulk_create(new_scenes)
+
+        created_scenes = []
+        for scene in new_scenes:
             # Prepare scene data - the script should already contain the trigger_word
 
             created_scenes.append({
@@ -393,54 +671,64 @@ def generate_image_prompts(p_id, u_id):
             "scenes": scenes_data
         }
         
-        print("DEBUG: Invoking workflow with state:", init_state)
+        logger.debug("Invoking workflow with state: %s", Abbreviated(init_state))
         state_after_prompt_gen = app.invoke(init_state, config=config)
-        print("DEBUG: State after prompt generation:", state_after_prompt_gen)
+        logger.debug("State after prompt generation: %s", Abbreviated(state_after_prompt_gen))
         
         # Get the image_prompts data from state
         image_prompts_data = state_after_prompt_gen.get("image_prompts", {})
         updated_scenes = image_prompts_data.get("scenes", [])
         
-        print(f"DEBUG: Found {len(updated_scenes)} scenes with image prompts")
+        logger.debug("Found %d scenes with image prompts", len(updated_scenes))
         
         if not updated_scenes:
             # Fallback: try getting scenes directly from state
             updated_scenes = state_after_prompt_gen.get("scenes", [])
-            print(f"DEBUG: Fallback - Found {len(updated_scenes)} scenes in state")
+            logger.debug("Fallback - found %d scenes in state", len(updated_scenes))
         
-        # Update database with generated prompts
-        response_scenes_data = []
+        prompts_by_scene = {}
         for scene_dict in updated_scenes:
             scene_number = scene_dict.get("scene_number")
             final_prompt = scene_dict.get("image_prompt")
             
             if not scene_number:
-                print(f"DEBUG: Skipping scene without scene_number: {scene_dict}")
+                logger.debug("Skipping scene without scene_number: %s", Abbreviated(scene_dict))
                 continue
                 
             if not final_prompt:
-                print(f"DEBUG: No image_prompt found for scene {scene_number}")
+                logger.debug("No image_prompt found for scene %s", scene_number)
                 continue
-            
-            try:
-                # Get the database object
-                scene_obj = models.Scene.objects.get(project=project, scene_number=scene_number)
-                
-                # Update the image prompt
-                scene_obj.image_prompt = final_prompt
-                scene_obj.save()
-                
-                print(f"DEBUG: Saved image prompt for scene {scene_number}: {final_prompt[:100]}...")
-                
-                # Add to response using dictionary values
-                response_scenes_data.append({
-                    "scene_number": scene_dict.get("scene_number"),
-                    "scene_title": scene_dict.get("scene_title", scene_obj.title),
-                    "image_prompt": final_prompt
-                })
-            except models.Scene.DoesNotExist:
-                print(f"DEBUG: Scene {scene_number} not found in database")
+
+            prompts_by_scene[scene_number] = (scene_dict, final_prompt)
+
+        # Video prompts are derived at render time (ensure_video_prompts), once the
+        # stored one no longer matches the image prompt it came from
+        existing_scenes = {scene.scene_number: scene for scene in scenes}
+
+        # Update database with generated prompts
+        response_scenes_data = []
+        changed_scenes = []
+        for scene_number, (scene_dict, final_prompt) in prompts_by_scene.items():
+            scene_obj = existing_scenes.get(scene_number)
+            if scene_obj is None:
+                logger.debug("Scene %s not found in database", scene_number)
                 continue
+
+            # Update the image prompt
+            scene_obj.image_prompt = final_prompt
+            changed_scenes.append(scene_obj)
+
+            logger.debug("Saved image prompt for scene %s: %s", scene_number, Abbreviated(final_prompt, 100))
+
+            # Add to response using dictionary values
+            response_scenes_data.append({
+                "scene_number": scene_dict.get("scene_number"),
+                "scene_title": scene_dict.get("scene_title", scene_obj.title),
+                "image_prompt": final_prompt
+            })
+
+        with span("db.save"), transaction.atomic():
+            models.Scene.objects.bulk_update(changed_scenes, ['image_prompt'])
         
         # Clean up checkpoints
         WorkflowCheckpoint.objects.filter(thread_id=thread_id).delete()
@@ -458,7 +746,7 @@ def generate_image_prompts(p_id, u_id):
             }
         }
         
-        print(f"DEBUG: Returning response with {len(response_scenes_data)} scenes")
+        logger.debug("Returning response with %d scenes", len(response_scenes_data))
         return Response(formatted_data, status=status.HTTP_200_OK)
             
     except json.JSONDecodeError:
@@ -467,8 +755,7 @@ def generate_image_prompts(p_id, u_id):
             "success": False
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        import traceback
-        print("ERROR in generate_image_prompts:", traceback.format_exc())
+        logger.exception("Error in generate_image_prompts")
         return Response({
             "error": f"Internal server error: {str(e)}",
             "success": False
@@ -484,6 +771,7 @@ def generate_images(request):
     
     Expects: { "project_id": "..." }
     Uses prompts from the database to generate images
+    Optional ?variant=webp_512 (see IMAGE_VARIANT_WIDTHS/FORMATS) returns URLs of resized copies instead of base64
     """
     try:
         data = json.loads(request.body)
@@ -501,6 +789,10 @@ def generate_images(request):
                 "error": "project_id is required",
                 "success": False
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        variant, error_response = get_image_variant(request)
+        if error_response:
+            return error_response
         
         # Get project and verify ownership
         try:
@@ -540,21 +832,19 @@ def generate_images(request):
                 # Use the image prompt to generate the image
                 image_data = fetch_image_from_comfy(scene.image_prompt)
                 
-                # Save the generated image as base64 in the database
-                scene.image = f"data:image/png;base64,{base64.b64encode(image_data).decode('utf-8')}"
+                # Save the generated image as base64 in the database, with resized variants
+                save_scene_image(scene, image_data)
                 
                 # sec_image_prompt = f"{scene.image_prompt} make an image prompt of the closing scene using this image prompt"
                 # sec_image_data = fetch_image_from_comfy(sec_image_prompt)
                 
                 # scene.sec_image = f"data:image/png;base64,{base64.b64encode(sec_image_data).decode('utf-8')}"
                 
-                scene.save()
-                
                 # Add scene data to the response
                 scenes_data.append({
                     "scene_number": scene.scene_number,
                     "scene_title": scene.title,
-                    "image": scene.image  # Base64-encoded image 
+                    "image": serializers.scene_image(request, scene, variant)  # Base64 original or variant URL
                 })
             except Exception as e:
                 return Response({
@@ -595,6 +885,7 @@ def edit_image(request):
     
     Expects: { "project_id": "...", "edit_instructions": "..." }
     Uses existing images and edit instructions to generate edited images
+    Optional ?variant=webp_512 (see IMAGE_VARIANT_WIDTHS/FORMATS) returns URLs of resized copies instead of base64
     """
     try:
         data = json.loads(request.body)
@@ -608,6 +899,10 @@ def edit_image(request):
                 "message": "project_id and edit_instructions are required.",
                 "success": False
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        variant, error_response = get_image_variant(request)
+        if error_response:
+            return error_response
         
         project = models.Project.objects.get(id=project_id, user=request.user)
         scene = models.Scene.objects.get(project=project, scene_number=scene_number)
@@ -646,19 +941,18 @@ def edit_image(request):
         #     f"Ensure consistency with previous scene elements, "
         #     f"avoid duplicated characters or hallucinations."
         # )
-        print(image_prompt)
+        logger.debug("Regenerating scene %s image with prompt: %s", scene.scene_number, Abbreviated(image_prompt))
         image = fetch_image_from_comfy(image_prompt)
-        scene.image = f"data:image/png;base64,{base64.b64encode(image).decode('utf-8')}"
+        save_scene_image(scene, image)
         # sec_image = fetch_image_from_comfy(sec_image_prompt)
         # scene.sec_image = f"data:image/png;base64,{base64.b64encode(sec_image).decode('utf-8')}"
-        scene.save()
         return Response({
             "status": "success",
             "message": f"Image for scene {scene.scene_number}/{scene.title} edited successfully.",
             "data": {
                 "scene_number": scene.scene_number,
                 "scene_title": scene.title,
-                "edited_image": scene.image
+                "edited_image": serializers.scene_image(request, scene, variant)
             }
         }, status=status.HTTP_200_OK)
     except Exception as e:
@@ -677,6 +971,7 @@ def edit_all_images(request):
     
     Expects: { "project_id": "...", "edit_instructions": "..." }
     Uses existing images and edit instructions to generate edited images
+    Optional ?variant=webp_512 (see IMAGE_VARIANT_WIDTHS/FORMATS) returns URLs of resized copies instead of base64
     """
     try:
         data = json.loads(request.body)
@@ -690,6 +985,10 @@ def edit_all_images(request):
                 "success": False
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        variant, error_response = get_image_variant(request)
+        if error_response:
+            return error_response
+
         project = models.Project.objects.get(id=project_id, user=request.user)
         if not project:
             return Response({
@@ -732,14 +1031,13 @@ def edit_all_images(request):
             # )
     
             image = fetch_image_from_comfy(image_prompt)
-            scene.image = f"data:image/png;base64,{base64.b64encode(image).decode('utf-8')}"
+            save_scene_image(scene, image)
             # sec_image = fetch_image_from_comfy(sec_image_prompt)
             # scene.sec_image = f"data:image/png;base64,{base64.b64encode(sec_image).decode('utf-8')}"
-            scene.save()
             edited_scenes.append({
                 "scene_number": scene.scene_number,
                 "scene_title": scene.title,
-                "edited_image": scene.image
+                "edited_image": serializers.scene_image(request, scene, variant)
             })
         
         return Response({
@@ -780,6 +1078,21 @@ def CreateVideo(request):
                 "error": "project_id is required",
                 "success": False
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        profile = data.get('profile')
+        if profile is not None and profile not in ENCODING_PROFILES:
+            return Response({
+                "error": f"profile must be one of: {', '.join(ENCODING_PROFILES)}",
+                "success": False
+            }, status=status.HTTP_400_BAD_REQUEST)
+        # Also publish the video as an HLS playlist for streaming playback
+        try:
+            hls = parse_flag(data, 'hls')
+        except ValueError as e:
+            return Response({
+                "error": str(e),
+                "success": False
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Fetch the project and its scenes
         try:
@@ -798,115 +1111,98 @@ def CreateVideo(request):
             }, status=status.HTTP_404_NOT_FOUND)
         
         videos = []
-        for scene in scenes:
-            edit_instruction = scene.image_prompt
-            modified_edit_instruction = CreateVideoPrompt(edit_instruction)
-            scene_image = scene.image
-            
-            if is_base64(scene_image) is False:
-                clean_scene_image = normalize_base64(scene_image)
+        video_prompts = ensure_video_prompts(scenes)
+        try:
+            for scene in scenes:
+                modified_edit_instruction = video_prompts[scene.scene_number]
+                # RunPod expects the bare base64 payload; send a downscaled JPEG rather than the full PNG
+                clean_scene_image = prepare_reference_image(scene.image, "wan")
             
-            # # Validate and fix the Base64 image
-            # if not scene_image.startswith("data:image"):
-            #     return Response({
-            #         "status": "error",
-            #         "message": f"Scene {scene.scene_number} has an invalid Base64 image format."
-            #     }, status=status.HTTP_400_BAD_REQUEST)
+                # # Validate and fix the Base64 image
+                # if not scene_image.startswith("data:image"):
+                #     return Response({
+                #         "status": "error",
+                #         "message": f"Scene {scene.scene_number} has an invalid Base64 image format."
+                #     }, status=status.HTTP_400_BAD_REQUEST)
                 
             
-            # Prepare the request body for the API
-            request_body = {
-                "input": {
-                    "generation_type": "textImage_to_video",
-                    "model": "wan22",
-                    "prompt": modified_edit_instruction,
-                    "input_image": clean_scene_image
+                # Prepare the request body for the API
+                request_body = {
+                    "input": {
+                        "generation_type": "textImage_to_video",
+                        "model": "wan22",
+                        "prompt": modified_edit_instruction,
+                        "input_image": clean_scene_image
+                    }
                 }
-            }
-            post_api = "https://api.runpod.ai/v2/ztc333122svqcf/run"
-            authorization = RUNPOD_API_KEY
+                post_api = f"{RUNPOD_API_BASE}/run"
+                authorization = RUNPOD_API_KEY
             
-            print(request_body)
+                logger.debug("RunPod request: %s", Abbreviated(request_body))
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {authorization}"
-            }
+                headers = {
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {authorization}"
+                }
             
-            # Send the POST request
-            response = requests.post(post_api, data=json.dumps(request_body), headers=headers)
+                # Send the POST request
+                with span("runpod.submit"):
+                    response = requests.post(post_api, data=json.dumps(request_body), headers=headers)
             
-            # Validate the API response
-            if response.status_code != 200:
-                return Response({
-                    "status": "error",
-                    "message": f"API request failed with status code {response.status_code}: {response.text}"
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                # Validate the API response
+                if response.status_code != 200:
+                    return Response({
+                        "status": "error",
+                        "message": f"API request failed with status code {response.status_code}: {response.text}"
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
-            try:
-                response_data = response.json()
-            except ValueError:
-                return Response({
-                    "status": "error",
-                    "message": "Failed to parse API response as JSON."
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                try:
+                    response_data = response.json()
+                except ValueError:
+                    return Response({
+                        "status": "error",
+                        "message": "Failed to parse API response as JSON."
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
-            # Extract the response ID
-            response_id = response_data.get("id")
-            if not response_id:
-                return Response({
-                    "status": "error",
-                    "message": "API response does not contain 'id'."
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                # Extract the response ID
+                response_id = response_data.get("id")
+                if not response_id:
+                    return Response({
+                        "status": "error",
+                        "message": "API response does not contain 'id'."
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
             
-            # Poll the status and retrieve the final result
-            final_result = poll_status_and_hit_api(response_id)
-            print("DEBUG: Final result from poll_status_and_hit_api:", final_result)
-
-            # Extract the video URL from the output list
-            output_list = final_result.get("output", [])
-            video_url = output_list[0] if len(output_list) > 0 else None
-            if not video_url:
-                return Response({
-                    "status": "error",
-                    "message": "Video URL is missing in the API response."
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # Download the video from the URL
-            video_content = requests.get(video_url).content
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_file:
-                temp_video_file.write(video_content)
-                temp_video_file.flush()
-                videos.append(temp_video_file.name)
+                # Poll the status and retrieve the final result
+                final_result = poll_status_and_hit_api(response_id)
+                logger.debug("RunPod result: %s", Abbreviated(final_result))
+
+                # Extract the video URL from the output list
+                output_list = final_result.get("output", [])
+                video_url = output_list[0] if len(output_list) > 0 else None
+                if not video_url:
+                    return Response({
+                        "status": "error",
+                        "message": "Video URL is missing in the API response."
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+                # Stream the video from the URL straight to disk
+                with span("runpod.download"):
+                    videos.append(download_to_file(video_url, suffix=".mp4"))
             
-        # Stitch videos together using moviepy
-        video_clips = []
-        for video_path in videos:
-            video_clip = VideoFileClip(video_path)
-            video_clips.append(video_clip)
-        
-        final_video = concatenate_videoclips(video_clips, method="compose")
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_video_file:
-            final_video.write_videofile(temp_video_file.name, codec="libx264", audio_codec="aac")
-            temp_video_file.seek(0)
-            final_video_data = temp_video_file.read()
-        
-        final_video_base64 = base64.b64encode(final_video_data).decode('utf-8')
-        project.video = f"data:video/mp4;base64,{final_video_base64}"
-        project.save()
-        
-        # Clean up temporary video clips and files
-        for clip in video_clips:
-            clip.close()
-        for video_path in videos:
-            os.unlink(video_path)
+            # Stitch videos together straight into the media store
+            logger.debug("Stitching %d videos together", len(videos))
+            video_file = store_project_video(project, videos, profile, scenes, hls)
+        finally:
+            # Clips from earlier scenes are removed even when a later scene fails
+            remove_files(videos)
         
         return Response({
             "status": "success",
             "message": "Videos stitched together successfully and saved to the project.",
             "project_id": str(project.id),
-            "final_video_base64": project.video
+            "video_url": request.build_absolute_uri(video_file.url),
+            "hls_url": media_url(request, project.hls_playlist) if hls else None
         }, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({
@@ -936,6 +1232,29 @@ def CreateVideo_2(request):
                 "error": "project_id is required",
                 "success": False
             }, status=status.HTTP_400_BAD_REQUEST)
+
+        profile = data.get('profile')
+        if profile is not None and profile not in ENCODING_PROFILES:
+            return Response({
+                "error": f"profile must be one of: {', '.join(ENCODING_PROFILES)}",
+                "success": False
+            }, status=status.HTTP_400_BAD_REQUEST)
+        # Also publish the video as an HLS playlist for streaming playback
+        try:
+            hls = parse_flag(data, 'hls')
+        except ValueError as e:
+            return Response({
+                "error": str(e),
+                "success": False
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # "preview" renders a local slideshow of the scene images instead of calling the provider
+        mode = data.get('mode', 'final')
+        if mode not in ('final', 'preview'):
+            return Response({
+                "error": "mode must be 'final' or 'preview'",
+                "success": False
+            }, status=status.HTTP_400_BAD_REQUEST)
             
         # Fetch the project and its scenes
         try:
@@ -951,51 +1270,44 @@ def CreateVideo_2(request):
                 "error": "No scenes found for the project",
                 "success": False
             }, status=status.HTTP_404_NOT_FOUND)
+        if mode == 'preview':
+            missing = [scene.scene_number for scene in scenes if not scene.image]
+            if missing:
+                return Response({
+                    "error": f"Scenes without images: {', '.join(map(str, missing))}. Generate images first.",
+                    "success": False
+                }, status=status.HTTP_400_BAD_REQUEST)
+            preview_file = store_project_preview(project, [scene.image for scene in scenes])
+            return Response({
+                "status": "success",
+                "message": "Preview rendered from the scene images.",
+                "project_id": str(project.id),
+                "mode": "preview",
+                "video_url": request.build_absolute_uri(preview_file.url)
+            }, status=status.HTTP_200_OK)
         videos = []
         video_generator = VideoGenerator()
-        for scene in scenes:
-            edit_instruction = scene.image_prompt
-            modified_edit_instruction = CreateVideoPrompt(edit_instruction)
-            scene_image = scene.image
-            clean_scene_image = normalize_base64(scene_image)
-            video_data = video_generator.generate_video(modified_edit_instruction, clean_scene_image)
-            videos.append(video_data)
-        # Stitch videos together using moviepy
-        print("DEBUG: Stitching videos together...")    
-        video_clips = []
-        for video_data in videos:
-            # Normalize Base64 string to ensure proper padding
-            video_data = normalize_base64(video_data)
-
-            # Validate the Base64 string
-            if not is_base64(video_data):
-                raise ValueError("Invalid Base64 video data.")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_file:
-                # Decode Base64 string to bytes before writing
-                temp_video_file.write(base64.b64decode(video_data))
-                temp_video_file.flush()
-                video_clip = VideoFileClip(temp_video_file.name)
-                video_clips.append(video_clip)
-                
-        print("DEBUG: Concatenating video clips...")
-        final_video = concatenate_videoclips(video_clips, method="compose")
-        print("DEBUG: Writing final video to temporary file...")
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_video_file:
-            final_video.write_videofile(temp_video_file.name, codec="libx264", audio_codec="aac")
-            temp_video_file.seek(0)
-            final_video_data = temp_video_file.read()
-        final_video_base64 = base64.b64encode(final_video_data).decode('utf-8')
-        project.video = f"data:video/mp4;base64,{final_video_base64}"
-        project.save()
-        # Clean up temporary video clips and files
-        for clip in video_clips:
-            clip.close()
+        video_prompts = ensure_video_prompts(scenes)
+        try:
+            for scene in scenes:
+                modified_edit_instruction = video_prompts[scene.scene_number]
+                # The generator downscales scene.image for the provider itself
+                video_path = video_generator.generate_video(modified_edit_instruction, scene.image)
+                if not video_path:
+                    raise ValueError(f"Video generation failed for scene {scene.scene_number}")
+                videos.append(video_path)
+            # Stitch videos together straight into the media store, reading the downloaded clips directly
+            logger.debug("Stitching %d videos together", len(videos))
+            video_file = store_project_video(project, videos, profile, scenes, hls)
+        finally:
+            # Clips from earlier scenes are removed even when a later scene fails
+            remove_files(videos)
         return Response({
             "status": "success",
             "message": "Videos stitched together successfully and saved to the project.",
             "project_id": str(project.id),
-            "final_video_base64": project.video
+            "video_url": request.build_absolute_uri(video_file.url),
+            "hls_url": media_url(request, project.hls_playlist) if hls else None
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -1012,8 +1324,14 @@ def get_project_and_scenes(request):
     """
     Get details of a particular project and its scenes for the authenticated user.
     Expects: { "project_id": ... }
+    Optional: "fields", "include", "scene_fields", "scene_include" (lists or comma separated),
+    e.g. { "scene_include": ["image"] } to also return the scene images.
+    Optional ?variant=webp_512 returns those images as URLs of resized copies instead of base64.
     """
     try:
+        variant, error_response = get_image_variant(request)
+        if error_response:
+            return error_response
         data = json.loads(request.body)
         project_id = data.get('project_id')
         if not project_id:
@@ -1022,8 +1340,11 @@ def get_project_and_scenes(request):
                 "message": "project_id is required."
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        project = models.Project.objects.get(id=project_id, user=request.user)
-        project_serializer = serializers.ProjectSerializer(project)
+        fieldset = get_sparse_fieldset(data)
+        project = project_detail_queryset(fieldset).get(id=project_id, user=request.user)
+        project_serializer = serializers.ProjectSerializer(
+            project, context={'request': request, 'image_variant': variant}, **fieldset
+        )
         return Response({
             "status": "success",
             "project": project_serializer.data,
@@ -1045,16 +1366,65 @@ def get_project_and_scenes(request):
 @authentication_classes([JWTAuthentication])
 @permission_classes([IsAuthenticated])
 def listProjects(request):
-    projects = models.Project.objects.filter(user=request.user)
-    data = [
+    """
+    List the user's projects, newest first.
+    Without "cursor" or "page_size" every project is returned as a bare list (the
+    original response). Sending either pages the results:
+    { "cursor": "...", "page_size": 20 } -> { "results": [...], "next_cursor": ... }
+    Pass the returned next_cursor to get the following page; it is null on the last page.
+    """
+    data = request.data
+    paginated = 'cursor' in data or 'page_size' in data
+    try:
+        page_size = min(max(int(data.get('page_size', PROJECT_PAGE_SIZE)), 1), MAX_PROJECT_PAGE_SIZE)
+    except (ValueError, TypeError):
+        page_size = PROJECT_PAGE_SIZE
+
+    projects = (
+        models.Project.objects.filter(user=request.user)
+        .only('id', 'title', 'project_type', 'created_at', 'poster', 'thumbnail_strip')
+        .order_by('-created_at', '-id')
+    )
+
+    # Keyset pagination: continue strictly after the last row of the previous page
+    cursor = data.get('cursor')
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor)
+        except ValueError:
+            return Response({
+                "status": "error",
+                "message": "Invalid cursor.",
+                "error_code": "invalid_cursor"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        projects = projects.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=last_id)
+        )
+
+    if paginated:
+        page = list(projects[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+    else:
+        page = projects
+
+    results = [
         {
-            "project_id":project.id,
+            "project_id": project.id,
             "project_name": project.title,
-            "project_type": project.project_type
+            "project_type": project.project_type,
+            "poster_url": media_url(request, project.poster),
+            "thumbnail_strip_url": media_url(request, project.thumbnail_strip)
         }
-        for project in projects
+        for project in page
     ]
-    return Response(data)
+
+    if not paginated:
+        return Response(results)
+    return Response({
+        "results": results,
+        "next_cursor": encode_cursor(page[-1].created_at, page[-1].id) if has_more else None
+    })
 
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])  
@@ -1074,6 +1444,15 @@ def CreateProject(request):
                 "message": "Concept is required.",
                 "error_code": "concept_required"
             }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Cached scripts are opt-in (see generateScenes)
+            use_llm_cache = parse_flag(data, 'use_cache') and not parse_flag(data, 'regenerate')
+        except ValueError as e:
+            return Response({
+                "status": "error",
+                "message": str(e),
+                "error_code": "invalid_flag"
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             num_of_scenes = int(num_of_scenes)
@@ -1113,7 +1492,8 @@ def CreateProject(request):
             "script": "",
             "scenes": [],
             "project_title": project_title,
-            "project_type": detect_project_type(concept)
+            "project_type": detect_project_type(concept),
+            "use_llm_cache": use_llm_cache
         }
 
         app = build_workflow()
@@ -1128,15 +1508,18 @@ def CreateProject(request):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
         # Create scenes with custom titles if provided
+        new_scenes = []
         for scene_data in state_after_script.get("scenes", []):
             scene_title = scene_data.get("title", f"Scene {scene_data.get('scene_number', 1)}")
-            models.Scene.objects.create(
+            new_scenes.append(models.Scene(
                 project=project,
                 scene_number=scene_data.get("scene_number", 1),
                 script=enforce_character_placeholder(scene_data.get("script", "")),
                 story_context=enforce_character_placeholder(scene_data.get("story", "")),
                 title=scene_title
-            )
+            ))
+        with span("db.save"), transaction.atomic():
+            models.Scene.objects.bulk_create(new_scenes)
 
         serializer = serializers.ProjectSerializer(project)
         
@@ -1188,7 +1571,11 @@ def ReviewScript(request):
             }, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            scene = models.Scene.objects.get(project=project, scene_number=scene_number)
+            scene = (
+                models.Scene.objects.select_related('project')
+                .defer(*SCENE_MEDIA_COLUMNS, *[f"project__{column}" for column in PROJECT_MEDIA_COLUMNS])
+                .get(project=project, scene_number=scene_number)
+            )
         except models.Scene.DoesNotExist:
             return Response({
                 "status": "error",
@@ -1220,7 +1607,6 @@ def ReviewScript(request):
 @permission_classes([IsAuthenticated])
 def EditScene(request):
     try:
-        import pprint
         data = json.loads(request.body)
         project_id = data.get('project_id')
         scene_number = int(data.get('scene_number'))
@@ -1232,6 +1618,15 @@ def EditScene(request):
                 "message": "project_id, scene_number, and edit_instructions are required.",
                 "error_code": "missing_fields"
             }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Optional: regenerate all following scenes in a single LLM call
+            batch_regenerate = parse_flag(data, 'batch_regenerate')
+        except ValueError as e:
+            return Response({
+                "status": "error",
+                "message": str(e),
+                "error_code": "invalid_flag"
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         # Get project and scene
         try:
@@ -1243,9 +1638,8 @@ def EditScene(request):
                 "error_code": "project_not_found"
             }, status=status.HTTP_404_NOT_FOUND)
 
-        try:
-            scene_to_edit = models.Scene.objects.get(project=project, scene_number=scene_number)
-        except models.Scene.DoesNotExist:
+        db_scenes = scenes_by_number(project)
+        if scene_number not in db_scenes:
             return Response({
                 "status": "error",
                 "message": f"Scene {scene_number} not found.",
@@ -1258,7 +1652,7 @@ def EditScene(request):
         if checkpoint_wrapper is None:
             # Fallback: reconstruct state from DB
             existing_scenes = []
-            for scene in project.scenes.all():
+            for scene in db_scenes.values():
                 existing_scenes.append({
                     'id': str(scene.id),
                     'scene_number': scene.scene_number,
@@ -1279,25 +1673,25 @@ def EditScene(request):
         else:
             checkpoint_state = checkpoint_wrapper.checkpoint
 
-        # --- Always overwrite these fields for edit ---
+        # --- Unwrap channel_values if present ---
+        if "channel_values" in checkpoint_state and "__root__" in checkpoint_state["channel_values"]:
+            checkpoint_state = checkpoint_state["channel_values"]["__root__"]
+
+        # --- Always overwrite these fields for edit (after the unwrap, or they'd be dropped) ---
         checkpoint_state["scene_to_edit"] = int(scene_number)
         checkpoint_state["needs_rewrite"] = True
         checkpoint_state["rewrite_instructions"] = edit_instructions
         checkpoint_state["rewrite_decision"] = "edit"
+        checkpoint_state["batch_tail_regeneration"] = batch_regenerate
 
-        # --- Unwrap channel_values if present ---
-        if "channel_values" in checkpoint_state and "__root__" in checkpoint_state["channel_values"]:
-            checkpoint_state = checkpoint_state["channel_values"]["__root__"]
-
-        print("checkpoint_state before workflow invoke:")
-        pprint.pprint(checkpoint_state)
+        logger.debug("checkpoint_state before workflow invoke: %s", Abbreviated(checkpoint_state))
 
         # --- Resume graph ---
         app = build_workflow(entry_point="rewrite_scene")
         config = {"configurable": {"thread_id": thread_id}}
         updated_state = app.invoke(checkpoint_state, config=config)
 
-        print("DEBUG: updated_state after workflow:", updated_state)
+        logger.debug("updated_state after workflow: %s", Abbreviated(updated_state))
 
         if isinstance(updated_state, dict) and updated_state.get("error"):
             return Response({
@@ -1325,25 +1719,26 @@ def EditScene(request):
         scene_updated = False
         scene_to_edit = None
 
+        changed_scenes = []
+
         for updated_scene in updated_scenes:
             scene_number_db = updated_scene.get('scene_number')
-            try:
-                db_scene = models.Scene.objects.get(project=project, scene_number=scene_number_db)
-                new_story = updated_scene.get('story')
-                new_script = updated_scene.get('script') or new_story
-                new_context = updated_scene.get('story_context') or new_story or new_script
-                scene_title = updated_scene.get('title', db_scene.title)
-
-                db_scene.script = new_script or db_scene.script
-                db_scene.story_context = new_context or db_scene.story_context
-                db_scene.title = scene_title or db_scene.title
-                db_scene.save()
-
-                if scene_number_db == scene_number:
-                    scene_to_edit = db_scene
-                    scene_updated = True
-            except models.Scene.DoesNotExist:
+            db_scene = db_scenes.get(scene_number_db)
+            if db_scene is None:
                 continue
+            new_story = updated_scene.get('story')
+            new_script = updated_scene.get('script') or new_story
+            new_context = updated_scene.get('story_context') or new_story or new_script
+            scene_title = updated_scene.get('title', db_scene.title)
+
+            db_scene.script = new_script or db_scene.script
+            db_scene.story_context = new_context or db_scene.story_context
+            db_scene.title = scene_title or db_scene.title
+            changed_scenes.append(db_scene)
+
+            if scene_number_db == scene_number:
+                scene_to_edit = db_scene
+                scene_updated = True
 
         if not scene_updated or scene_to_edit is None:
             return Response({
@@ -1354,7 +1749,9 @@ def EditScene(request):
 
         base_title = project.title.split(' - Scene')[0]
         project.title = f"{base_title} - Scene {scene_number} Updated"
-        project.save()
+        with span("db.save"), transaction.atomic():
+            models.Scene.objects.bulk_update(changed_scenes, ['script', 'story_context', 'title'])
+            project.save()
 
         project.refresh_from_db()
         scene_serializer = serializers.SceneSerializer(scene_to_edit)
@@ -1373,12 +1770,10 @@ def EditScene(request):
         })
 
     except Exception as e:
-        import traceback
-        print("Exception in EditScene:", traceback.format_exc())
+        logger.exception("Exception in EditScene")
         return Response({
             "status": "error",
             "message": f"Internal server error: {str(e)}",
-            "trace": traceback.format_exc(),
             "error_code": "internal_error"
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1392,7 +1787,6 @@ def EditAllScenes(request):
     Expects: { "project_id": "...", "edit_instructions": "..." }
     """
     try:
-        import pprint
         data = json.loads(request.body)
         project_id = data.get('project_id')
         edit_instructions = data.get('edit_instructions', '').strip()  
@@ -1403,6 +1797,15 @@ def EditAllScenes(request):
                 "message": "project_id and edit_instructions are required.",
                 "error_code": "missing_fields"
             }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Optional override for the windowed rewrite (defaults to on for large projects)
+            windowed = parse_flag(data, 'windowed') if 'windowed' in data else None
+        except ValueError as e:
+            return Response({
+                "status": "error",
+                "message": str(e),
+                "error_code": "invalid_flag"
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         # Get project
         try:
@@ -1415,7 +1818,8 @@ def EditAllScenes(request):
             }, status=status.HTTP_404_NOT_FOUND)
 
         # Check if project has scenes
-        if not project.scenes.exists():
+        db_scenes = scenes_by_number(project)
+        if not db_scenes:
             return Response({
                 "status": "error",
                 "message": "No scenes found in this project.",
@@ -1429,7 +1833,7 @@ def EditAllScenes(request):
         if checkpoint_wrapper is None:
             # Fallback: reconstruct state from DB
             existing_scenes = []
-            for scene in project.scenes.all().order_by('scene_number'):
+            for scene in db_scenes.values():
                 existing_scenes.append({
                     'scene_number': scene.scene_number,
                     'script': scene.script,
@@ -1449,7 +1853,11 @@ def EditAllScenes(request):
         else:
             checkpoint_state = checkpoint_wrapper.checkpoint
 
-        # --- Set up for editing all scenes ---
+        # --- Unwrap channel_values if present ---
+        if "channel_values" in checkpoint_state and "__root__" in checkpoint_state["channel_values"]:
+            checkpoint_state = checkpoint_state["channel_values"]["__root__"]
+
+        # --- Set up for editing all scenes (after the unwrap, or they'd be dropped) ---
         checkpoint_state["needs_rewrite"] = True
         checkpoint_state["rewrite_instructions"] = edit_instructions
         checkpoint_state["rewrite_decision"] = "edit"
@@ -1458,20 +1866,20 @@ def EditAllScenes(request):
         # Remove specific scene editing fields if they exist
         checkpoint_state.pop("scene_to_edit", None)
 
-        # --- Unwrap channel_values if present ---
-        if "channel_values" in checkpoint_state and "__root__" in checkpoint_state["channel_values"]:
-            checkpoint_state = checkpoint_state["channel_values"]["__root__"]
+        # Per-edit settings: nothing carries over from the edit that saved the checkpoint
+        checkpoint_state["unchanged_scenes"] = []
+        checkpoint_state.pop("windowed_rewrite", None)
+        if windowed is not None:
+            checkpoint_state["windowed_rewrite"] = windowed
 
-        print("checkpoint_state before workflow invoke (edit all scenes):")
-        pprint.pprint(checkpoint_state)
+        logger.debug("checkpoint_state before workflow invoke (edit all scenes): %s", Abbreviated(checkpoint_state))
 
         # --- Resume graph for all scenes ---
         app = build_workflow(entry_point="rewrite_scene")
         config = {"configurable": {"thread_id": thread_id}}
         updated_state = app.invoke(checkpoint_state, config=config)
 
-        print("DEBUG: updated_state after workflow (all scenes):")
-        pprint.pprint(updated_state)
+        logger.debug("updated_state after workflow (all scenes): %s", Abbreviated(updated_state))
 
         if isinstance(updated_state, dict) and updated_state.get("error"):
             return Response({
@@ -1496,47 +1904,41 @@ def EditAllScenes(request):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         updated_scenes = updated_state.get('scenes', [])
-        print(f"DEBUG: Found {len(updated_scenes)} scenes in updated_state")
+        logger.debug("Found %d scenes in updated_state", len(updated_scenes))
         
         # Check if scenes were actually modified by comparing content
         scenes_actually_changed = False
         scenes_updated_count = 0
-        updated_scene_data = []
+        changed_scenes = []
 
         # Update all scenes in the database
         for updated_scene in updated_scenes:
             scene_number_db = updated_scene.get('scene_number')
-            try:
-                db_scene = models.Scene.objects.get(project=project, scene_number=scene_number_db)
-                new_story = updated_scene.get('story')
-                new_script = updated_scene.get('script') or new_story
-                new_context = updated_scene.get('story_context') or new_story or new_script
-                scene_title = updated_scene.get('title', db_scene.title)
-
-                # Check if content actually changed
-                old_script = db_scene.script
-                if new_script and new_script != old_script:
-                    scenes_actually_changed = True
-                    # print(f"DEBUG: Scene {scene_number_db} content changed")
-                    # print(f"Old: {old_script[:100]}...")
-                    # print(f"New: {new_script[:100]}...")
-                    
-                    # Apply character placeholder enforcement and update
-                    db_scene.script = new_script
-                    db_scene.story_context = new_context or new_script
-                    db_scene.title = scene_title or db_scene.title
-                    db_scene.save()
-                    scenes_updated_count += 1
-                else:
-                    print(f"DEBUG: Scene {scene_number_db} content unchanged")
-                
-                # Serialize the scene for response (whether changed or not)
-                scene_serializer = serializers.SceneSerializer(db_scene)
-                updated_scene_data.append(scene_serializer.data)
-                
-            except models.Scene.DoesNotExist:
-                print(f"DEBUG: Scene {scene_number_db} not found in database")
+            db_scene = db_scenes.get(scene_number_db)
+            if db_scene is None:
+                logger.debug("Scene %s not found in database", scene_number_db)
                 continue
+            new_story = updated_scene.get('story')
+            new_script = updated_scene.get('script') or new_story
+            new_context = updated_scene.get('story_context') or new_story or new_script
+            scene_title = updated_scene.get('title', db_scene.title)
+
+            # Check if content actually changed
+            old_script = db_scene.script
+            if new_script and new_script != old_script:
+                scenes_actually_changed = True
+                # print(f"DEBUG: Scene {scene_number_db} content changed")
+                # print(f"Old: {old_script[:100]}...")
+                # print(f"New: {new_script[:100]}...")
+                
+                # Apply character placeholder enforcement and update
+                db_scene.script = new_script
+                db_scene.story_context = new_context or new_script
+                db_scene.title = scene_title or db_scene.title
+                changed_scenes.append(db_scene)
+                scenes_updated_count += 1
+            else:
+                logger.debug("Scene %s content unchanged", scene_number_db)
 
         # Check if any scenes were actually changed
         if not scenes_actually_changed:
@@ -1567,10 +1969,13 @@ def EditAllScenes(request):
         # Update project title to reflect the edit
         base_title = project.title.split(' - ')[0]  # Remove any existing suffixes
         project.title = f"{base_title} - All Scenes Updated"
-        project.save()
+        with span("db.save"), transaction.atomic():
+            models.Scene.objects.bulk_update(changed_scenes, ['script', 'story_context', 'title'])
+            project.save()
 
-        project.refresh_from_db()
-        project_serializer = serializers.ProjectSerializer(project)
+        fieldset = get_sparse_fieldset(data)
+        project = project_detail_queryset(fieldset).get(id=project.id)
+        project_serializer = serializers.ProjectSerializer(project, context={'request': request}, **fieldset)
         
         WorkflowCheckpoint.objects.filter(thread_id=thread_id).delete()
         
@@ -1580,7 +1985,8 @@ def EditAllScenes(request):
             "data": {
                 "project": project_serializer.data,
                 "scenes_updated_count": scenes_updated_count,
-                "total_scenes": project.scenes.count(),
+                "total_scenes": len(db_scenes),
+                "unchanged_scenes": updated_state.get("unchanged_scenes", []),
                 "edit_instructions_used": edit_instructions
             },
             "next_step": "review_script",
@@ -1594,12 +2000,10 @@ def EditAllScenes(request):
             "error_code": "invalid_json"
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        import traceback
-        print("Exception in EditAllScenes:", traceback.format_exc())
+        logger.exception("Exception in EditAllScenes")
         return Response({
             "status": "error",
             "message": f"Internal server error: {str(e)}",
-            "trace": traceback.format_exc(),
             "error_code": "internal_error"
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1608,10 +2012,19 @@ def EditAllScenes(request):
 @authentication_classes([JWTAuthentication])  
 @permission_classes([IsAuthenticated])
 def GetProjectStatus(request, project_id):
-    """Get current project status and next available actions"""
+    """
+    Get current project status and next available actions.
+    Accepts the same sparse fieldset and ?variant= query parameters as get_project_and_scenes.
+    """
     try:
-        project = models.Project.objects.get(id=project_id, user=request.user)
-        serializer = serializers.ProjectSerializer(project)
+        variant, error_response = get_image_variant(request)
+        if error_response:
+            return error_response
+        fieldset = get_sparse_fieldset(request.query_params)
+        project = project_detail_queryset(fieldset).get(id=project_id, user=request.user)
+        serializer = serializers.ProjectSerializer(
+            project, context={'request': request, 'image_variant': variant}, **fieldset
+        )
         
         current_step = 'completed' if 'Completed' in project.title else 'review_script'
         
@@ -1639,5 +2052,18 @@ def GetProjectStatus(request, project_id):
             {"error": f"Internal server error: {str(e)}"}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-        
-        
\ No newline at end of file
+
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus scrape endpoint: stage timings, request and SQL latency, LLM
+    cache and provider counters (see services/metrics.py).
+    """
+    # Fail closed: without a configured token the endpoint doesn't exist
+    if not METRICS_TOKEN:
+        return HttpResponse("Not Found\n", status=404, content_type="text/plain")
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")